@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# Launch audit records (lambdas/shared/audit.py).
+#
+# Runs warm login -> launch flows through the handlers against the in-memory AWS stand-ins and
+# a local fake platform, and compares the launch latency with auditing off and with a sink that
+# takes --sink-latency-ms per batch (standing in for an SQS call). The Lambda case runs against
+# a local stand-in for the Extensions API, so the audit extension is registered and writes its
+# batches after each response, as in Lambda: the table shows the latency the caller sees and
+# the time until the invocation is complete (what Lambda bills). The server case uses the
+# background flusher thread. Fails unless every launch is in the written batches exactly once.
+#
+#   python benchmarks/bench_audit.py [--launches 1000] [--batch 100] [--sink-latency-ms 30]
+import argparse
+import contextlib
+import gzip
+import http.server
+import json
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import bench_launch_flow
+from bench_launch_flow import LAMBDA_OUTPUT, LambdaContext, configure, launch_event, login_event, percentiles
+from fake_platform import FakePlatform, JwksServer
+
+
+class ExtensionsApi:
+    # The register and event/next calls of the Lambda Extensions API. An invocation is complete
+    # once the extension asks for the next event again.
+
+    def __init__(self):
+        self.invocations = queue.Queue()
+        self.waiting = threading.Event()
+        self.delivered = threading.Event()
+        api = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                self.send_response(200)
+                self.send_header('Lambda-Extension-Identifier', str(uuid.uuid4()))
+                self.send_header('Content-Length', '2')
+                self.end_headers()
+                self.wfile.write(b'{}')
+
+            def do_GET(self):
+                api.waiting.set()
+                request_id = api.invocations.get()
+                body = json.dumps({
+                    'eventType': 'INVOKE',
+                    'requestId': request_id,
+                    'deadlineMs': int((time.time() + 10) * 1000)
+                }).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                api.delivered.set()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.address = f"127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def invoke(self, request_id):
+        # Waits for the previous invocation to complete, then starts this one
+        self.waiting.wait()
+        self.waiting.clear()
+        self.invocations.put(request_id)
+
+        # In Lambda the API runs outside the function's process; let this one's thread finish
+        # handing over the event before the handler is timed
+        self.delivered.wait()
+        self.delivered.clear()
+
+
+class SlowSink:
+
+    def __init__(self, sink, latency):
+        self.name = sink.name
+        self.sink = sink
+        self.latency = latency
+
+    def send(self, data, count):
+        time.sleep(self.latency)
+        self.sink.send(data, count)
+
+
+def read_records(path):
+    if not os.path.exists(path):
+        return []
+    with gzip.open(path, 'rt') as f:
+        return [json.loads(line) for line in f]
+
+
+def run(label, platform, lti_validation, oidc_login, launches, api=None):
+    response_times = []
+    complete_times = []
+    request_ids = []
+
+    with contextlib.redirect_stdout(LAMBDA_OUTPUT):
+        for _ in range(launches):
+            login = oidc_login.lambda_handler(login_event(), LambdaContext())
+            form = platform.authorize(login['headers']['Location'], deployment_id=bench_launch_flow.DEPLOYMENT_ID)
+            context = LambdaContext()
+
+            if api is not None:
+                api.invoke(context.aws_request_id)
+
+            # The same short idle gap before every timed launch, so all runs start equally cold;
+            # with the extension it also lets its thread pick up the event first
+            time.sleep(0.002)
+
+            start = time.perf_counter()
+            response = lti_validation.lambda_handler(launch_event(form), context)
+            response_times.append(time.perf_counter() - start)
+
+            if api is not None:
+                api.waiting.wait()
+                complete_times.append(time.perf_counter() - start)
+
+            assert response['statusCode'] == 200, response
+            request_ids.append(context.aws_request_id)
+
+    r = percentiles(response_times)
+    line = f"{label:<34} response p50 {r['p50_ms']:6.2f} ms  p99 {r['p99_ms']:6.2f} ms"
+    if complete_times:
+        c = percentiles(complete_times)
+        line += f"   complete p50 {c['p50_ms']:6.2f} ms  p99 {c['p99_ms']:7.2f} ms"
+    print(line)
+
+    return request_ids
+
+
+def check_written(label, audit_log, path, request_ids):
+    records = read_records(path)
+    counts = {}
+    for record in records:
+        counts[record['request_id']] = counts.get(record['request_id'], 0) + 1
+
+    raw = sum(len(json.dumps(r, separators=(',', ':'))) + 1 for r in records)
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    complete = all(counts.get(r) == 1 for r in request_ids) and len(records) == len(request_ids)
+    fields = all(r['sub'] and r['roles'] and r['context_id'] and r['outcome'] == 'launched' for r in records)
+
+    print(f"  {'ok  ' if complete and fields else 'FAIL'} {label}: {len(records)} records in {audit_log.batches} batches, "
+          f"{raw / max(len(records), 1):.0f} bytes per record, {size / max(raw, 1):.0%} after gzip")
+    return complete and fields
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--launches', type=int, default=1000)
+    parser.add_argument('--batch', type=int, default=100)
+    parser.add_argument('--sink-latency-ms', type=float, default=30.0)
+    parser.add_argument('--ddb-latency-ms', type=float, default=0.0)
+    options = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    api = ExtensionsApi()
+
+    # The module registers its extension and builds its sink at import, as in a Lambda init
+    os.environ.update({
+        'AUDIT_SINK': 'file',
+        'AUDIT_FILE': os.path.join(directory, 'lambda.jsonl.gz'),
+        'AUDIT_BATCH_RECORDS': str(options.batch),
+        'AWS_LAMBDA_RUNTIME_API': api.address
+    })
+
+    platform = FakePlatform()
+    jwks = JwksServer(platform)
+    configure({
+        'log_level': 'INFO',
+        'state_mode': 'table',
+        'ddb_latency_ms': options.ddb_latency_ms,
+        'key_set_url': jwks.url
+    })
+
+    import audit
+    import lti_validation
+    import oidc_login
+
+    del os.environ['AWS_LAMBDA_RUNTIME_API']
+    extension_log = audit.log
+    assert extension_log.extension is not None, 'extension did not register'
+
+    print(f"{options.launches} launches, batches of {options.batch}, sink latency {options.sink_latency_ms:.0f} ms\n")
+
+    try:
+        audit.log = None
+        run('warm-up, audit off', platform, lti_validation, oidc_login, 200)
+        run('audit off', platform, lti_validation, oidc_login, options.launches)
+
+        audit.log = extension_log
+        extension_log.sink = SlowSink(extension_log.sink, options.sink_latency_ms / 1000.0)
+        lambda_ids = run('Lambda, audit extension', platform, lti_validation, oidc_login, options.launches, api)
+        # What a SIGTERM at shutdown writes
+        extension_log.flush()
+
+        server_path = os.path.join(directory, 'server.jsonl.gz')
+        audit.log = audit.AuditLog(SlowSink(audit.FileSink(server_path), options.sink_latency_ms / 1000.0), batch_records=options.batch)
+        server_ids = run('server, flusher thread', platform, lti_validation, oidc_login, options.launches)
+        audit.log.flush()
+
+        print('\nwritten')
+        ok = check_written('Lambda', extension_log, os.environ['AUDIT_FILE'], lambda_ids)
+        ok &= check_written('server', audit.log, server_path, server_ids)
+    finally:
+        jwks.close()
+
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
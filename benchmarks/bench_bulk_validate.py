@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# Offline bulk validation (tools/bulk_validate.py) of a synthetic launch capture.
+#
+# Mints id_tokens from two local fake platforms (one of them signing with two keys), writes
+# captures of increasing size that mix valid tokens with tampered, expired, wrong-audience,
+# unknown-kid, unknown-deployment and unreadable lines, and runs the CLI on each with
+# --workers 1 and with --workers N. Reports tokens per second and the peak memory of the run,
+# and fails unless every line gets the expected result exactly once and each platform's key set
+# was fetched once per run.
+#
+#   python benchmarks/bench_bulk_validate.py [--lines 20000] [--workers 4] [--distinct 400]
+import argparse
+import base64
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+
+from fake_platform import CLIENT_ID, DEPLOYMENT_ID, FakePlatform, JwksServer
+
+TOOL = os.path.join(ROOT, 'tools', 'bulk_validate.py')
+
+
+def tamper(token):
+    # Same signature over claims with another sub
+    header, payload, signature = token.split('.')
+    claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+    claims['sub'] = 'someone-else'
+    payload = base64.urlsafe_b64encode(json.dumps(claims).encode('utf-8')).rstrip(b'=').decode('ascii')
+    return f"{header}.{payload}.{signature}"
+
+
+def corpus(platforms, distinct):
+    # (token line, expected error or None); a few hundred signed tokens, repeated to size
+    first, second, rotated = platforms
+    now = int(time.time())
+    cases = []
+
+    for i in range(distinct):
+        platform = (first, second, rotated)[i % 3]
+        cases.append((json.dumps({'id_token': platform.mint_id_token(), 'ts': now}), None))
+
+    cases += [
+        (json.dumps({'id_token': tamper(first.mint_id_token())}), 'Invalid signature'),
+        (json.dumps({'id_token': first.mint_id_token(client_id='another-tool')}), 'Unknown deployment'),
+        (json.dumps({'id_token': second.mint_id_token(deployment_id='gone')}), 'Unknown deployment'),
+        (first.encoder.encode(dict(first.launch_claims(), exp=now - 10), first.signing_key, alg='RS256', optional_headers={'kid': first.kid}), 'JWT Expired'),
+        (FakePlatform(issuer=first.issuer, kid='retired-key').mint_id_token(), 'Invalid client_id'),
+        ('{"id_token": 42}', 'Malformed id_token'),
+        ('not a token', 'Malformed id_token'),
+    ]
+
+    return cases
+
+
+def write_capture(path, cases, lines):
+    expected = []
+    with open(path, 'w') as f:
+        for i in range(lines):
+            line, error = cases[i % len(cases)]
+            f.write(line + '\n')
+            expected.append(error)
+    return expected
+
+
+def run_tool(capture, config, output, workers):
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, TOOL, capture, '--config', config, '--output', output, '--workers', str(workers)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+    )
+    elapsed = time.perf_counter() - start
+    # Largest resident size of any process run so far, so it only grows if a run needs more
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    assert result.returncode == 0, result.stderr
+    return elapsed, peak, result.stderr
+
+
+def check(output, expected):
+    seen = [0] * len(expected)
+    wrong = 0
+
+    with open(output) as f:
+        for line in f:
+            result = json.loads(line)
+            index = result['line'] - 1
+            seen[index] += 1
+            wrong += result['error'] != expected[index]
+
+    return wrong == 0 and all(n == 1 for n in seen), wrong, sum(n != 1 for n in seen)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lines', type=int, default=20000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--distinct', type=int, default=400)
+    options = parser.parse_args()
+
+    first = FakePlatform()
+    second = FakePlatform(issuer='https://canvas.example.com', kid='canvas-key')
+    rotated = FakePlatform(kid='platform-key-2')
+
+    # The first platform publishes both of its keys in one set
+    first.jwks['keys'].append(rotated.jwks['keys'][0])
+    rotated.issuer = first.issuer
+
+    servers = [JwksServer(first), JwksServer(second)]
+    directory = tempfile.mkdtemp()
+    config = os.path.join(directory, 'lti.json')
+
+    with open(config, 'w') as f:
+        json.dump({'deployments': [
+            {'deployment_id': DEPLOYMENT_ID, 'client_id': CLIENT_ID, 'issuer': first.issuer, 'key_set_url': servers[0].url,
+             'auth_login_url': '', 'auth_token_url': '', 'default': True},
+            {'deployment_id': DEPLOYMENT_ID + '-canvas', 'client_id': CLIENT_ID, 'issuer': second.issuer, 'key_set_url': servers[1].url,
+             'auth_login_url': '', 'auth_token_url': '', 'default': False}
+        ]}, f)
+
+    second_mint = second.mint_id_token
+    second.mint_id_token = lambda **kwargs: second_mint(**dict({'deployment_id': DEPLOYMENT_ID + '-canvas'}, **kwargs))
+
+    cases = corpus((first, second, rotated), options.distinct)
+    ok = True
+
+    print(f"{'lines':>8} {'workers':>7} {'tokens/s':>9} {'peak RSS':>10}  result")
+    try:
+        for lines in (options.lines // 4, options.lines):
+            capture = os.path.join(directory, f'capture-{lines}.jsonl')
+            expected = write_capture(capture, cases, lines)
+
+            for workers in (1, options.workers):
+                output = os.path.join(directory, f'results-{lines}-{workers}.jsonl')
+                fetches = [s.requests for s in servers]
+                elapsed, peak, summary = run_tool(capture, config, output, workers)
+                fetched_once = all(s.requests - n == 1 for s, n in zip(servers, fetches))
+                correct, wrong, missing = check(output, expected)
+
+                status = 'ok' if correct and fetched_once else f'FAIL ({wrong} wrong, {missing} missing or repeated, fetched once: {fetched_once})'
+                print(f"{lines:>8} {workers:>7} {lines / elapsed:>9.0f} {peak / 1024:>7.1f} MB  {status}")
+                ok &= correct and fetched_once
+
+        print('\n' + summary)
+    finally:
+        for server in servers:
+            server.close()
+
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
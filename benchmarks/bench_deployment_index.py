@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# Deployment config lookups at multi-tenant scale: 10k deployments spread over a few
+# issuers, with some clients owning many deployments. Compares the per-deployment_id
+# path (GetItem behind the LRU config_cache) with the deployment_index, which loads
+# each issuer once through the issuer-client_id GSI and answers from memory, and
+# reports DynamoDB calls, the projected DynamoDB wait, lookup CPU and index memory.
+#
+#   python benchmarks/bench_deployment_index.py [--deployments 10000] [--lookups 50000]
+#                                               [--issuers 8] [--ddb-latency-ms 4]
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lambdas', 'shared'))
+
+import aws_clients
+import config_cache
+import ddb_codec
+import deployment_index
+import local_aws
+
+TABLE_NAME = 'ltiConfigTable'
+INDEX_NAME = 'issuer-client_id-index'
+
+
+def deployments(count, issuers):
+    # Most clients have one deployment; every 50th client is a district with dozens
+    items = []
+    client = 0
+    while len(items) < count:
+        issuer = f'https://lms{client % issuers}.example.edu'
+        client_id = f'client-{client:06d}'
+        for n in range(40 if client % 50 == 0 else 1):
+            items.append({
+                'deployment_id': f'{client_id}-deployment-{n}',
+                'client_id': client_id,
+                'issuer': issuer,
+                'auth_login_url': f'{issuer}/api/v1/gateway/oidcauth',
+                'auth_token_url': f'{issuer}/api/v1/gateway/oauth2/jwttoken',
+                'key_set_url': f'{issuer}/api/v1/management/applications/{client_id}/jwks.json',
+                'default': n == 0
+            })
+        client += 1
+    return items[:count]
+
+
+def run(label, lookup, keys, db, latency):
+    before = sum(db.calls.values())
+    start = time.perf_counter()
+    for key in keys:
+        assert lookup(*key) is not None
+    elapsed = time.perf_counter() - start
+    calls = sum(db.calls.values()) - before
+    print(f"{label:<36} {calls:7} DynamoDB calls {calls * latency:9.1f} s waiting  {elapsed / len(keys) * 1e6:7.2f} us/lookup CPU")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--deployments', type=int, default=10000)
+    parser.add_argument('--lookups', type=int, default=50000)
+    parser.add_argument('--issuers', type=int, default=8)
+    parser.add_argument('--ddb-latency-ms', type=float, default=4.0, help='used to project DynamoDB wait, not slept')
+    options = parser.parse_args()
+
+    rng = random.Random(1)
+    items = deployments(options.deployments, options.issuers)
+
+    db = local_aws.FakeDynamoDB()
+    for item in items:
+        db.seed(TABLE_NAME, item)
+    aws_clients.clients['dynamodb'] = db
+
+    keys = [(i['issuer'], i['client_id'], i['deployment_id']) for i in (rng.choice(items) for _ in range(options.lookups))]
+    latency = options.ddb_latency_ms / 1000.0
+
+    print(f"{len(items)} deployments, {options.issuers} issuers, {len(keys)} random lookups\n")
+
+    cache = config_cache.ConfigCache('deployments', report_every=0)
+
+    def by_id(issuer, client_id, deployment_id):
+        def load():
+            results = db.get_item(TableName=TABLE_NAME, Key={'deployment_id': {'S': deployment_id}})
+            return ddb_codec.deserialize(results['Item']) if 'Item' in results else None
+        return cache.get(deployment_id, load)
+
+    run(f'GetItem + config_cache ({cache.maxsize} LRU)', by_id, keys, db, latency)
+
+    index = deployment_index.DeploymentIndex(TABLE_NAME, INDEX_NAME, report_every=0)
+    run('deployment_index (loading issuers)', index.find, keys, db, latency)
+    run('deployment_index (warm)', index.find, keys, db, latency)
+    run('deployment_index, no deployment_id', lambda i, c, d: index.find(i, c), keys, db, latency)
+
+    print(f"\n{index.queries} Query pages to load {len(index.issuers)} issuers")
+    print(f"index lookups: {index.stats()}")
+    print(f"memory for all deployments: {traced(lambda wire: [dict(i) for i in wire], items) / 1e6:.1f} MB as item dicts, "
+          f"{traced(lambda wire: [deployment_index.compact(i) for i in wire], items) / 1e6:.1f} MB as index rows")
+
+
+def traced(build, items):
+    # Memory held by what build() keeps from freshly decoded items, as they'd arrive off the wire
+    tracemalloc.start()
+    wire = json.loads(json.dumps(items))
+    kept = build(wire)
+    del wire
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return size
+
+
+if __name__ == '__main__':
+    main()
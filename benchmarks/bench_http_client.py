@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# Latency of platform calls through the shared http_client, against a local HTTPS
+# JWKS stand-in: compares a fresh urllib3.PoolManager per fetch (the old behaviour)
+# with the pooled client. Connection reuse, revalidation, retries and redirects are
+# checked in tests/test_http_client.py.
+#
+#   python benchmarks/bench_http_client.py [fetches]
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lambdas', 'shared'))
+
+import urllib3
+
+import http_client
+from fake_platform import FakePlatform, JwksServer
+
+
+def main():
+    fetches = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    platform = FakePlatform()
+    server = JwksServer(platform, tls=True)
+    http_client.pool = http_client.new_pool(ca_certs=server.ca_file)
+
+    connections = server.connections
+    start = time.perf_counter()
+    for _ in range(fetches):
+        r = urllib3.PoolManager(ca_certs=server.ca_file).request('GET', server.url)
+        assert r.status == 200
+    fresh = (time.perf_counter() - start) / fetches
+    fresh_connections = server.connections - connections
+
+    connections = server.connections
+    start = time.perf_counter()
+    for _ in range(fetches):
+        assert http_client.request('GET', server.url, revalidate=True).status == 200
+    pooled = (time.perf_counter() - start) / fetches
+    pooled_connections = server.connections - connections
+
+    print(f"{fetches} JWKS fetches over HTTPS")
+    print(f"PoolManager per fetch: {fresh * 1e3:8.3f} ms/fetch {fresh_connections:5} connections")
+    print(f"shared http_client:    {pooled * 1e3:8.3f} ms/fetch {pooled_connections:5} connections")
+    print(f"saved per fetch:       {(fresh - pooled) * 1e3:8.3f} ms ({fresh / pooled:.1f}x)")
+
+    server.close()
+
+
+if __name__ == '__main__':
+    main()
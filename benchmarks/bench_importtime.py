@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# Import-time profile of the lambda handler modules, i.e. the part of a cold start
+# the handlers control. Runs `python -X importtime -c "import <handler>"` in a fresh
+# interpreter per handler, reports the total and the heaviest imports, and saves
+# the profile as JSON. With --baseline, exits non-zero when a handler's import time
+# regresses by more than --tolerance, so cold-start regressions get caught.
+#
+#   python benchmarks/bench_importtime.py [--runs 5] [--top 15] [--output importtime.json]
+#                                         [--baseline previous.json] [--tolerance 0.25]
+import argparse
+import datetime
+import json
+import os
+import re
+import subprocess
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+
+HANDLERS = {
+    'oidc_login': ['lambdas/shared', 'lambdas/oidc_login'],
+    'lti_validation': ['lambdas/shared', 'lambdas/lti_validation'],
+}
+
+LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def profile(module, paths):
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join(os.path.join(ROOT, p) for p in paths),
+        PYTHONDONTWRITEBYTECODE='1',
+        TABLE_NAME='ltiConfigTable',
+        CACHE_NAME='ltiCacheTable',
+        LOG_LEVEL='INFO'
+    )
+    child = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        env=env, capture_output=True, text=True, check=True
+    )
+
+    imports = []
+    for line in child.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            imports.append({
+                'module': match.group(4),
+                'self_us': int(match.group(1)),
+                'cumulative_us': int(match.group(2)),
+                'depth': len(match.group(3)) // 2
+            })
+
+    total = next(i['cumulative_us'] for i in imports if i['module'] == module)
+    return total, imports
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5, help='interpreters per handler; the fastest run is kept')
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--output', help='results file (default: benchmarks/results/importtime-<time>.json)')
+    parser.add_argument('--baseline', help='previous results file to check against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative regression')
+    options = parser.parse_args()
+
+    results = {
+        'meta': {
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'python': sys.version.split()[0]
+        },
+        'handlers': {}
+    }
+
+    for module, paths in HANDLERS.items():
+        total, imports = min((profile(module, paths) for _ in range(options.runs)), key=lambda r: r[0])
+        top_level = sorted((i for i in imports if i['depth'] <= 1), key=lambda i: -i['cumulative_us'])
+
+        results['handlers'][module] = {
+            'total_ms': round(total / 1000, 2),
+            'modules_imported': len(imports),
+            'heaviest': top_level[:options.top]
+        }
+
+        print(f"\n== import {module}: {total / 1000:.1f} ms, {len(imports)} modules")
+        for i in top_level[:options.top]:
+            print(f"  {i['cumulative_us'] / 1000:8.2f} ms  {'  ' * i['depth']}{i['module']}")
+
+    output = options.output or os.path.join(
+        BENCH_DIR, 'results', f"importtime-{datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nresults written to {output}")
+
+    if options.baseline:
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+
+        regressed = False
+        for module, current in results['handlers'].items():
+            previous = baseline['handlers'].get(module)
+            if not previous:
+                continue
+            limit = previous['total_ms'] * (1 + options.tolerance)
+            status = 'ok'
+            if current['total_ms'] > limit:
+                status = 'REGRESSION'
+                regressed = True
+            print(f"  {module:<16} {previous['total_ms']:8.2f} -> {current['total_ms']:8.2f} ms (limit {limit:.2f}) {status}")
+
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# Cost of scanner / misconfigured-platform traffic. Drives the login and launch
+# handlers with junk requests (missing parameters, non-https and unknown issuers,
+# random deployment ids, garbage and oversized tokens, malformed and random state
+# values) and reports the time per rejected request and the backend calls the junk
+# caused: DynamoDB calls and JWKS fetches.
+#
+#   python benchmarks/bench_junk_traffic.py [--requests 20000] [--state-mode signed] [--known-issuers]
+import argparse
+import contextlib
+import os
+import random
+import string
+import time
+import uuid
+
+from bench_launch_flow import ISSUER, LAMBDA_OUTPUT, LambdaContext, configure, launch_event, login_event
+from fake_platform import FakePlatform, JwksServer
+
+
+def junk_logins(rng):
+    def missing():
+        event = login_event()
+        del event['queryStringParameters'][rng.choice(('iss', 'client_id', 'login_hint', 'target_link_uri'))]
+        return event
+
+    def plain_http():
+        event = login_event()
+        event['queryStringParameters']['iss'] = 'http://' + ''.join(rng.choice(string.ascii_lowercase) for _ in range(12))
+        return event
+
+    def unknown_issuer():
+        event = login_event()
+        event['queryStringParameters']['iss'] = f'https://{uuid.uuid4().hex[:10]}.example.com'
+        return event
+
+    def unknown_deployment():
+        event = login_event()
+        event['queryStringParameters']['lti_deployment_id'] = rng.choice(('1', 'admin', "' OR 1=1 --", '../../etc/passwd', 'x' * 64))
+        return event
+
+    def oversized():
+        event = login_event()
+        event['queryStringParameters']['login_hint'] = 'A' * 50000
+        return event
+
+    def no_query():
+        event = login_event()
+        event.pop('queryStringParameters')
+        return event
+
+    return [missing, plain_http, unknown_issuer, unknown_deployment, oversized, no_query]
+
+
+def junk_launches(rng, platform):
+    token = platform.mint_id_token()
+
+    return [
+        lambda: launch_event({'id_token': 'x' * rng.randint(10, 20000), 'state': str(uuid.uuid4())}),
+        lambda: launch_event({'id_token': '@@@.###.$$$', 'state': str(uuid.uuid4())}),
+        lambda: launch_event({'id_token': token, 'state': 'err'}),
+        lambda: launch_event({'state': str(uuid.uuid4())}),
+        lambda: launch_event({'id_token': token + 'A' * 70000, 'state': str(uuid.uuid4())}),
+        lambda: launch_event({'id_token': token, 'state': str(uuid.uuid4())}),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--state-mode', choices=('table', 'signed'), default='table')
+    parser.add_argument('--known-issuers', action='store_true', help='set KNOWN_ISSUERS to the fake platform')
+    options = parser.parse_args()
+
+    platform = FakePlatform(issuer=ISSUER)
+    jwks = JwksServer(platform)
+    db = configure({'log_level': 'INFO', 'state_mode': options.state_mode, 'ddb_latency_ms': 0, 'key_set_url': jwks.url})
+    if options.known_issuers:
+        os.environ['KNOWN_ISSUERS'] = ISSUER
+
+    import oidc_login
+    import lti_validation
+
+    rng = random.Random(1)
+    for name, handler, makers in (
+        ('login', oidc_login.lambda_handler, junk_logins(rng)),
+        ('launch', lti_validation.lambda_handler, junk_launches(rng, platform))
+    ):
+        events = [rng.choice(makers)() for _ in range(options.requests)]
+        db.calls.clear()
+        requests_before = jwks.requests
+        statuses = {}
+
+        with contextlib.redirect_stdout(LAMBDA_OUTPUT):
+            start = time.perf_counter()
+            for event in events:
+                status = handler(event, LambdaContext())['statusCode']
+                statuses[status] = statuses.get(status, 0) + 1
+            elapsed = time.perf_counter() - start
+
+        print(f"{name:<7} {len(events)} junk requests  {elapsed / len(events) * 1e6:8.1f} us/request  "
+              f"DynamoDB calls {dict(db.calls)}  JWKS fetches {jwks.requests - requests_before}  statuses {statuses}")
+
+    jwks.close()
+
+
+if __name__ == '__main__':
+    main()
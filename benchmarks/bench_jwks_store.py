@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# Platform JWKS fetches when launch containers scale out, with and without the shared JWKS
+# store. Several local platforms serve their key sets after a simulated latency; each simulated
+# cold container looks up every platform's key, as its first launches would. Then runs the
+# jwks_warmer handler twice (the second run should be all 304s), scales out again, rotates one
+# platform's key and checks that only the first container to see the new kid fetches it.
+#
+#   python benchmarks/bench_jwks_store.py [--platforms 5] [--containers 20] [--jwks-latency-ms 80]
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lambdas', 'jwks_warmer'))
+sys.path.insert(0, os.path.join(ROOT, 'lambdas', 'lti_validation'))
+sys.path.insert(0, os.path.join(ROOT, 'lambdas', 'shared'))
+
+os.environ.update({
+    'TABLE_NAME': 'ltiConfigTable',
+    'CACHE_NAME': 'ltiCacheTable',
+    'LOG_LEVEL': 'ERROR',
+    'JWKS_SHARED': 'true',
+    'WARM_FUNCTION_NAME': 'LTIValidationLambda',
+    'WARM_CONTAINERS': '1'
+})
+
+import aws_clients
+import http_client
+import local_aws
+import lti_util
+import lti_validation
+import jwks_warmer
+from bench_launch_flow import percentiles
+from fake_platform import FakePlatform, JwksServer
+
+logger = logging.getLogger()
+
+
+class FakeLambda:
+    # Invokes the launch handler in-process, as a fresh container
+
+    def __init__(self):
+        self.results = []
+
+    def invoke(self, FunctionName, InvocationType, Payload):
+        new_container()
+        self.results.append(lti_validation.lambda_handler(json.loads(Payload), None))
+        return {'StatusCode': 200}
+
+
+def new_container():
+    lti_util.jwks_cache.clear()
+    lti_util.verifying_keys.clear()
+    http_client.response_cache.clear()
+    http_client.pool = None
+
+
+def check(label, condition):
+    print(f"  {'ok  ' if condition else 'FAIL'} {label}")
+    return condition
+
+
+def scale_out(label, platforms, containers):
+    servers = [server for _, server in platforms]
+    before = sum(server.requests for server in servers)
+    latencies = []
+
+    for _ in range(containers):
+        new_container()
+        for platform, server in platforms:
+            start = time.perf_counter()
+            assert lti_util.lti_util(logger, 'client', server.url).get_verifying_key(platform.kid) is not None
+            latencies.append(time.perf_counter() - start)
+
+    fetches = sum(server.requests for server in servers) - before
+    p = percentiles(latencies)
+    print(f"{label:<34} {containers:4} containers {fetches:5} platform fetches  "
+          f"first key lookup p50 {p['p50_ms']:8.3f} ms  p99 {p['p99_ms']:8.3f} ms")
+    return fetches
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--platforms', type=int, default=5)
+    parser.add_argument('--containers', type=int, default=20)
+    parser.add_argument('--jwks-latency-ms', type=float, default=80.0)
+    parser.add_argument('--ddb-latency-ms', type=float, default=3.0)
+    options = parser.parse_args()
+
+    db = local_aws.FakeDynamoDB(latency=options.ddb_latency_ms / 1000.0)
+    functions = FakeLambda()
+    aws_clients.clients.update({'dynamodb': db, 'lambda': functions})
+
+    platforms = []
+    for n in range(options.platforms):
+        platform = FakePlatform(issuer=f'https://platform{n}.example.com')
+        server = JwksServer(platform, latency=options.jwks_latency_ms / 1000.0)
+        platforms.append((platform, server))
+        db.seed('ltiConfigTable', {
+            'deployment_id': f'deployment-{n}',
+            'client_id': 'client',
+            'issuer': platform.issuer,
+            'auth_login_url': f'{platform.issuer}/auth',
+            'auth_token_url': f'{platform.issuer}/token',
+            'key_set_url': server.url
+        })
+
+    print(f"{options.platforms} platforms, JWKS latency {options.jwks_latency_ms:.0f} ms, "
+          f"DynamoDB latency {options.ddb_latency_ms:.0f} ms\n")
+
+    ok = True
+
+    lti_util.JWKS_STORE_TABLE = None
+    per_container = scale_out('per-container cache only', platforms, options.containers)
+
+    lti_util.JWKS_STORE_TABLE = 'ltiCacheTable'
+    requests = sum(server.requests for _, server in platforms)
+    first = jwks_warmer.lambda_handler({}, None)
+    second = jwks_warmer.lambda_handler({}, None)
+    not_modified = sum(server.not_modified for _, server in platforms)
+    shared = scale_out('shared store, filled by the warmer', platforms, options.containers)
+
+    platform, server = platforms[0]
+    platform.rotate('platform-key-2')
+    rotated = scale_out('shared store, one key rotated', platforms, options.containers)
+
+    print('\nchecks')
+    ok &= check(f"warmer stored {first['changed']} key sets, then revalidated {not_modified} with 304",
+                first['changed'] == options.platforms and second['unchanged'] == options.platforms and not_modified == options.platforms)
+    ok &= check(f"warmer fetched each platform twice ({sum(s.requests for _, s in platforms) - requests - rotated - shared} requests)",
+                sum(s.requests for _, s in platforms) - requests - rotated - shared == 2 * options.platforms)
+    ok &= check(f"warm-up call loaded {functions.results[-1]['loaded']} key sets into a new container",
+                functions.results[-1] == {'warmed': True, 'loaded': options.platforms})
+    ok &= check(f"{shared} platform fetches on scale-out with the shared store (was {per_container})", shared == 0)
+    ok &= check(f"{rotated} platform fetch(es) after a rotation", rotated == 1)
+
+    for _, server in platforms:
+        server.close()
+
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
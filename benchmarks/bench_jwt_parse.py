@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# Benchmark for id_token parsing and verification over a corpus of real-sized
+# LTI launches (5-15 KB with custom claims). Compares the old two-pass path
+# (hand-decoding header and body, then jwt.JWT.decode parsing the whole token
+# again) with the single-pass lti_util path.
+#
+#   python benchmarks/bench_jwt_parse.py [corpus_size]
+import base64
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lambdas', 'lti_validation'))
+sys.path.insert(0, os.path.join(ROOT, 'lambdas', 'shared'))
+
+import jwt
+
+import lti_util
+from fake_platform import FakePlatform
+
+JWKS_URL = 'https://platform.example.com/jwks.json'
+
+# The jwt library backend, so both paths check the signature with the same code
+JWT_VERIFIER = lti_util.JwtVerifier()
+
+
+def legacy_decode_part(part):
+    # The former decode_jwt_parts without its logging: exception-driven padding guess
+    s = str(part).strip()
+    try:
+        return base64.urlsafe_b64decode(s).decode('utf-8')
+    except Exception:
+        return base64.urlsafe_b64decode(s + '=' * (-len(s) % 4)).decode('utf-8')
+
+
+def legacy_path(id_token, verifying_key, instance):
+    parts = id_token.split('.')
+    header = json.loads(legacy_decode_part(parts[0]))
+    body = json.loads(legacy_decode_part(parts[1]))
+    assert header['kid'] and body['aud']
+    return instance.decode(id_token, verifying_key, do_time_check=True)
+
+
+def single_pass(id_token, verifying_key):
+    header, claims, signing_input, signature = lti_util.parse_jwt(id_token)
+    assert JWT_VERIFIER.verify(header['alg'], signing_input, signature, verifying_key)
+    assert lti_util.check_time_claims(claims) is None
+    return claims
+
+
+def run(label, fn, corpus):
+    total_bytes = sum(len(t) for t in corpus)
+    start = time.perf_counter()
+    for token in corpus:
+        fn(token)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed / len(corpus) * 1e6:9.1f} us/token {total_bytes / elapsed / 1e6:8.1f} MB/s")
+    return elapsed
+
+
+def main():
+    corpus_size = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    platform = FakePlatform()
+    verifying_key = jwt.jwk_from_dict(platform.jwks['keys'][0])
+    instance = jwt.JWT()
+
+    sizes = [5000 + (10000 * i) // max(corpus_size - 1, 1) for i in range(corpus_size)]
+    templates = {size: platform.mint_id_token(size=size) for size in sorted(set(s // 1000 * 1000 for s in sizes))}
+    corpus = [templates[s // 1000 * 1000] for s in sizes]
+
+    print(f"corpus: {len(corpus)} tokens, {min(map(len, corpus))}-{max(map(len, corpus))} bytes")
+
+    for token in templates.values():
+        assert legacy_path(token, verifying_key, instance) == single_pass(token, verifying_key)
+
+    run('parse only (legacy)', lambda t: [json.loads(legacy_decode_part(p)) for p in t.split('.')[:2]], corpus)
+    run('parse only (single pass)', lti_util.parse_jwt, corpus)
+    legacy = run('parse + verify (legacy)', lambda t: legacy_path(t, verifying_key, instance), corpus)
+    single = run('parse + verify (single pass)', lambda t: single_pass(t, verifying_key), corpus)
+    print(f"saved per token: {(legacy - single) / len(corpus) * 1e6:.1f} us")
+
+    junk = ['x' * 20000, 'a.b', 'not a token at all', '@@@.###.$$$']
+    run('reject malformed', lti_util.parse_jwt, junk * (corpus_size // len(junk)))
+
+
+if __name__ == '__main__':
+    main()
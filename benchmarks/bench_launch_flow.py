@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+# End-to-end local benchmark for the OIDC login -> LTI launch flow.
+#
+# Drives oidc_login.lambda_handler and lti_validation.lambda_handler with API
+# Gateway v2 events, against the in-memory DynamoDB / Secrets Manager stand-ins
+# in local_aws.py and a local fake platform that serves a JWKS over HTTP and
+# mints signed id_tokens. Reports p50/p95/p99 latency, per-container throughput
+# and a per-stage breakdown for cold starts and warm invocations, and saves the
+# results as JSON so runs can be compared over time.
+#
+# Cold starts run each function in a fresh interpreter (one per function, as
+# Lambda would), so module imports and first-request cache misses are included.
+#
+#   python benchmarks/bench_launch_flow.py [--warm 500] [--cold 5] [--state-mode signed]
+#                                          [--ddb-latency-ms 4] [--jwks-latency-ms 40] [--prefetch]
+#                                          [--output results.json] [--compare previous.json]
+import argparse
+import base64
+import contextlib
+import datetime
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+import uuid
+from urllib import parse as urlparse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+
+for path in ('lambdas/shared', 'lambdas/oidc_login', 'lambdas/lti_validation'):
+    sys.path.insert(0, os.path.join(ROOT, path))
+
+import local_aws
+
+SECRET_ARN = 'arn:aws:secretsmanager:us-east-1:000000000000:secret:bench-state'
+SECRET = 'bench-state-secret-' + 'x' * 45
+ISSUER = 'https://blackboard.com'
+CLIENT_ID = 'bench-client-id'
+DEPLOYMENT_ID = 'bench-deployment-id'
+SOURCE_IP = '203.0.113.10'
+
+# Where the handlers' log records and request lines go during a run
+LAMBDA_OUTPUT = open(os.devnull, 'w')
+
+# (function, owner, attribute, label): callables wrapped to time each stage
+STAGES = (
+    ('login', 'oidc_login', 'get_config', 'login.get_config'),
+    ('login', 'oidc_login', 'cache_value', 'login.store_state'),
+    ('login', 'oidc_login', 'sign_state', 'login.store_state'),
+    ('launch', 'lti_validation', 'get_state_data', 'launch.state'),
+    ('launch', 'lti_validation', 'get_config', 'launch.get_config'),
+    ('launch', 'lti_util.lti_util', 'get_verifying_key', 'launch.jwks'),
+    ('launch', 'lti_util.lti_util', 'process_launch', 'launch.process_launch'),
+)
+
+
+class LambdaContext:
+    function_name = 'bench'
+    function_version = '$LATEST'
+    memory_limit_in_mb = 128
+
+    def __init__(self):
+        self.aws_request_id = str(uuid.uuid4())
+
+    def get_remaining_time_in_millis(self):
+        return 10000
+
+
+class StageTimer:
+
+    def __init__(self):
+        self.current = {}
+
+    def wrap(self, function):
+        for stage_function, owner_path, attribute, label in STAGES:
+            if stage_function != function:
+                continue
+            module_name, _, class_name = owner_path.partition('.')
+            owner = sys.modules[module_name]
+            if class_name:
+                owner = getattr(owner, class_name)
+            original = getattr(owner, attribute, None)
+            if original is not None:
+                setattr(owner, attribute, self.timed(original, label))
+
+    def timed(self, fn, label):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.current[label] = self.current.get(label, 0.0) + time.perf_counter() - start
+        return wrapper
+
+
+def request_context(method, path, ip):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return {
+        'accountId': '000000000000',
+        'apiId': 'bench',
+        'domainName': 'lti.example.com',
+        'http': {'method': method, 'path': path, 'protocol': 'HTTP/1.1', 'sourceIp': ip, 'userAgent': 'Mozilla/5.0'},
+        'requestId': str(uuid.uuid4()),
+        'routeKey': f'{method} {path}',
+        'stage': '$default',
+        'time': now.strftime('%d/%b/%Y:%H:%M:%S +0000'),
+        'timeEpoch': int(now.timestamp() * 1000)
+    }
+
+
+def login_event(ip=SOURCE_IP):
+    params = {
+        'iss': ISSUER,
+        'login_hint': str(uuid.uuid4()),
+        'target_link_uri': 'https://lti.example.com/launch',
+        'lti_message_hint': str(uuid.uuid4()),
+        'lti_deployment_id': DEPLOYMENT_ID,
+        'client_id': CLIENT_ID
+    }
+    return {
+        'version': '2.0',
+        'routeKey': 'GET /login',
+        'rawPath': '/login',
+        'rawQueryString': urlparse.urlencode(params),
+        'headers': {'host': 'lti.example.com', 'user-agent': 'Mozilla/5.0'},
+        'queryStringParameters': params,
+        'requestContext': request_context('GET', '/login', ip),
+        'isBase64Encoded': False
+    }
+
+
+def launch_event(form, ip=SOURCE_IP):
+    return {
+        'version': '2.0',
+        'routeKey': 'POST /launch',
+        'rawPath': '/launch',
+        'rawQueryString': '',
+        'headers': {'host': 'lti.example.com', 'content-type': 'application/x-www-form-urlencoded'},
+        'body': base64.b64encode(urlparse.urlencode(form).encode('ascii')).decode('ascii'),
+        'requestContext': request_context('POST', '/launch', ip),
+        'isBase64Encoded': True
+    }
+
+
+def config_item(key_set_url):
+    return {
+        'deployment_id': DEPLOYMENT_ID,
+        'client_id': CLIENT_ID,
+        'issuer': ISSUER,
+        'auth_login_url': 'https://platform.example.com/api/v1/gateway/oidcauth',
+        'auth_token_url': 'https://platform.example.com/api/v1/gateway/oauth2/jwttoken',
+        'key_set_url': key_set_url,
+        'default': True
+    }
+
+
+def configure(args):
+    os.environ.update({
+        'TABLE_NAME': 'ltiConfigTable',
+        'CONFIG_INDEX_NAME': 'issuer-client_id-index',
+        'CACHE_NAME': 'ltiCacheTable',
+        'LOG_LEVEL': args['log_level'],
+        'STATE_MODE': args['state_mode'],
+        'PREFETCH': 'true' if args.get('prefetch') else 'false',
+        # Every flow comes from one IP as fast as possible; admission control is measured in bench_login_flood.py
+        'LOGIN_RATE_PER_IP': '0',
+        'LOGIN_RATE_PER_DEPLOYMENT': '0',
+        'STATE_SECRET_ARN': SECRET_ARN,
+        'AWS_DEFAULT_REGION': 'us-east-1'
+    })
+
+    # Records and request lines are formatted and written like in Lambda, just not to the terminal
+    logging.getLogger().addHandler(logging.StreamHandler(LAMBDA_OUTPUT))
+
+    db = local_aws.FakeDynamoDB(latency=args['ddb_latency_ms'] / 1000.0)
+    local_aws.install(db, {SECRET_ARN: SECRET})
+    db.seed('ltiConfigTable', config_item(args['key_set_url']))
+    return db
+
+
+def percentiles(samples):
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def rank(p):
+        return ordered[min(len(ordered) - 1, max(0, int(round(p / 100.0 * len(ordered) + 0.5)) - 1))]
+
+    return {
+        'count': len(ordered),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3),
+        'p50_ms': round(rank(50) * 1000, 3),
+        'p95_ms': round(rank(95) * 1000, 3),
+        'p99_ms': round(rank(99) * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3)
+    }
+
+
+def summarize(runs):
+    stages = {}
+    for run in runs:
+        for label, seconds in run['stages'].items():
+            stages.setdefault(label, []).append(seconds)
+
+    handler_seconds = sum(run.get('login', 0.0) + run.get('launch', 0.0) for run in runs)
+
+    summary = {
+        'login': percentiles([run['login'] for run in runs if 'login' in run]),
+        'launch': percentiles([run['launch'] for run in runs if 'launch' in run]),
+        'errors': sum(1 for run in runs if not run['ok']),
+        'stages': {label: percentiles(samples) for label, samples in sorted(stages.items())}
+    }
+
+    if 'init' in runs[0]:
+        summary['init'] = {
+            function: percentiles([run['init'] for run in runs if run['function'] == function])
+            for function in ('login', 'launch')
+        }
+    else:
+        summary['flows_per_second'] = round(len(runs) / handler_seconds, 1) if handler_seconds else None
+
+    return summary
+
+
+def run_warm(args, platform):
+    configure(args)
+    timer = StageTimer()
+
+    import oidc_login
+    import lti_validation
+
+    timer.wrap('login')
+    timer.wrap('launch')
+
+    runs = []
+    for i in range(args['warmup'] + args['warm']):
+        timer.current = {}
+
+        with contextlib.redirect_stdout(LAMBDA_OUTPUT):
+            start = time.perf_counter()
+            login = oidc_login.lambda_handler(login_event(), LambdaContext())
+            login_seconds = time.perf_counter() - start
+
+            form = platform.authorize(login['headers']['Location'], deployment_id=DEPLOYMENT_ID)
+
+            start = time.perf_counter()
+            launch = lti_validation.lambda_handler(launch_event(form), LambdaContext())
+            launch_seconds = time.perf_counter() - start
+
+        if i >= args['warmup']:
+            runs.append({
+                'login': login_seconds,
+                'launch': launch_seconds,
+                'ok': login['statusCode'] == 302 and launch['statusCode'] == 200,
+                'stages': dict(timer.current)
+            })
+
+    return summarize(runs)
+
+
+def cold_child():
+    # Runs inside a fresh interpreter: imports one handler and serves its first request
+    spec = json.load(sys.stdin)
+    report = sys.stdout
+    sys.stdout = LAMBDA_OUTPUT
+    db = configure(spec['args'])
+    timer = StageTimer()
+
+    if spec['function'] == 'login':
+        start = time.perf_counter()
+        import oidc_login
+        init_seconds = time.perf_counter() - start
+        timer.wrap('login')
+
+        start = time.perf_counter()
+        response = oidc_login.lambda_handler(login_event(), LambdaContext())
+        result = {'login': time.perf_counter() - start, 'ok': response['statusCode'] == 302}
+    else:
+        if spec['state_item']:
+            db.seed('ltiCacheTable', spec['state_item'])
+
+        start = time.perf_counter()
+        import lti_validation
+        init_seconds = time.perf_counter() - start
+        timer.wrap('launch')
+
+        start = time.perf_counter()
+        response = lti_validation.lambda_handler(launch_event(spec['form']), LambdaContext())
+        result = {'launch': time.perf_counter() - start, 'ok': response['statusCode'] == 200}
+
+    result.update({'function': spec['function'], 'init': init_seconds, 'stages': timer.current})
+    json.dump(result, report)
+
+
+def cold_launch_spec(args, platform):
+    # The state a login would have left behind, prepared in the parent so the
+    # launch child doesn't have to import anything before its measured import
+    nonce = uuid.uuid4().hex
+    form = {'id_token': platform.mint_id_token(client_id=CLIENT_ID, deployment_id=DEPLOYMENT_ID, nonce=nonce)}
+    state_item = None
+
+    if args['state_mode'] == 'signed':
+        import signed_token
+        form['state'] = signed_token.sign(
+            {'d': DEPLOYMENT_ID, 'c': CLIENT_ID, 'i': ISSUER, 'n': nonce, 'ip': SOURCE_IP, 'exp': int(time.time()) + 600},
+            SECRET.encode('utf-8'),
+            'state'
+        )
+    else:
+        form['state'] = str(uuid.uuid4())
+        state_item = {
+            'key': form['state'],
+            'client_id': CLIENT_ID,
+            'lti_deployment_id': DEPLOYMENT_ID,
+            'iss': ISSUER,
+            'launch_id': nonce,
+            'lti_message_hint': str(uuid.uuid4()),
+            'ip': SOURCE_IP,
+            'expires_at': int(time.time()) + 600
+        }
+
+    return {'function': 'launch', 'args': args, 'form': form, 'state_item': state_item}
+
+
+def run_cold(args, platform):
+    runs = []
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='')
+
+    for _ in range(args['cold']):
+        for spec in ({'function': 'login', 'args': args}, cold_launch_spec(args, platform)):
+            child = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--cold-child'],
+                input=json.dumps(spec), capture_output=True, text=True, env=env, check=True
+            )
+            runs.append(json.loads(child.stdout))
+
+    return summarize(runs)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def print_summary(name, summary):
+    print(f"\n== {name}")
+    for label in ('init', 'login', 'launch'):
+        values = summary.get(label)
+        if not values:
+            continue
+        if label == 'init':
+            for function, stats in values.items():
+                print(f"  init {function:<8} p50 {stats['p50_ms']:9.2f} ms  p95 {stats['p95_ms']:9.2f} ms")
+            continue
+        print(f"  {label:<13} p50 {values['p50_ms']:9.2f} ms  p95 {values['p95_ms']:9.2f} ms  p99 {values['p99_ms']:9.2f} ms")
+    if summary.get('flows_per_second'):
+        print(f"  throughput    {summary['flows_per_second']} login+launch flows/s per container")
+    for label, stats in summary['stages'].items():
+        print(f"    {label:<24} p50 {stats['p50_ms']:9.3f} ms  p95 {stats['p95_ms']:9.3f} ms")
+    if summary['errors']:
+        print(f"  errors        {summary['errors']}")
+
+
+def compare(previous, current):
+    print(f"\n== compared with {previous['meta'].get('revision')} ({previous['meta'].get('timestamp')})")
+    for mode in ('cold', 'warm'):
+        for label in ('login', 'launch'):
+            old = previous.get(mode, {}).get(label)
+            new = current.get(mode, {}).get(label)
+            if not old or not new:
+                continue
+            deltas = '  '.join(
+                f"{p} {new[p + '_ms'] - old[p + '_ms']:+8.2f} ms" for p in ('p50', 'p95', 'p99')
+            )
+            print(f"  {mode:<5} {label:<7} {deltas}")
+
+
+def main():
+    if '--cold-child' in sys.argv:
+        cold_child()
+        return
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--warm', type=int, default=500, help='measured warm login+launch flows')
+    parser.add_argument('--warmup', type=int, default=20, help='unmeasured flows before the warm run')
+    parser.add_argument('--cold', type=int, default=5, help='cold starts per function')
+    parser.add_argument('--state-mode', choices=('table', 'signed'), default='table')
+    parser.add_argument('--log-level', default='INFO')
+    parser.add_argument('--ddb-latency-ms', type=float, default=0.0, help='simulated DynamoDB round trip')
+    parser.add_argument('--jwks-latency-ms', type=float, default=0.0, help='simulated JWKS endpoint latency')
+    parser.add_argument('--prefetch', action='store_true', help='run lti_validation with PREFETCH=true')
+    parser.add_argument('--output', help='results file (default: benchmarks/results/launch_flow-<time>.json)')
+    parser.add_argument('--compare', help='previous results file to diff against')
+    options = parser.parse_args()
+
+    from fake_platform import FakePlatform, JwksServer
+
+    platform = FakePlatform(issuer=ISSUER)
+    jwks = JwksServer(platform, latency=options.jwks_latency_ms / 1000.0)
+
+    args = {
+        'warm': options.warm,
+        'warmup': options.warmup,
+        'cold': options.cold,
+        'state_mode': options.state_mode,
+        'log_level': options.log_level,
+        'ddb_latency_ms': options.ddb_latency_ms,
+        'jwks_latency_ms': options.jwks_latency_ms,
+        'prefetch': options.prefetch,
+        'key_set_url': jwks.url
+    }
+
+    results = {
+        'meta': {
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'revision': git_revision(),
+            'python': sys.version.split()[0],
+            'args': args
+        }
+    }
+
+    if options.cold:
+        results['cold'] = run_cold(args, platform)
+        print_summary(f"cold start ({options.cold} per function)", results['cold'])
+
+    if options.warm:
+        results['warm'] = run_warm(args, platform)
+        results['warm']['jwks_requests'] = jwks.requests
+        print_summary(f"warm ({options.warm} flows)", results['warm'])
+
+    jwks.close()
+
+    output = options.output or os.path.join(
+        BENCH_DIR, 'results', f"launch_flow-{datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nresults written to {output}")
+
+    if options.compare:
+        with open(options.compare) as f:
+            compare(json.load(f), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# Cost of the handlers' log statements at LOG_LEVEL=INFO. Replays the debug/error
+# statements one login + launch used to make (f-strings with pformat of the event,
+# context, config and decoded token, all built before logger.debug ever checked the
+# level) against the same statements written with %-style arguments and the lazy
+# structured_log wrappers, plus the one JSON line per request that replaces them.
+#
+#   python benchmarks/bench_logging.py [iterations]
+import io
+import logging
+import os
+import sys
+import timeit
+from pprint import pformat
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lambdas', 'shared'))
+
+import structured_log
+from bench_launch_flow import launch_event, login_event
+from fake_platform import FakePlatform
+
+
+class Context:
+    aws_request_id = 'c6af9ac6-7b61-11e6-9a41-93e8deadbeef'
+    function_name = 'ltiValidation'
+    memory_limit_in_mb = 128
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+    logger = structured_log.configure('INFO')
+    logger.handlers = [logging.StreamHandler(io.StringIO())]
+
+    platform = FakePlatform()
+    claims = platform.launch_claims()
+    header = {'alg': 'RS256', 'kid': platform.kid, 'typ': 'JWT'}
+    id_token = platform.mint_id_token(size=8000)
+    state = 'state-' + 'x' * 40
+    login = login_event()
+    launch = launch_event({'id_token': id_token, 'state': state})
+    context = Context()
+    config = {'client_id': 'bench-client-id', 'iss': platform.issuer, 'key_set_url': 'https://platform.example.com/jwks.json'}
+    msg_map = {'id_token': id_token, 'state': state}
+
+    def eager():
+        logger.debug(f"OIDCLogin->lambda_handler: Event: " + pformat(login))
+        logger.debug(f"OIDCLogin->lambda_handler: Context: " + pformat(context))
+        logger.debug(f"OIDCLogin->get_config: config=" + pformat(config))
+        logger.debug(f"LTIValidation->lambda_handler: Event: " + pformat(launch))
+        logger.debug(f"LTIValidation->lambda_handler: Context: " + pformat(context))
+        logger.debug(str(msg_map))
+        logger.debug(f"LTIValidation->get_cache_data: Key: {state} Value: " + pformat(config))
+        logger.debug(f"LTIValidation->get_config: config=" + pformat(config))
+        logger.debug(f"LTIValidation->process_launch: jwt_header: " + pformat(header))
+        logger.debug(f"LTIValidation->process_launch: jwt_body: " + pformat(claims))
+        logger.debug(f"LTIValidation->process_launch: post_validation_data: {claims}")
+
+    def lazy():
+        for fn, event in (('oidc_login', login), ('lti_validation', launch)):
+            request_log = structured_log.RequestLog(fn).begin(event, context)
+            logger.debug("LTIValidation->lambda_handler: Event: %s", structured_log.Event(event))
+            logger.debug("LTIValidation->get_config: config=%s", structured_log.Pretty(config))
+            logger.debug("LTIValidation->lambda_handler: id_token=%s state=%s", structured_log.Redacted(id_token), structured_log.Redacted(state))
+            logger.debug("LTIValidation->get_cache_data: Key: %s Value: %s", structured_log.Redacted(state), structured_log.Pretty(config))
+            logger.debug("LTIValidation->process_launch: jwt_header: %s", structured_log.Pretty(header))
+            logger.debug("LTIValidation->process_launch: jwt_body: %s", structured_log.Pretty(claims))
+            logger.debug("LTIValidation->process_launch: post_validation_data: %s", claims)
+            request_log.add(deployment_id='bench-deployment-id', outcome='launched')
+            request_log.end({'statusCode': 200})
+
+    stdout = sys.stdout
+    sys.stdout = io.StringIO()
+    try:
+        eager_s = min(timeit.repeat(eager, number=iterations, repeat=3)) / iterations
+        lazy_s = min(timeit.repeat(lazy, number=iterations, repeat=3)) / iterations
+    finally:
+        sys.stdout = stdout
+
+    print(f"iterations per run:             {iterations}")
+    print(f"eager f-string + pformat:       {eager_s * 1e6:9.2f} us/login+launch")
+    print(f"lazy args + JSON request line:  {lazy_s * 1e6:9.2f} us/login+launch")
+    print(f"CPU saved per login+launch:     {(eager_s - lazy_s) * 1e6:9.2f} us ({eager_s / lazy_s:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# Load test for login admission control. Floods oidc_login.lambda_handler for a few
+# seconds of wall time with (a) a bot rotating over a handful of source IPs and (b) a
+# runaway LMS retry loop hitting one deployment from many IPs, spread round-robin over
+# several simulated containers (each with its own in-memory limiter, all sharing the
+# in-memory DynamoDB). Reports requests, 429s and DynamoDB writes per second with
+# admission control off, on per container, and on with shared counters, against the
+# configured limits.
+#
+#   python benchmarks/bench_login_flood.py [--seconds 3] [--containers 4]
+import argparse
+import contextlib
+import itertools
+import time
+
+from bench_launch_flow import LAMBDA_OUTPUT, LambdaContext, configure, login_event
+
+RATE_PER_IP = 20
+BURST_PER_IP = 40
+RATE_PER_DEPLOYMENT = 200
+BURST_PER_DEPLOYMENT = 400
+
+
+def flood(oidc_login, rate_limit, db, limiters, events, seconds):
+    db.calls.clear()
+    requests = throttled = 0
+    containers = itertools.cycle(limiters)
+    deadline = time.perf_counter() + seconds
+
+    with contextlib.redirect_stdout(LAMBDA_OUTPUT):
+        start = time.perf_counter()
+        for event in itertools.cycle(events):
+            if time.perf_counter() >= deadline:
+                break
+            rate_limit.login = next(containers)
+            response = oidc_login.lambda_handler(event, LambdaContext())
+            requests += 1
+            if response['statusCode'] == 429:
+                throttled += 1
+                assert int(response['headers']['Retry-After']) >= 1
+        elapsed = time.perf_counter() - start
+
+    writes = db.calls.get('PutItem', 0)
+    counters = db.calls.get('UpdateItem', 0)
+    return requests / elapsed, throttled / requests, writes / elapsed, counters / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=float, default=3.0)
+    parser.add_argument('--containers', type=int, default=4)
+    options = parser.parse_args()
+
+    db = configure({'log_level': 'INFO', 'state_mode': 'table', 'ddb_latency_ms': 0, 'key_set_url': 'https://platform.example.com/jwks.json'})
+
+    import oidc_login
+    import rate_limit
+
+    bot = [login_event(ip=f'198.51.100.{i}') for i in range(5)]
+    runaway = [login_event(ip=f'10.{i // 250}.{i % 250}.1') for i in range(1000)]
+
+    print(f"limits: {RATE_PER_IP}/s (burst {BURST_PER_IP}) per IP, {RATE_PER_DEPLOYMENT}/s (burst {BURST_PER_DEPLOYMENT}) per deployment, "
+          f"{options.containers} containers, {options.seconds:.0f}s per run\n")
+    print(f"{'scenario':<26}{'admission control':<22}{'requests/s':>11}{'429s':>8}{'state writes/s':>16}{'counter writes/s':>18}")
+
+    for name, events, bound in (
+        ('bot, 5 IPs', bot, 5 * RATE_PER_IP),
+        ('runaway LMS, 1000 IPs', runaway, RATE_PER_DEPLOYMENT)
+    ):
+        for label, rates, shared in (
+            ('off', (0, 0), False),
+            ('per container', (RATE_PER_IP, RATE_PER_DEPLOYMENT), False),
+            ('shared counters', (RATE_PER_IP, RATE_PER_DEPLOYMENT), True)
+        ):
+            rate_limit.LOGIN_RATE_PER_IP, rate_limit.LOGIN_RATE_PER_DEPLOYMENT = rates
+            rate_limit.LOGIN_BURST_PER_IP, rate_limit.LOGIN_BURST_PER_DEPLOYMENT = BURST_PER_IP, BURST_PER_DEPLOYMENT
+            limiters = [rate_limit.LoginLimiter(shared=shared, table_name='ltiCacheTable') for _ in range(options.containers)]
+
+            rps, throttled, writes, counters = flood(oidc_login, rate_limit, db, limiters, events, options.seconds)
+            print(f"{name:<26}{label:<22}{rps:11.0f}{throttled:8.1%}{writes:16.0f}{counters:18.0f}")
+        print(f"{'':<26}sustained bound ~{bound}/s (plus bursts, per container without shared counters)\n")
+
+
+if __name__ == '__main__':
+    main()
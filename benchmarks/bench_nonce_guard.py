@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# Nonce replay protection (lambdas/shared/nonce_guard.py).
+#
+# Fills Bloom filters to capacity and probes them with nonces they never saw, comparing the
+# false positive rate with the configured one; checks that the windowed filter still holds every
+# nonce of the last window after rotating. Then runs signed-state login -> launch flows through
+# the handlers and checks that a replayed or mismatched id_token is refused, and finally launches
+# every id_token many times at once from a thread pool over several simulated containers (each
+# with its own filter, sharing one in-memory DynamoDB) and fails unless each launched exactly once.
+#
+#   python benchmarks/bench_nonce_guard.py [--flows 200] [--replays 8] [--containers 4] [--threads 32]
+#                                          [--ddb-latency-ms 4]
+import argparse
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import math
+import sys
+import time
+import uuid
+
+import bench_launch_flow
+from bench_launch_flow import LAMBDA_OUTPUT, LambdaContext, configure, launch_event, login_event
+from fake_platform import FakePlatform, JwksServer
+
+# (capacity, error rate, probes)
+FILTERS = (
+    (10000, 0.01, 200000),
+    (10000, 0.001, 200000),
+    (100000, 0.000001, 1000000),
+)
+
+
+def nonces(count):
+    return [uuid.uuid4().hex for _ in range(count)]
+
+
+def false_positives(nonce_guard):
+    ok = True
+    print(f"{'capacity':>9} {'target':>9} {'bits/nonce':>10} {'hashes':>6} {'observed':>10} {'add':>8} {'probe':>8}")
+
+    for capacity, error_rate, probes in FILTERS:
+        bloom = nonce_guard.BloomFilter(capacity, error_rate)
+        added, unseen = nonces(capacity), nonces(probes)
+
+        start = time.perf_counter()
+        for nonce in added:
+            bloom.add(bloom.positions(nonce))
+        add = (time.perf_counter() - start) / capacity
+
+        start = time.perf_counter()
+        hits = sum(bloom.contains(bloom.positions(nonce)) for nonce in unseen)
+        probe = (time.perf_counter() - start) / probes
+
+        observed = hits / probes
+        # Allow four standard deviations of sampling noise over the target
+        limit = error_rate + 4 * math.sqrt(error_rate / probes) + 1.0 / probes
+        ok &= observed <= limit
+
+        print(f"{capacity:>9} {error_rate:>9.0e} {bloom.bits / capacity:>10.1f} {bloom.hashes:>6} {observed:>10.2e} "
+              f"{add * 1e6:>5.1f} us {probe * 1e6:>5.1f} us{'' if observed <= limit else '  FAIL'}")
+
+    window = nonce_guard.WindowedFilter(window=3600, capacity=1000, error_rate=0.001)
+    added = nonces(2500)
+    for nonce in added:
+        window.add(nonce)
+    missed = sum(not window.seen(nonce) for nonce in added[-1000:])
+    print(f"\nwindowed filter after 2.5 windows: {missed} of the last window's 1000 nonces missing")
+    ok &= missed == 0
+
+    return ok
+
+
+def check(label, condition):
+    print(f"  {'ok  ' if condition else 'FAIL'} {label}")
+    return condition
+
+
+def handler_checks(platform, oidc_login, lti_validation):
+    def flow(**kwargs):
+        login = oidc_login.lambda_handler(login_event(), LambdaContext())
+        return platform.authorize(login['headers']['Location'], deployment_id=bench_launch_flow.DEPLOYMENT_ID, **kwargs)
+
+    def launch(form):
+        return lti_validation.lambda_handler(launch_event(form), LambdaContext())
+
+    with contextlib.redirect_stdout(LAMBDA_OUTPUT):
+        form = flow()
+        first, replay = launch(form), launch(form)
+        other = flow()
+        swapped = launch({'id_token': flow()['id_token'], 'state': other['state']})
+        wrong_nonce = launch({'id_token': platform.mint_id_token(nonce=uuid.uuid4().hex), 'state': flow()['state']})
+
+    print('\nhandler checks (signed state)')
+    ok = check('first launch accepted', first['statusCode'] == 200)
+    ok &= check('replayed launch refused', replay['statusCode'] == 401 and replay['body'] == 'Replayed id_token')
+    ok &= check("another login's state refused", swapped['statusCode'] == 401 and swapped['body'] == 'Invalid nonce')
+    ok &= check('nonce not from a login refused', wrong_nonce['statusCode'] == 401 and wrong_nonce['body'] == 'Invalid nonce')
+    return ok
+
+
+def concurrent_replays(platform, db, nonce_guard, lti_util, key_set_url, options):
+    guards = [nonce_guard.NonceGuard() for _ in range(options.containers)]
+    lti = lti_util.lti_util(logging.getLogger(), bench_launch_flow.CLIENT_ID, key_set_url)
+
+    tokens = []
+    for _ in range(options.flows):
+        nonce = uuid.uuid4().hex
+        tokens.append((nonce, platform.mint_id_token(client_id=bench_launch_flow.CLIENT_ID, nonce=nonce)))
+
+    # Every token is sent replays times, round robin over the containers, all at once
+    attempts = [(nonce, token, guards[i % options.containers]) for nonce, token in tokens for i in range(options.replays)]
+    puts_before = db.calls.get('PutItem', 0)
+
+    def attempt(job):
+        nonce, token, guard = job
+        return nonce, lti.process_launch(token, None, nonce, guard)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=options.threads) as pool:
+        results = list(pool.map(attempt, attempts))
+    elapsed = time.perf_counter() - start
+
+    launched = {}
+    other = 0
+    for nonce, response in results:
+        if response['statusCode'] == 200:
+            launched[nonce] = launched.get(nonce, 0) + 1
+        elif response['body'] != 'Replayed id_token':
+            other += 1
+
+    puts = db.calls.get('PutItem', 0) - puts_before
+    refused = len(attempts) - sum(launched.values())
+
+    print(f"\n{len(attempts)} launches of {len(tokens)} id_tokens ({options.replays} each) over {options.containers} containers, "
+          f"{options.threads} threads, {elapsed:.2f} s")
+    print(f"  {refused} refused as replays, {refused - (puts - len(tokens))} of them without a DynamoDB call; {puts} conditional writes")
+
+    ok = check('every id_token launched exactly once', len(launched) == len(tokens) and all(n == 1 for n in launched.values()))
+    ok &= check('no other errors', other == 0)
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--flows', type=int, default=200)
+    parser.add_argument('--replays', type=int, default=8)
+    parser.add_argument('--containers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--ddb-latency-ms', type=float, default=4.0)
+    options = parser.parse_args()
+
+    platform = FakePlatform()
+    jwks = JwksServer(platform)
+    db = configure({
+        'log_level': 'INFO',
+        'state_mode': 'signed',
+        'ddb_latency_ms': options.ddb_latency_ms,
+        'key_set_url': jwks.url
+    })
+
+    import lti_util
+    import lti_validation
+    import nonce_guard
+    import oidc_login
+
+    try:
+        print('false positives\n')
+        ok = false_positives(nonce_guard)
+        ok &= handler_checks(platform, oidc_login, lti_validation)
+        ok &= concurrent_replays(platform, db, nonce_guard, lti_util, jwks.url, options)
+    finally:
+        jwks.close()
+
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# Cold starts and latency of a class-start burst with login and launch deployed as two
+# functions (split) or as one routing function (router, lambdas/router.py).
+#
+# The handler costs are measured: first requests in fresh interpreters (module imports,
+# clients, config and JWKS misses included) and warm requests in-process, against the
+# in-memory AWS stand-ins and a local fake platform. The burst is then simulated with
+# Lambda's container model: a request goes to an idle container of its function, or starts
+# a new one. Students arrive over --window seconds and post the launch --redirect seconds
+# after their login. --sandbox-init-ms stands in for the runtime startup before the handler
+# module is imported, which can't be measured locally.
+#
+#   python benchmarks/bench_router.py [--students 300] [--window 20] [--cold 3]
+#                                     [--ddb-latency-ms 4] [--jwks-latency-ms 40]
+import argparse
+import contextlib
+import heapq
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, os.path.join(ROOT, 'lambdas'))
+
+import bench_launch_flow
+from bench_launch_flow import LAMBDA_OUTPUT, LambdaContext, cold_launch_spec, configure, launch_event, login_event, percentiles
+
+MODULES = {'split-login': 'oidc_login', 'split-launch': 'lti_validation', 'router': 'router'}
+
+
+def child():
+    # A fresh interpreter standing in for a new container: imports the function's module,
+    # then serves the requests in spec['sequence'] in order
+    spec = json.load(sys.stdin)
+    report = sys.stdout
+    sys.stdout = LAMBDA_OUTPUT
+    db = configure(spec['args'])
+
+    if spec['state_item']:
+        db.seed('ltiCacheTable', spec['state_item'])
+
+    start = time.perf_counter()
+    module = __import__(MODULES[spec['function']])
+    seconds = [time.perf_counter() - start]
+
+    for route in spec['sequence']:
+        event = login_event() if route == 'login' else launch_event(spec['form'])
+        start = time.perf_counter()
+        response = module.lambda_handler(event, LambdaContext())
+        seconds.append(time.perf_counter() - start)
+        assert response['statusCode'] == (302 if route == 'login' else 200), response
+
+    json.dump(seconds, report)
+
+
+def run_child(args, platform, function, sequence):
+    spec = cold_launch_spec(args, platform)
+    spec.update({'function': function, 'sequence': sequence})
+
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child'],
+        input=json.dumps(spec), capture_output=True, text=True, check=True,
+        env=dict(os.environ, PYTHONDONTWRITEBYTECODE='')
+    )
+    return json.loads(result.stdout)
+
+
+def measure(args, platform, repeat):
+    samples = {}
+
+    def add(name, value):
+        samples.setdefault(name, []).append(value)
+
+    for _ in range(repeat):
+        init, first = run_child(args, platform, 'split-login', ['login'])
+        add('split cold login', init + first)
+
+        init, first = run_child(args, platform, 'split-launch', ['launch'])
+        add('split cold launch', init + first)
+
+        init, first, other = run_child(args, platform, 'router', ['login', 'launch'])
+        add('router cold login', init + first)
+        add('router first launch', other)
+
+        init, first, other = run_child(args, platform, 'router', ['launch', 'login'])
+        add('router cold launch', init + first)
+        add('router first login', other)
+
+    costs = {name: statistics.median(values) for name, values in samples.items()}
+
+    # Warm requests, through the router (the dispatch is part of its cost)
+    configure(args)
+    import router
+
+    login_seconds = []
+    launch_seconds = []
+
+    for i in range(220):
+        with contextlib.redirect_stdout(LAMBDA_OUTPUT):
+            start = time.perf_counter()
+            login = router.lambda_handler(login_event(), LambdaContext())
+            login_time = time.perf_counter() - start
+
+            form = platform.authorize(login['headers']['Location'], deployment_id=bench_launch_flow.DEPLOYMENT_ID)
+
+            start = time.perf_counter()
+            router.lambda_handler(launch_event(form), LambdaContext())
+            launch_time = time.perf_counter() - start
+
+        if i >= 20:
+            login_seconds.append(login_time)
+            launch_seconds.append(launch_time)
+
+    costs['warm login'] = statistics.median(login_seconds)
+    costs['warm launch'] = statistics.median(launch_seconds)
+
+    return costs
+
+
+class Function:
+    # Lambda's scaling model: an idle container takes the request, otherwise a new one starts
+
+    def __init__(self, name):
+        self.name = name
+        self.containers = []
+
+    def serve(self, now, route, costs, sandbox, router):
+        idle = [c for c in self.containers if c['busy_until'] <= now]
+
+        if idle:
+            # Lambda tends to reuse the most recently used container
+            container = max(idle, key=lambda c: c['busy_until'])
+            if route in container['routes']:
+                cost = costs[f'warm {route}']
+            else:
+                cost = costs[f'router first {route}']
+            cold = False
+        else:
+            container = {'busy_until': now, 'routes': set()}
+            self.containers.append(container)
+            cost = sandbox + costs[f"{'router' if router else 'split'} cold {route}"]
+            cold = True
+
+        container['routes'].add(route)
+        container['busy_until'] = now + cost
+        return cost, cold
+
+
+def simulate(mode, costs, options):
+    rng = random.Random(options.seed)
+    sandbox = options.sandbox_init_ms / 1000.0
+
+    if mode == 'router':
+        router = Function('router')
+        functions = {'login': router, 'launch': router}
+    else:
+        functions = {'login': Function('login'), 'launch': Function('launch')}
+
+    # (time, sequence, student, route)
+    events = []
+    for student in range(options.students):
+        heapq.heappush(events, (rng.uniform(0, options.window), student, student, 'login'))
+
+    latencies = {'login': [], 'launch': [], 'flow': []}
+    login_latency = {}
+    cold = {'login': 0, 'launch': 0}
+    sequence = options.students
+
+    while events:
+        now, _, student, route = heapq.heappop(events)
+        cost, was_cold = functions[route].serve(now, route, costs, sandbox, mode == 'router')
+        latencies[route].append(cost)
+        cold[route] += was_cold
+
+        if route == 'login':
+            login_latency[student] = cost
+            redirect = rng.uniform(options.redirect * 0.5, options.redirect * 1.5)
+            sequence += 1
+            heapq.heappush(events, (now + cost + redirect, sequence, student, 'launch'))
+        else:
+            latencies['flow'].append(login_latency[student] + cost)
+
+    containers = sum(len(f.containers) for f in set(functions.values()))
+    return {'cold': cold, 'containers': containers, 'latency': {k: percentiles(v) for k, v in latencies.items()}}
+
+
+def main():
+    if '--child' in sys.argv:
+        child()
+        return
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--students', type=int, default=300)
+    parser.add_argument('--window', type=float, default=20.0, help='seconds over which the class logs in')
+    parser.add_argument('--redirect', type=float, default=1.0, help='mean seconds from login response to launch')
+    parser.add_argument('--cold', type=int, default=3, help='measured cold starts per case')
+    parser.add_argument('--sandbox-init-ms', type=float, default=150.0)
+    parser.add_argument('--ddb-latency-ms', type=float, default=4.0)
+    parser.add_argument('--jwks-latency-ms', type=float, default=40.0)
+    parser.add_argument('--seed', type=int, default=1)
+    options = parser.parse_args()
+
+    from fake_platform import FakePlatform, JwksServer
+
+    platform = FakePlatform()
+    server = JwksServer(platform, latency=options.jwks_latency_ms / 1000.0)
+    args = {
+        'log_level': 'INFO',
+        'state_mode': 'table',
+        'ddb_latency_ms': options.ddb_latency_ms,
+        'key_set_url': server.url
+    }
+
+    costs = measure(args, platform, options.cold)
+    server.close()
+
+    print('measured handler costs (median, ms)')
+    for name, seconds in costs.items():
+        print(f"  {name:<22} {seconds * 1000:9.2f}")
+
+    print(f"\n{options.students} students over {options.window:.0f} s, launch ~{options.redirect:.1f} s after login, "
+          f"sandbox init {options.sandbox_init_ms:.0f} ms\n")
+    print(f"{'mode':<8} {'containers':>10} {'cold logins':>12} {'cold launches':>14} "
+          f"{'launch p50':>11} {'launch p99':>11} {'flow p99':>10}")
+
+    for mode in ('split', 'router'):
+        result = simulate(mode, costs, options)
+        latency = result['latency']
+        print(f"{mode:<8} {result['containers']:>10} {result['cold']['login']:>12} {result['cold']['launch']:>14} "
+              f"{latency['launch']['p50_ms']:>8.1f} ms {latency['launch']['p99_ms']:>8.1f} ms {latency['flow']['p99_ms']:>7.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
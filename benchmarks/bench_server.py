@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# Throughput of the long-running server (lambdas/server/lti_server.py) against invoking the
+# Lambda handlers, for full login -> launch flows against the in-memory AWS stand-ins (with a
+# simulated DynamoDB round trip) and a local fake platform.
+#
+# The Lambda side calls the handlers in-process, one request at a time, as one container
+# serves them. The server side forks the server with --workers processes and drives it over
+# keep-alive HTTP from --clients processes of --connections threads each. Every server worker
+# has its own in-memory DynamoDB; a flow's login and launch share a connection, so they reach
+# the same worker and table state works.
+#
+#   python benchmarks/bench_server.py [--flows 2000] [--workers 4] [--clients 4] [--connections 16]
+#                                     [--ddb-latency-ms 4] [--state-mode signed]
+import argparse
+import contextlib
+import http.client
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from urllib import parse as urlparse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, os.path.join(ROOT, 'lambdas', 'server'))
+
+import bench_launch_flow
+from bench_launch_flow import LAMBDA_OUTPUT, LambdaContext, configure, launch_event, login_event, percentiles
+from fake_platform import FakePlatform, JwksServer
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def lambda_flows(platform, flows):
+    import oidc_login
+    import lti_validation
+
+    latencies = []
+    errors = 0
+
+    with contextlib.redirect_stdout(LAMBDA_OUTPUT):
+        start = time.perf_counter()
+        for _ in range(flows):
+            flow_start = time.perf_counter()
+            login = oidc_login.lambda_handler(login_event(), LambdaContext())
+            form = platform.authorize(login['headers']['Location'], deployment_id=bench_launch_flow.DEPLOYMENT_ID)
+            launch = lti_validation.lambda_handler(launch_event(form), LambdaContext())
+            latencies.append(time.perf_counter() - flow_start)
+            errors += launch['statusCode'] != 200
+        elapsed = time.perf_counter() - start
+
+    return elapsed, latencies, errors
+
+
+def client(port, platform, flows, connections, results):
+    # One load generator process: `connections` keep-alive connections, each running flows in turn
+    query = urlparse.urlencode({
+        'iss': bench_launch_flow.ISSUER,
+        'login_hint': 'student',
+        'lti_message_hint': 'launch',
+        'target_link_uri': 'https://lti.example.com/launch',
+        'lti_deployment_id': bench_launch_flow.DEPLOYMENT_ID,
+        'client_id': bench_launch_flow.CLIENT_ID
+    })
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def run(count):
+        conn = http.client.HTTPConnection('127.0.0.1', port)
+        mine = []
+        failed = 0
+
+        for _ in range(count):
+            start = time.perf_counter()
+            conn.request('GET', '/login?' + query)
+            r = conn.getresponse()
+            r.read()
+            form = platform.authorize(r.getheader('Location'), deployment_id=bench_launch_flow.DEPLOYMENT_ID)
+
+            conn.request('POST', '/launch', urlparse.urlencode(form), {'Content-Type': 'application/x-www-form-urlencoded'})
+            r = conn.getresponse()
+            r.read()
+            mine.append(time.perf_counter() - start)
+            failed += r.status != 200
+
+        conn.close()
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=run, args=(flows // connections,)) for _ in range(connections)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    results.put((latencies, errors[0]))
+
+
+def server_flows(port, platform, options):
+    results = multiprocessing.Queue()
+    per_client = options.flows // options.clients
+
+    processes = [
+        multiprocessing.Process(target=client, args=(port, platform, per_client, options.connections, results))
+        for _ in range(options.clients)
+    ]
+
+    start = time.perf_counter()
+    for p in processes:
+        p.start()
+    collected = [results.get() for _ in processes]
+    elapsed = time.perf_counter() - start
+    for p in processes:
+        p.join()
+
+    latencies = [l for c in collected for l in c[0]]
+    return elapsed, latencies, sum(c[1] for c in collected)
+
+
+def start_server(port, workers):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            sys.stdout = LAMBDA_OUTPUT
+            import lti_server
+            lti_server.main(port=port, workers=workers)
+        finally:
+            os._exit(0)
+
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port)
+            conn.request('GET', '/health')
+            if conn.getresponse().status == 200:
+                return pid
+        except OSError:
+            time.sleep(0.05)
+
+    raise RuntimeError('server did not start')
+
+
+def report(label, elapsed, latencies, errors):
+    p = percentiles(latencies)
+    print(f"{label:<40} {len(latencies) / elapsed:9.1f} flows/s   flow p50 {p['p50_ms']:7.2f} ms  "
+          f"p99 {p['p99_ms']:7.2f} ms   errors {errors}")
+    return len(latencies) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--flows', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--connections', type=int, default=16)
+    parser.add_argument('--ddb-latency-ms', type=float, default=4.0)
+    parser.add_argument('--state-mode', choices=('table', 'signed'), default='table')
+    options = parser.parse_args()
+
+    platform = FakePlatform()
+    jwks = JwksServer(platform)
+    configure({
+        'log_level': 'INFO',
+        'state_mode': options.state_mode,
+        'ddb_latency_ms': options.ddb_latency_ms,
+        'key_set_url': jwks.url
+    })
+
+    print(f"{options.flows} login+launch flows, {options.state_mode} state, DynamoDB latency {options.ddb_latency_ms:.0f} ms, "
+          f"{os.cpu_count()} cores\n")
+
+    lambda_flows(platform, 20)
+    per_container = report('Lambda handlers, one container', *lambda_flows(platform, options.flows // 4))
+
+    port = free_port()
+    pid = start_server(port, options.workers)
+    try:
+        server_flows(port, platform, argparse.Namespace(flows=options.clients * 20, clients=options.clients, connections=4))
+        total = report(f"server, {options.workers} workers, {options.clients * options.connections} connections",
+                       *server_flows(port, platform, options))
+    finally:
+        os.kill(pid, signal.SIGTERM)
+        os.waitpid(pid, 0)
+        jwks.close()
+
+    print(f"\none server process group does the work of {total / per_container:.1f} busy Lambda containers")
+
+
+if __name__ == '__main__':
+    main()
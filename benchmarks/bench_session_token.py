@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# Cost of authenticating a tool request with the launch's session token, against revalidating
+# the platform's id_token (parse, claim checks and RS256 signature, with the verifying key already
+# cached). Also checks that tampered, expired and other-purpose tokens are refused.
+#
+#   python benchmarks/bench_session_token.py [iterations]
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lambdas', 'lti_validation'))
+sys.path.insert(0, os.path.join(ROOT, 'lambdas', 'shared'))
+
+import lti_claims
+import lti_util
+import session_token
+import signed_token
+from fake_platform import FakePlatform
+
+KEY = b'bench-session-secret-' + b'x' * 43
+
+
+def check(label, condition):
+    print(f"  {'ok  ' if condition else 'FAIL'} {label}")
+    return condition
+
+
+def timed(label, fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed = (time.perf_counter() - start) / iterations
+    print(f"{label:<32} {elapsed * 1e6:9.1f} us")
+    return elapsed
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+    platform = FakePlatform()
+    id_token = platform.mint_id_token()
+    verifier = lti_util.get_verifier()
+    verifying_key = verifier.load_key(platform.jwks['keys'][0])
+
+    def revalidate():
+        header, claims, signing_input, signature = lti_util.parse_jwt(id_token)
+        assert lti_util.check_claims(claims) is None
+        assert verifier.verify(header['alg'], signing_input, signature, verifying_key)
+        return claims
+
+    claims = revalidate()
+    token, exp = session_token.mint(claims, KEY)
+    header = {'Authorization': f'Bearer {token}'}
+
+    print(f"id_token {len(id_token)} bytes, session token {len(token)} bytes\n")
+
+    full = timed('revalidate id_token', revalidate, iterations)
+    session = timed('verify session token', lambda: session_token.verify(session_token.bearer(header), KEY), iterations)
+    print(f"{'':<32} {full / session:9.1f}x faster")
+
+    session_claims = session_token.verify(token, KEY)
+    payload, mac = token.split('.')
+    forged = signed_token.b64url_encode(signed_token.b64url_decode(payload).replace(b'Learner', b'Instruc')) + '.' + mac
+    state = signed_token.sign({'d': 'x', 'exp': exp}, KEY, 'state')
+
+    print('\nchecks')
+    ok = True
+    ok &= check('claims carried over', session_claims['sub'] == claims['sub'] and session_claims['roles'] == claims[lti_claims.ROLES_CLAIM]
+                and session_claims['context_id'] == claims[lti_claims.CONTEXT_CLAIM]['id']
+                and session_claims['deployment_id'] == claims[lti_claims.DEPLOYMENT_ID_CLAIM])
+    ok &= check('tampered token refused', session_token.verify(forged, KEY) is None)
+    ok &= check('expired token refused', session_token.verify(token, KEY, now=exp) is None)
+    ok &= check('state token refused as a session', session_token.verify(state, KEY) is None)
+    ok &= check('wrong key refused', session_token.verify(token, b'another-key') is None)
+
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
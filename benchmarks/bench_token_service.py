@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# Access-token caching for LTI Advantage service calls, against a local fake
+# OAuth2 token endpoint (checks the client-credentials form and the signed client
+# assertion, answers after a simulated latency). Several simulated containers
+# (TokenService instances sharing the in-memory DynamoDB) with several threads each
+# ask for tokens at once; reports token endpoint calls and per-call latency, with
+# no caching, with per-container caching and with the shared, single-flight cache.
+#
+#   python benchmarks/bench_token_service.py [--containers 4] [--threads 8] [--calls 50]
+#                                            [--endpoint-latency-ms 80]
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import sys
+import threading
+import time
+from urllib import parse as urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lambdas', 'shared'))
+
+import jwt
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+import aws_clients
+import local_aws
+import token_service
+from bench_launch_flow import percentiles
+
+KEY_ARN = 'arn:aws:secretsmanager:us-east-1:000000000000:secret:tool-key'
+CLIENT_ID = 'bench-client-id'
+SCOPES = [
+    ['https://purl.imsglobal.org/spec/lti-nrps/scope/contextmembership.readonly'],
+    ['https://purl.imsglobal.org/spec/lti-ags/scope/lineitem', 'https://purl.imsglobal.org/spec/lti-ags/scope/score'],
+]
+
+
+class TokenEndpoint:
+
+    def __init__(self, public_key, latency):
+        self.requests = 0
+        verifier = jwt.JWT()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                server.requests += 1
+                form = dict(urlparse.parse_qsl(self.rfile.read(int(self.headers['Content-Length'])).decode('ascii')))
+                assert form['grant_type'] == 'client_credentials'
+                assert form['client_assertion_type'] == token_service.CLIENT_ASSERTION_TYPE
+                claims = verifier.decode(form['client_assertion'], public_key)
+                assert claims['iss'] == claims['sub'] == CLIENT_ID and claims['aud'] == server.url
+
+                time.sleep(latency)
+                body = json.dumps({
+                    'access_token': f"token-{server.requests}",
+                    'token_type': 'Bearer',
+                    'expires_in': 3600,
+                    'scope': form['scope']
+                }).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.httpd.server_port}/oauth2/token'
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class Uncached(token_service.TokenService):
+    # The naive client: a new token for every service call
+
+    def access_token(self, config, scopes):
+        key, scope = token_service.cache_key(config['iss'], config['client_id'], scopes)
+        return self.request_token(config, scope)[0]
+
+
+def run(label, services, config, options, endpoint):
+    endpoint.requests = 0
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(service, n):
+        mine = []
+        for i in range(options.calls):
+            start = time.perf_counter()
+            assert service.access_token(config, SCOPES[(n + i) % len(SCOPES)])
+            mine.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(mine)
+
+    threads = [
+        threading.Thread(target=worker, args=(service, n))
+        for service in services for n in range(options.threads)
+    ]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    p = percentiles(latencies)
+    print(f"{label:<28} {len(latencies):6} calls {endpoint.requests:6} token requests "
+          f"p50 {p['p50_ms']:8.3f} ms  p99 {p['p99_ms']:8.2f} ms  wall {elapsed:6.2f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--containers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--calls', type=int, default=50)
+    parser.add_argument('--endpoint-latency-ms', type=float, default=80.0)
+    parser.add_argument('--ddb-latency-ms', type=float, default=2.0)
+    options = parser.parse_args()
+
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048, backend=default_backend())
+    pem = private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    public_key = jwt.jwk_from_pem(private_key.public_key().public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo))
+
+    endpoint = TokenEndpoint(public_key, options.endpoint_latency_ms / 1000.0)
+    aws_clients.clients['secretsmanager'] = local_aws.FakeSecretsManager({KEY_ARN: json.dumps({'kid': 'tool-key-1', 'private_key': pem.decode('ascii')})})
+
+    config = {'iss': 'https://blackboard.com', 'client_id': CLIENT_ID, 'auth_token_url': endpoint.url}
+
+    print(f"{options.containers} containers x {options.threads} threads x {options.calls} calls, "
+          f"{len(SCOPES)} scope sets, token endpoint {options.endpoint_latency_ms:.0f} ms\n")
+
+    for label, make in (
+        ('no caching', lambda: Uncached(None, KEY_ARN, shared=False)),
+        ('per-container cache', lambda: token_service.TokenService(None, KEY_ARN, shared=False)),
+        ('shared single-flight cache', lambda: token_service.TokenService('ltiCacheTable', KEY_ARN))
+    ):
+        aws_clients.clients['dynamodb'] = local_aws.FakeDynamoDB(latency=options.ddb_latency_ms / 1000.0)
+        run(label, [make() for _ in range(options.containers)], config, options, endpoint)
+
+    endpoint.close()
+
+
+if __name__ == '__main__':
+    main()
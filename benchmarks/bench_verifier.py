@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# Signature verification backends in lti_util (JWT_VERIFIER): runs a conformance corpus of
+# valid and broken id_tokens through process_launch with each backend and fails unless every
+# backend gives the expected answer for every token, then reports verifications per second on
+# one core, key build time and whole process_launch time per backend.
+#
+#   python benchmarks/bench_verifier.py [iterations]
+import base64
+import json
+import logging
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lambdas', 'lti_validation'))
+sys.path.insert(0, os.path.join(ROOT, 'lambdas', 'shared'))
+
+import lti_util
+from fake_platform import CLIENT_ID, FakePlatform
+
+JWKS_URL = 'https://platform.example.com/jwks.json'
+
+logger = logging.getLogger()
+# The broken keys are logged as errors; only the results are of interest here
+logger.addHandler(logging.NullHandler())
+
+
+def b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def with_header(token, header):
+    return b64(json.dumps(header).encode('utf-8')) + token[token.index('.'):]
+
+
+def corpus(platform, impostor):
+    # (label, id_token, expected status, expected body or None for a JSON body)
+    now = int(time.time())
+
+    # Keys in the platform's set that cannot verify RS256
+    platform.jwks['keys'] += [
+        {'kty': 'EC', 'kid': 'ec-key', 'crv': 'P-256', 'x': b64(bytes(32)), 'y': b64(bytes(32))},
+        {'kty': 'RSA', 'kid': 'bad-modulus', 'n': 'not*base64', 'e': 'AQAB'},
+        {'kty': 'RSA', 'kid': 'no-exponent', 'n': platform.jwks['keys'][0]['n']}
+    ]
+
+    def encode(changes=(), removed=(), key=None, kid=None):
+        claims = platform.launch_claims()
+        claims.update(changes)
+        for name in removed:
+            claims.pop(name)
+        return platform.encoder.encode(claims, key or platform.signing_key, alg='RS256', optional_headers={'kid': kid or platform.kid})
+
+    valid = encode()
+    header, payload, signature = valid.split('.')
+    claims = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+    claims['sub'] = 'someone-else'
+
+    return [
+        ('valid', valid, 200, None),
+        ('valid, aud as a list', encode({'aud': [CLIENT_ID, 'other']}), 200, None),
+        ('signed by another key', encode(key=impostor.signing_key), 401, 'Invalid signature'),
+        ('claims changed after signing', f"{header}.{b64(json.dumps(claims).encode('utf-8'))}.{signature}", 401, 'Invalid signature'),
+        ('signature truncated', f"{header}.{payload}.{signature[:-8]}", 401, 'Invalid signature'),
+        ('signature of zeros', f"{header}.{payload}.{b64(bytes(256))}", 401, 'Invalid signature'),
+        ('alg HS256', with_header(valid, {'alg': 'HS256', 'kid': platform.kid}), 401, 'Unsupported signing algorithm'),
+        ('alg none', with_header(valid, {'alg': 'none', 'kid': platform.kid}), 401, 'Unsupported signing algorithm'),
+        ('alg PS256', with_header(valid, {'alg': 'PS256', 'kid': platform.kid}), 401, 'Unsupported signing algorithm'),
+        ('expired', encode({'exp': now - 1}), 401, 'JWT Expired'),
+        ('exp not a number', encode({'exp': str(now + 300)}), 401, 'Invalid Expired value'),
+        ('not yet valid', encode({'nbf': now + 300}), 401, 'JWT Not valid yet'),
+        ('issued in the future', encode({'iat': now + 600}), 401, 'JWT issued in the future'),
+        ('no iat', encode(removed=('iat',)), 401, 'Invalid iat'),
+        ('no nonce', encode(removed=('nonce',)), 401, 'Missing nonce'),
+        ('empty nonce', encode({'nonce': ''}), 401, 'Missing nonce'),
+        ('wrong audience', encode({'aud': 'another-tool'}), 401, 'Invalid client_id'),
+        ('unknown kid', encode(kid='unknown-key'), 401, 'Invalid client_id'),
+        ('kid of an EC key', encode(kid='ec-key'), 401, 'Invalid client_id'),
+        ('kid of a malformed key', encode(kid='bad-modulus'), 401, 'Invalid client_id'),
+        ('kid of a key without e', encode(kid='no-exponent'), 401, 'Invalid client_id'),
+        ('malformed', 'not.a-token', 401, 'Malformed id_token'),
+    ]
+
+
+def use(name, platform):
+    # A fresh container with this backend and the platform's key set already cached
+    lti_util.JWT_VERIFIER = name
+    lti_util.verifier = None
+    lti_util.verifying_keys.clear()
+    lti_util.jwks_cache[JWKS_URL] = {
+        'keys': {key['kid']: key for key in platform.jwks['keys']},
+        'expires': time.monotonic() + 3600,
+        'fetched': time.monotonic()
+    }
+    return lti_util.lti_util(logger, CLIENT_ID, JWKS_URL)
+
+
+def timed(fn, iterations, rounds=5):
+    # Best of several rounds, so a busy machine does not decide the comparison
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        elapsed = (time.perf_counter() - start) / iterations
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    platform = FakePlatform()
+    impostor = FakePlatform(kid=platform.kid)
+    cases = corpus(platform, impostor)
+    ok = True
+
+    print(f"conformance ({len(cases)} tokens)")
+    for name in lti_util.VERIFIERS:
+        lti = use(name, platform)
+        failures = []
+        for label, token, status, body in cases:
+            response = lti.process_launch(token)
+            if response['statusCode'] != status or (body is not None and response['body'] != body):
+                failures.append(f"{label}: {response['statusCode']} {response['body'][:60]}")
+        print(f"  {'ok  ' if not failures else 'FAIL'} {name}")
+        for failure in failures:
+            print(f"         {failure}")
+        ok &= not failures
+
+    token = cases[0][1]
+    header, claims, signing_input, signature = lti_util.parse_jwt(token)
+    jwk = platform.jwks['keys'][0]
+
+    print(f"\n{'backend':<14} {'verify/s/core':>14} {'verify':>10} {'key build':>10} {'process_launch':>15}")
+    for name in lti_util.VERIFIERS:
+        lti = use(name, platform)
+        verifier = lti_util.get_verifier()
+        key = verifier.load_key(jwk)
+
+        verify = timed(lambda: verifier.verify('RS256', signing_input, signature, key), iterations)
+        build = timed(lambda: verifier.load_key(jwk), max(iterations // 10, 1))
+        launch = timed(lambda: lti.process_launch(token), iterations)
+
+        print(f"{name:<14} {1 / verify:>14.0f} {verify * 1e6:>7.1f} us {build * 1e6:>7.1f} us {launch * 1e6:>12.1f} us")
+
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# Micro-benchmark for the per-launch cost of turning the platform's JWK into a
+# verifying key. Compares building a fresh jwt.JWT() and key object on every
+# launch (the old behaviour) against the lti_util verifying key cache.
+#
+#   python benchmarks/bench_verifying_key.py [iterations]
+import logging
+import os
+import sys
+import time
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lambdas', 'lti_validation'))
+sys.path.insert(0, os.path.join(ROOT, 'lambdas', 'shared'))
+
+import jwt
+from jwt.jwk import RSAJWK
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+import lti_util
+
+JWKS_URL = 'https://platform.example.com/jwks.json'
+KID = 'bench-key'
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048, backend=default_backend())
+    public_jwk = RSAJWK(private_key.public_key(), kid=KID).to_dict()
+
+    # Seed the JWKS cache directly so no HTTP is involved
+    lti_util.jwks_cache[JWKS_URL] = {
+        'keys': {KID: public_jwk},
+        'expires': time.monotonic() + 3600,
+        'fetched': time.monotonic()
+    }
+
+    util = lti_util.lti_util(logging.getLogger(), 'client', JWKS_URL)
+
+    def uncached():
+        jwt.JWT()
+        jwt.jwk_from_dict(util.get_public_key(KID))
+
+    def cached():
+        util.get_verifying_key(KID)
+
+    cached()
+
+    uncached_s = min(timeit.repeat(uncached, number=iterations, repeat=3)) / iterations
+    cached_s = min(timeit.repeat(cached, number=iterations, repeat=3)) / iterations
+
+    print(f"iterations per run:        {iterations}")
+    print(f"fresh JWT + jwk_from_dict: {uncached_s * 1e6:9.2f} us/launch")
+    print(f"cached verifying key:      {cached_s * 1e6:9.2f} us/launch")
+    print(f"CPU saved per launch:      {(uncached_s - cached_s) * 1e6:9.2f} us ({uncached_s / cached_s:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
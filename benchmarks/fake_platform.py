@@ -0,0 +1,243 @@
+# A stand-in LTI 1.3 platform for the benchmarks: owns an RSA signing key,
+# publishes it as a JWKS and mints id_tokens shaped like real LMS launches.
+import datetime
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import ipaddress
+import json
+import os
+import random
+import ssl
+import string
+import tempfile
+import threading
+import time
+from urllib import parse as urlparse
+import uuid
+
+import jwt
+from jwt.jwk import RSAJWK
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+
+ISSUER = 'https://blackboard.com'
+CLIENT_ID = 'bench-client-id'
+DEPLOYMENT_ID = 'bench-deployment-id'
+
+LTI = 'https://purl.imsglobal.org/spec/lti/claim/'
+
+
+class FakePlatform:
+
+    def __init__(self, issuer=ISSUER, kid='platform-key-1'):
+        self.issuer = issuer
+        self.kid = kid
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048, backend=default_backend())
+        self.signing_key = RSAJWK(self.private_key, kid=kid)
+        self.jwks = {'keys': [RSAJWK(self.private_key.public_key(), kid=kid).to_dict()]}
+        self.encoder = jwt.JWT()
+
+    def rotate(self, kid):
+        # Signs with a new key from now on, publishing it next to the old one
+        self.kid = kid
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048, backend=default_backend())
+        self.signing_key = RSAJWK(self.private_key, kid=kid)
+        self.jwks = {'keys': self.jwks['keys'] + [RSAJWK(self.private_key.public_key(), kid=kid).to_dict()]}
+
+    def launch_claims(self, client_id=CLIENT_ID, deployment_id=DEPLOYMENT_ID, nonce=None, custom=None):
+        now = int(time.time())
+        user_id = str(uuid.uuid4())
+        course_id = str(uuid.uuid4())
+
+        return {
+            'iss': self.issuer,
+            'aud': client_id,
+            'sub': user_id,
+            'exp': now + 300,
+            'iat': now,
+            'nonce': nonce or uuid.uuid4().hex,
+            'given_name': 'Ada',
+            'family_name': 'Lovelace',
+            'name': 'Ada Lovelace',
+            'email': 'ada.lovelace@example.edu',
+            'locale': 'en-US',
+            LTI + 'deployment_id': deployment_id,
+            LTI + 'message_type': 'LtiResourceLinkRequest',
+            LTI + 'version': '1.3.0',
+            LTI + 'target_link_uri': 'https://lti.example.com/launch',
+            LTI + 'resource_link': {'id': str(uuid.uuid4()), 'title': 'Week 3 Reading Quiz'},
+            LTI + 'roles': [
+                'http://purl.imsglobal.org/vocab/lis/v2/membership#Learner',
+                'http://purl.imsglobal.org/vocab/lis/v2/institution/person#Student'
+            ],
+            LTI + 'context': {
+                'id': course_id,
+                'label': 'HIST-101',
+                'title': 'Introduction to the History of Computing',
+                'type': ['http://purl.imsglobal.org/vocab/lis/v2/course#CourseOffering']
+            },
+            LTI + 'tool_platform': {
+                'guid': str(uuid.uuid4()),
+                'name': 'Example University',
+                'product_family_code': 'BlackboardLearn',
+                'version': '3900.0.0'
+            },
+            LTI + 'launch_presentation': {
+                'document_target': 'iframe',
+                'return_url': 'https://learn.example.edu/webapps/blackboard/execute/blti/launchReturn',
+                'locale': 'en-US'
+            },
+            LTI + 'lis': {
+                'person_sourcedid': 'ada.lovelace',
+                'course_offering_sourcedid': 'HIST-101-FA'
+            },
+            'https://purl.imsglobal.org/spec/lti-ags/claim/endpoint': {
+                'scope': [
+                    'https://purl.imsglobal.org/spec/lti-ags/scope/lineitem',
+                    'https://purl.imsglobal.org/spec/lti-ags/scope/score'
+                ],
+                'lineitems': f'https://learn.example.edu/learn/api/v1/lti/courses/{course_id}/lineItems'
+            },
+            'https://purl.imsglobal.org/spec/lti-nrps/claim/namesroleservice': {
+                'context_memberships_url': f'https://learn.example.edu/learn/api/v1/lti/courses/{course_id}/memberships',
+                'service_versions': ['2.0']
+            },
+            LTI + 'custom': custom or {}
+        }
+
+    def mint_id_token(self, size=None, **kwargs):
+        claims = self.launch_claims(**kwargs)
+
+        if size:
+            # Pad the custom claim so the encoded token lands close to the requested size
+            base = len(self.encoder.encode(claims, self.signing_key, alg='RS256'))
+            remaining = max(size - base, 0) * 3 // 4
+            rng = random.Random(size)
+            custom = claims[LTI + 'custom']
+            i = 0
+            while remaining > 0:
+                value = ''.join(rng.choice(string.ascii_letters + string.digits) for _ in range(min(remaining, 120)))
+                custom[f'custom_param_{i}'] = value
+                remaining -= len(value) + 24
+                i += 1
+
+        return self.encoder.encode(claims, self.signing_key, alg='RS256', optional_headers={'kid': self.kid})
+
+    def authorize(self, location, **kwargs):
+        # Plays the platform's OIDC authorization step: reads state and nonce from the
+        # tool's redirect and returns the form fields the browser would POST to /launch
+        params = dict(urlparse.parse_qsl(urlparse.urlsplit(location).query))
+        id_token = self.mint_id_token(client_id=params['client_id'], nonce=params['nonce'], **kwargs)
+        return {'id_token': id_token, 'state': params['state']}
+
+
+def self_signed_certificate(directory):
+    # A throwaway certificate for 127.0.0.1; returns (cert_file, key_file)
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048, backend=default_backend())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, '127.0.0.1')])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=5))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address('127.0.0.1'))]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256(), default_backend())
+    )
+
+    cert_file = os.path.join(directory, 'cert.pem')
+    key_file = os.path.join(directory, 'key.pem')
+    with open(cert_file, 'wb') as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_file, 'wb') as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL, serialization.NoEncryption()))
+    return cert_file, key_file
+
+
+class JwksServer:
+    # tls: serve HTTPS with a self-signed certificate (its file is self.ca_file)
+    # fail_first: answer the first N requests with a 503
+    # Counts requests, TCP connections, 304s and redirects so tests can check connection reuse,
+    # revalidation and redirect handling; moved_url answers with a 301 to url
+
+    def __init__(self, platform, latency=0.0, max_age=300, tls=False, fail_first=0):
+        self.requests = 0
+        self.connections = 0
+        self.not_modified = 0
+        self.redirects = 0
+        self.fail_first = fail_first
+        self.ca_file = None
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                server.connections += 1
+                super().setup()
+
+            def do_GET(self):
+                server.requests += 1
+                if self.path == '/moved.json':
+                    server.redirects += 1
+                    self.send_response(301)
+                    self.send_header('Location', '/jwks.json')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                # Read on every request, so adding a key to platform.jwks rotates the served set
+                body = json.dumps(platform.jwks).encode('utf-8')
+                etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+                if latency:
+                    time.sleep(latency)
+                if server.fail_first > 0:
+                    server.fail_first -= 1
+                    self.send_response(503)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                if self.headers.get('If-None-Match') == etag:
+                    server.not_modified += 1
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.send_header('Cache-Control', f'max-age={max_age}')
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('Cache-Control', f'max-age={max_age}')
+                self.send_header('ETag', etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+
+        scheme = 'http'
+        if tls:
+            self.tempdir = tempfile.TemporaryDirectory()
+            self.ca_file, key_file = self_signed_certificate(self.tempdir.name)
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(self.ca_file, key_file)
+            self.httpd.socket = context.wrap_socket(self.httpd.socket, server_side=True)
+            scheme = 'https'
+
+        self.url = f'{scheme}://127.0.0.1:{self.httpd.server_port}/jwks.json'
+        self.moved_url = f'{scheme}://127.0.0.1:{self.httpd.server_port}/moved.json'
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
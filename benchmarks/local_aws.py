@@ -0,0 +1,288 @@
+# In-memory stand-ins for the AWS services the lambdas use (DynamoDB, Secrets Manager
+# and S3), so the handlers can be driven locally without credentials or network.
+# Import with lambdas/shared on sys.path (for ddb_codec).
+# install() patches boto3 as soon as it is imported, without importing it itself,
+# so cold-start measurements still pay for the real boto3 import.
+import importlib.util
+import io
+import re
+import sys
+import threading
+import time
+
+import ddb_codec
+
+TABLE_KEYS = {
+    'ltiConfigTable': 'deployment_id',
+    'ltiCacheTable': 'key',
+}
+
+# (table, index): partition key of the secondary index
+INDEX_KEYS = {
+    ('ltiConfigTable', 'issuer-client_id-index'): 'issuer',
+}
+
+COMPARISONS = {
+    '=': lambda a, b: a == b,
+    '<>': lambda a, b: a != b,
+    '<': lambda a, b: a < b,
+    '<=': lambda a, b: a <= b,
+    '>': lambda a, b: a > b,
+    '>=': lambda a, b: a >= b,
+}
+
+TERM = re.compile(r'^(attribute_exists|attribute_not_exists)\((\S+)\)$|^(\S+)\s*(=|<>|<=|>=|<|>)\s*(\S+)$')
+
+
+def client_error(code, operation):
+    from botocore.exceptions import ClientError
+    return ClientError({'Error': {'Code': code, 'Message': code}}, operation)
+
+
+def evaluate(expression, item, names=None, values=None):
+    # Evaluates the flat AND/OR condition expressions the lambdas use (no parentheses)
+    names = names or {}
+    values = values or {}
+
+    def resolve(token):
+        if token.startswith(':'):
+            return values[token]
+        return item.get(names.get(token, token)) if item else None
+
+    def term(text):
+        match = TERM.match(text.strip())
+        if match is None:
+            raise ValueError(f'unsupported condition: {text}')
+        if match.group(1):
+            present = item is not None and names.get(match.group(2), match.group(2)) in item
+            return present if match.group(1) == 'attribute_exists' else not present
+        left, right = resolve(match.group(3)), resolve(match.group(5))
+        if left is None or right is None:
+            return False
+        return COMPARISONS[match.group(4)](left, right)
+
+    return any(all(term(t) for t in re.split(r'\s+AND\s+', clause)) for clause in re.split(r'\s+OR\s+', expression))
+
+
+class FakeDynamoDB:
+    # Stands in for the low-level boto3 DynamoDB client; items are stored typed, as DynamoDB does
+
+    def __init__(self, latency=0.0, page_size=1000):
+        self.latency = latency
+        self.page_size = page_size
+        self.tables = {name: {} for name in TABLE_KEYS}
+        self.calls = {}
+        self.unprocessed_batches = 0
+        self.lock = threading.Lock()
+
+    def call(self, operation):
+        with self.lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def seed(self, table, item):
+        self.tables[table][item[TABLE_KEYS[table]]] = ddb_codec.serialize(item)
+
+    def key_of(self, table, key):
+        return ddb_codec.deserialize_value(key[TABLE_KEYS[table]])
+
+    def check(self, operation, current, condition, names, values):
+        if condition and not evaluate(
+            condition,
+            ddb_codec.deserialize(current) if current is not None else None,
+            names,
+            ddb_codec.deserialize(values or {})
+        ):
+            raise client_error('ConditionalCheckFailedException', operation)
+
+    def get_item(self, TableName, Key, **kwargs):
+        self.call('GetItem')
+        with self.lock:
+            item = self.tables[TableName].get(self.key_of(TableName, Key))
+        return {'Item': dict(item)} if item is not None else {}
+
+    def query(self, TableName, IndexName, KeyConditionExpression, ExpressionAttributeNames=None, ExpressionAttributeValues=None, ExclusiveStartKey=None, Limit=None, **kwargs):
+        # Equality on the index partition key only, paged like DynamoDB (page_size items per page)
+        self.call('Query')
+        name, _, placeholder = (part.strip() for part in KeyConditionExpression.partition('='))
+        partition = INDEX_KEYS[(TableName, IndexName)]
+        if (ExpressionAttributeNames or {}).get(name, name) != partition:
+            raise ValueError(f'unsupported key condition: {KeyConditionExpression}')
+        value = ddb_codec.deserialize_value(ExpressionAttributeValues[placeholder])
+        with self.lock:
+            matches = [
+                (key, item) for key, item in sorted(self.tables[TableName].items())
+                if ddb_codec.deserialize_value(item[partition]) == value
+            ]
+        if ExclusiveStartKey is not None:
+            start = self.key_of(TableName, ExclusiveStartKey)
+            matches = [(key, item) for key, item in matches if key > start]
+        page = matches[:Limit or self.page_size]
+        results = {'Items': [dict(item) for _, item in page], 'Count': len(page)}
+        if len(page) < len(matches):
+            results['LastEvaluatedKey'] = {TABLE_KEYS[TableName]: page[-1][1][TABLE_KEYS[TableName]]}
+        return results
+
+    def scan(self, TableName, ExclusiveStartKey=None, Limit=None, **kwargs):
+        # Whole items (no projection), paged like query
+        self.call('Scan')
+        with self.lock:
+            matches = sorted(self.tables[TableName].items())
+        if ExclusiveStartKey is not None:
+            start = self.key_of(TableName, ExclusiveStartKey)
+            matches = [(key, item) for key, item in matches if key > start]
+        page = matches[:Limit or self.page_size]
+        results = {'Items': [dict(item) for _, item in page], 'Count': len(page)}
+        if len(page) < len(matches):
+            results['LastEvaluatedKey'] = {TABLE_KEYS[TableName]: page[-1][1][TABLE_KEYS[TableName]]}
+        return results
+
+    def update_item(self, TableName, Key, UpdateExpression, ConditionExpression=None, ExpressionAttributeNames=None, ExpressionAttributeValues=None, ReturnValues='NONE', **kwargs):
+        # Supports 'SET a = :v, b = if_not_exists(b, :w) ADD c :n' on top-level attributes
+        self.call('UpdateItem')
+        names = ExpressionAttributeNames or {}
+        values = ExpressionAttributeValues or {}
+        key = self.key_of(TableName, Key)
+        updated = {}
+
+        with self.lock:
+            current = self.tables[TableName].get(key)
+            self.check('UpdateItem', current, ConditionExpression, names, values)
+            item = dict(current or Key)
+
+            for action, body in re.findall(r'(SET|ADD)\s+(.*?)(?=\s+(?:SET|ADD)\s+|$)', UpdateExpression):
+                for assignment in re.split(r',(?![^()]*\))', body):
+                    if action == 'SET':
+                        name, value = (part.strip() for part in assignment.split('=', 1))
+                        attribute = names.get(name, name)
+                        default = re.match(r'if_not_exists\((\S+),\s*(\S+)\)$', value)
+                        if default:
+                            if attribute in item:
+                                continue
+                            value = default.group(2)
+                        item[attribute] = values[value]
+                    else:
+                        name, value = assignment.split()
+                        attribute = names.get(name, name)
+                        total = ddb_codec.deserialize_value(item[attribute]) if attribute in item else 0
+                        item[attribute] = ddb_codec.serialize_value(total + ddb_codec.deserialize_value(values[value]))
+                    updated[attribute] = item[attribute]
+
+            self.tables[TableName][key] = item
+
+        if ReturnValues == 'UPDATED_NEW':
+            return {'Attributes': updated}
+        if ReturnValues == 'ALL_NEW':
+            return {'Attributes': dict(item)}
+        return {}
+
+    def put_item(self, TableName, Item, ConditionExpression=None, ExpressionAttributeNames=None, ExpressionAttributeValues=None, **kwargs):
+        self.call('PutItem')
+        key = self.key_of(TableName, Item)
+        with self.lock:
+            self.check('PutItem', self.tables[TableName].get(key), ConditionExpression, ExpressionAttributeNames, ExpressionAttributeValues)
+            self.tables[TableName][key] = dict(Item)
+        return {}
+
+    def batch_write_item(self, RequestItems, **kwargs):
+        # Put and delete requests, applied unconditionally; unprocessed_batches makes the next N
+        # calls hand back their second half as UnprocessedItems, as a throttled table does
+        self.call('BatchWriteItem')
+        unprocessed = {}
+
+        for table, requests in RequestItems.items():
+            if len(requests) > 25:
+                raise client_error('ValidationException', 'BatchWriteItem')
+
+            if self.unprocessed_batches > 0 and len(requests) > 1:
+                self.unprocessed_batches -= 1
+                requests, unprocessed[table] = requests[:len(requests) // 2], requests[len(requests) // 2:]
+
+            with self.lock:
+                for request in requests:
+                    if 'PutRequest' in request:
+                        item = request['PutRequest']['Item']
+                        self.tables[table][self.key_of(table, item)] = dict(item)
+                    else:
+                        self.tables[table].pop(self.key_of(table, request['DeleteRequest']['Key']), None)
+
+        return {'UnprocessedItems': unprocessed}
+
+    def delete_item(self, TableName, Key, ConditionExpression=None, ExpressionAttributeNames=None, ExpressionAttributeValues=None, ReturnValues='NONE', **kwargs):
+        self.call('DeleteItem')
+        key = self.key_of(TableName, Key)
+        with self.lock:
+            current = self.tables[TableName].get(key)
+            self.check('DeleteItem', current, ConditionExpression, ExpressionAttributeNames, ExpressionAttributeValues)
+            self.tables[TableName].pop(key, None)
+        if ReturnValues == 'ALL_OLD' and current is not None:
+            return {'Attributes': current}
+        return {}
+
+
+class FakeSecretsManager:
+
+    def __init__(self, secrets):
+        self.secrets = secrets
+
+    def get_secret_value(self, SecretId):
+        return {'SecretString': self.secrets[SecretId]}
+
+
+class FakeS3:
+    # get_object over objects put with put(bucket, key, data)
+
+    def __init__(self):
+        self.objects = {}
+
+    def put(self, bucket, key, data):
+        self.objects[(bucket, key)] = data
+
+    def get_object(self, Bucket, Key, **kwargs):
+        if (Bucket, Key) not in self.objects:
+            raise client_error('NoSuchKey', 'GetObject')
+        return {'Body': io.BytesIO(self.objects[(Bucket, Key)])}
+
+
+class PatchOnImport:
+    # Meta path finder that patches boto3 right after its module body has run
+
+    def __init__(self, patch):
+        self.patch = patch
+
+    def find_spec(self, fullname, path=None, target=None):
+        if fullname != 'boto3':
+            return None
+
+        sys.meta_path.remove(self)
+        spec = importlib.util.find_spec(fullname)
+        real_exec = spec.loader.exec_module
+
+        def exec_module(module):
+            real_exec(module)
+            self.patch(module)
+
+        spec.loader.exec_module = exec_module
+        return spec
+
+
+def install(dynamodb, secrets=None, s3=None):
+    secretsmanager = FakeSecretsManager(secrets or {})
+
+    services = {'dynamodb': dynamodb, 'secretsmanager': secretsmanager, 's3': s3 or FakeS3()}
+
+    def patch(boto3):
+        real_client = boto3.client
+
+        def fake_client(service, *args, **kwargs):
+            if service in services:
+                return services[service]
+            return real_client(service, *args, **kwargs)
+
+        boto3.client = fake_client
+
+    if 'boto3' in sys.modules:
+        patch(sys.modules['boto3'])
+    else:
+        sys.meta_path.insert(0, PatchOnImport(patch))
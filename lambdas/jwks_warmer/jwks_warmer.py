@@ -0,0 +1,101 @@
+import aws_clients
+from concurrent.futures import ThreadPoolExecutor
+import ddb_codec
+import http_client
+import json
+import jwks_store
+import os
+import structured_log
+
+# Scheduled (EventBridge) refresh of the shared JWKS store. Every key_set_url in ltiConfigTable
+# is fetched, revalidating with the ETag stored from the last run, and written to ltiCacheTable
+# with jwks_store, so launch containers, cold ones included, read platform keys from there
+# instead of each fetching them when they scale out.
+#
+# Afterwards WARM_CONTAINERS concurrent warm-up calls are made to the launch function
+# (WARM_FUNCTION_NAME), which load the imports, clients and key sets into that many containers.
+
+TABLE_NAME = os.environ['TABLE_NAME']
+CACHE_NAME = os.environ['CACHE_NAME']
+WARM_FUNCTION_NAME = os.environ.get('WARM_FUNCTION_NAME')
+WARM_CONTAINERS = int(os.environ.get('WARM_CONTAINERS', '1'))
+WARM_DELAY_MS = int(os.environ.get('WARM_DELAY_MS', '100'))
+JWKS_WARM_WORKERS = int(os.environ.get('JWKS_WARM_WORKERS', '8'))
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+logger = structured_log.configure(LOG_LEVEL)
+
+def key_set_urls():
+    kwargs = {
+        'TableName': TABLE_NAME,
+        'ProjectionExpression': '#k',
+        'ExpressionAttributeNames': {'#k': 'key_set_url'}
+    }
+    urls = set()
+
+    while True:
+        results = aws_clients.client('dynamodb').scan(**kwargs)
+
+        for item in results.get('Items', []):
+            url = ddb_codec.deserialize(item).get('key_set_url')
+            if url:
+                urls.add(url)
+
+        if 'LastEvaluatedKey' not in results:
+            return sorted(urls)
+        kwargs['ExclusiveStartKey'] = results['LastEvaluatedKey']
+
+def refresh(url):
+    # Returns 'changed', 'unchanged' or 'failed'
+    try:
+        previous = jwks_store.load(CACHE_NAME, url)
+        headers = {'If-None-Match': previous['etag']} if previous and previous.get('etag') else None
+
+        r = http_client.request('GET', url, headers=headers)
+
+        if r.status == 304 and previous is not None:
+            jwks_store.touch(CACHE_NAME, url, r.headers.get('ETag', previous['etag']), jwks_store.max_age(r.headers))
+            return 'unchanged'
+
+        if r.status != 200:
+            raise Exception(f"JWKS request returned HTTP {r.status}")
+
+        changed = jwks_store.save(CACHE_NAME, url, r.json(), r.headers.get('ETag'), jwks_store.max_age(r.headers))
+        return 'changed' if changed else 'unchanged'
+    except Exception as e:
+        # The stored copy is kept; launches fall back to the platform once it goes stale
+        logger.error("JwksWarmer->refresh: Error refreshing %s - %s", url, e)
+        return 'failed'
+
+def warm_function(urls):
+    payload = json.dumps({
+        'warmer': True,
+        'key_set_urls': urls,
+        'delay_ms': WARM_DELAY_MS if WARM_CONTAINERS > 1 else 0
+    })
+
+    def invoke(_):
+        try:
+            aws_clients.client('lambda').invoke(FunctionName=WARM_FUNCTION_NAME, InvocationType='RequestResponse', Payload=payload)
+            return True
+        except Exception as e:
+            logger.error("JwksWarmer->warm_function: Error invoking %s - %s", WARM_FUNCTION_NAME, e)
+            return False
+
+    with ThreadPoolExecutor(max_workers=WARM_CONTAINERS) as pool:
+        return sum(pool.map(invoke, range(WARM_CONTAINERS)))
+
+def lambda_handler(event, context):
+    urls = key_set_urls()
+
+    with ThreadPoolExecutor(max_workers=JWKS_WARM_WORKERS) as pool:
+        outcomes = list(pool.map(refresh, urls))
+
+    results = {outcome: outcomes.count(outcome) for outcome in ('changed', 'unchanged', 'failed')}
+
+    if WARM_FUNCTION_NAME and WARM_CONTAINERS > 0:
+        results['warmed'] = warm_function(urls)
+
+    logger.info("JwksWarmer->lambda_handler: %d key sets %s", len(urls), structured_log.Pretty(results))
+
+    return results
@@ -1,12 +1,221 @@
 import base64
+from collections import OrderedDict
+import hashlib
+import http_client
 import json
-import jwt
+import jwks_store
+import lti_claims
+import metrics
 #from jwt import PyJWKClient
 import logging
 import os
-from pprint import pformat
+import re
+import session_token
+import structured_log
+import threading
+import time
 from urllib import parse as urlparse
-import urllib3
+
+# Key sets are cached at module level so they survive across warm invocations.
+# Entries are keyed by key_set_url and index the platform keys by kid.
+JWKS_MIN_REFRESH_INTERVAL = int(os.environ.get('JWKS_MIN_REFRESH_INTERVAL', '30'))
+
+# With JWKS_SHARED=true key sets are read from the shared store in ltiCacheTable (kept fresh by
+# the jwks_warmer function) before the platform is asked
+JWKS_STORE_TABLE = os.environ.get('CACHE_NAME') if jwks_store.JWKS_SHARED else None
+
+jwks_cache = {}
+jwks_lock = threading.Lock()
+
+# One fetch per key_set_url at a time: the Event of the fetch in flight, set once it completes.
+# Lookups that need it (a new kid) wait on it rather than fetching again or failing.
+jwks_fetches = {}
+
+# Parsed verifying keys, keyed by (key_set_url, kid, thumbprint) and bounded in LRU order.
+# Building the key object from the JWK is the expensive part, so it is only done once per key.
+VERIFYING_KEY_CACHE_SIZE = int(os.environ.get('VERIFYING_KEY_CACHE_SIZE', '64'))
+
+verifying_keys = OrderedDict()
+
+def jwk_thumbprint(key):
+    # RFC 7638 thumbprint over the required RSA members
+    members = json.dumps({'e': key.get('e'), 'kty': key.get('kty'), 'n': key.get('n')}, separators=(',', ':'), sort_keys=True)
+    return hashlib.sha256(members.encode('utf-8')).hexdigest()
+
+# id_tokens are parsed once: the header and claims decoded here feed the aud/kid checks
+# and the signature check directly, so the token is never re-parsed by the jwt library.
+MAX_ID_TOKEN_SIZE = int(os.environ.get('MAX_ID_TOKEN_SIZE', '65536'))
+
+# The IMS Security Framework requires RS256 for LTI 1.3 message signing
+ALLOWED_ALGORITHMS = ('RS256',)
+
+JWT_COMPACT = re.compile(r'([A-Za-z0-9_-]+)\.([A-Za-z0-9_-]+)\.([A-Za-z0-9_-]+)')
+
+# Signature verification backends, imported only once a token has passed the cheap checks and
+# actually needs a key or a signature verified. A verifier turns a platform JWK into a key object once (the
+# result is cached in verifying_keys) and checks a signature against it:
+#
+#   cryptography  RSA public key built from the JWK modulus and exponent, RS256 checked with
+#                 cryptography directly (default)
+#   jwt           the jwt library's JWK and signing algorithm objects
+#
+# Both only accept ALLOWED_ALGORITHMS; the claim checks are done by check_claims for either.
+JWT_VERIFIER = os.environ.get('JWT_VERIFIER', 'cryptography')
+
+# Seconds an id_token's iat may be ahead of this clock
+IAT_LEEWAY = int(os.environ.get('IAT_LEEWAY', '60'))
+
+class JwtVerifier:
+
+    name = 'jwt'
+
+    def __init__(self):
+        import jwt
+        self.jwt = jwt
+        self.algorithms = jwt.supported_signing_algorithms()
+
+    def load_key(self, jwk):
+        # The library would also build octet keys, which only fail once a signature is checked
+        if jwk.get('kty') != 'RSA':
+            raise ValueError(f"Unsupported key type {jwk.get('kty')}")
+
+        return self.jwt.jwk_from_dict(jwk)
+
+    def verify(self, alg, signing_input, signature, key):
+        if alg not in ALLOWED_ALGORITHMS:
+            return False
+
+        return self.algorithms[alg].verify(signing_input, key, signature)
+
+class CryptographyVerifier:
+
+    name = 'cryptography'
+
+    def __init__(self):
+        from cryptography.exceptions import InvalidSignature
+        from cryptography.hazmat.backends import default_backend
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import padding, rsa
+
+        self.invalid_signature = InvalidSignature
+        self.backend = default_backend()
+        self.rsa = rsa
+        self.padding = padding.PKCS1v15()
+        self.hashes = {'RS256': hashes.SHA256()}
+
+    def load_key(self, jwk):
+        if jwk.get('kty') != 'RSA':
+            raise ValueError(f"Unsupported key type {jwk.get('kty')}")
+
+        n = int.from_bytes(b64url_decode(jwk['n']), 'big')
+        e = int.from_bytes(b64url_decode(jwk['e']), 'big')
+
+        return self.rsa.RSAPublicNumbers(e, n).public_key(self.backend)
+
+    def verify(self, alg, signing_input, signature, key):
+        if alg not in ALLOWED_ALGORITHMS:
+            return False
+
+        try:
+            key.verify(signature, signing_input, self.padding, self.hashes[alg])
+            return True
+        except self.invalid_signature:
+            return False
+
+VERIFIERS = {
+    'jwt': JwtVerifier,
+    'cryptography': CryptographyVerifier
+}
+
+verifier = None
+
+def get_verifier():
+    global verifier
+
+    if verifier is None:
+        verifier = VERIFIERS[JWT_VERIFIER]()
+
+    return verifier
+
+def b64url_decode(segment):
+    return base64.urlsafe_b64decode(segment + '=' * (-len(segment) % 4))
+
+def parse_jwt(id_token):
+    # Returns (header, claims, signing_input, signature), or None if the token is malformed
+    if not isinstance(id_token, str) or len(id_token) > MAX_ID_TOKEN_SIZE or id_token.count('.') != 2:
+        return None
+
+    match = JWT_COMPACT.fullmatch(id_token)
+
+    if match is None:
+        return None
+
+    try:
+        header = json.loads(b64url_decode(match.group(1)))
+        claims = json.loads(b64url_decode(match.group(2)))
+        signature = b64url_decode(match.group(3))
+    except ValueError:
+        return None
+
+    if not isinstance(header, dict) or not isinstance(claims, dict):
+        return None
+
+    return header, claims, id_token[:match.end(2)].encode('ascii'), signature
+
+def check_time_claims(claims, now=None):
+    # Same exp/nbf semantics as jwt.JWT.decode(do_time_check=True); returns an error or None
+    if now is None:
+        now = time.time()
+
+    if 'exp' in claims:
+        if not isinstance(claims['exp'], int):
+            return 'Invalid Expired value'
+        if now >= claims['exp']:
+            return 'JWT Expired'
+
+    if 'nbf' in claims:
+        if not isinstance(claims['nbf'], int):
+            return 'Invalid "Not valid yet" value'
+        if now < claims['nbf']:
+            return 'JWT Not valid yet'
+
+    return None
+
+def check_claims(claims, now=None):
+    # check_time_claims plus the iat and nonce an LTI id_token must carry; returns an error or None
+    if now is None:
+        now = time.time()
+
+    time_error = check_time_claims(claims, now)
+
+    if time_error is not None:
+        return time_error
+
+    if not isinstance(claims.get('iat'), int):
+        return 'Invalid iat'
+    if claims['iat'] > now + IAT_LEEWAY:
+        return 'JWT issued in the future'
+
+    if not isinstance(claims.get('nonce'), str) or not claims['nonce']:
+        return 'Missing nonce'
+
+    return None
+
+def evict_verifying_keys(jwks_url, keys):
+    # Drop parsed keys that are no longer in the platform's key set after a rotation
+    current = {(kid, jwk_thumbprint(key)) for kid, key in keys.items()}
+
+    for cache_key in [k for k in verifying_keys if k[0] == jwks_url and k[1:] not in current]:
+        del verifying_keys[cache_key]
+
+def jwks_entry(jwks, age):
+    now = time.monotonic()
+
+    return {
+        'keys': {key.get('kid'): key for key in jwks.get('keys', [])},
+        'expires': now + age,
+        'fetched': now
+    }
 
 class lti_util:
 
@@ -15,66 +224,210 @@ class lti_util:
         self.client_id = client_id
         self.jwks_url = jwks_url
 
-        self.http = urllib3.PoolManager()
+        # The id_token's claims once process_launch has verified it
+        self.claims = None
 
-    def decode_jwt_parts(self, part):
-        self.logger.error(f"LTIValidation->decode_jwt_parts: part: {part}")
-        s = str(part).strip()
-        self.logger.error(f"LTIValidation->decode_jwt_parts: s: {s}")
-        
+    def fetch_jwks(self):
+        # Pooled keep-alive connection; an unchanged key set comes back as a 304
+        r = http_client.request("GET", self.jwks_url, revalidate=True)
+
+        if r.status != 200:
+            raise Exception(f"JWKS request returned HTTP {r.status}")
+
+        keys = json.loads(r.data)
+        age = jwks_store.max_age(r.headers)
+
+        self.logger.debug("LTIValidation->fetch_jwks: keys %s", structured_log.Pretty(keys))
+
+        if JWKS_STORE_TABLE:
+            # Hand what this container had to fetch to the others
+            try:
+                jwks_store.save(JWKS_STORE_TABLE, self.jwks_url, keys, r.headers.get('ETag'), age)
+            except Exception as e:
+                self.logger.error("LTIValidation->fetch_jwks: Error storing %s - %s", self.jwks_url, e)
+
+        return jwks_entry(keys, age)
+
+    def load_shared_jwks(self):
         try:
-            return base64.b64decode(s).decode('utf-8')
-        except Exception:
-            padding = len(s) % 4
-            self.logger.error(f"LTIValidation->decode_jwt_parts: padding: {padding}")
-            if padding == 1:
-                self.logger.error(f"LTIValidation->decode_jwt_parts: Invalid base64 string: {s}")
-                return ''
-            elif padding == 2:
-                self.logger.error(f"LTIValidation->decode_jwt_parts: padding equals 2: {s}")
-                s += '=='
-            elif padding == 3:
-                self.logger.error(f"LTIValidation->decode_jwt_parts: padding equals 3: {s}")
-                s += '='
-            return base64.b64decode(s).decode('utf-8')
-    
+            item = jwks_store.load(JWKS_STORE_TABLE, self.jwks_url)
+        except Exception as e:
+            self.logger.error("LTIValidation->load_shared_jwks: Error reading %s - %s", self.jwks_url, e)
+            return None
+
+        if item is None:
+            return None
+
+        # A set the warmer is late with is still served, and refreshed like any other stale set
+        return jwks_entry(item['jwks'], item['fetched_at'] + item['max_age'] - time.time())
+
+    def cache_jwks(self, entry):
+        with jwks_lock:
+            jwks_cache[self.jwks_url] = entry
+            evict_verifying_keys(self.jwks_url, entry['keys'])
+
+        return entry
+
+    def refresh_jwks(self, kid=None):
+        # kid: the key a launch is waiting for; None when refreshing a stale set in the background
+        shared = self.load_shared_jwks() if JWKS_STORE_TABLE else None
+
+        if shared is not None:
+            # The platform is only asked for a kid the shared set doesn't have, or for a newer set
+            usable = kid in shared['keys'] if kid is not None else time.monotonic() < shared['expires']
+            if usable:
+                return self.cache_jwks(shared)
+
+        try:
+            entry = self.fetch_jwks()
+        except Exception as e:
+            self.logger.error("LTIValidation->refresh_jwks: Error fetching %s - %s", self.jwks_url, e)
+
+            if shared is not None:
+                return self.cache_jwks(shared)
+
+            with jwks_lock:
+                current = jwks_cache.get(self.jwks_url)
+                if current is not None:
+                    current['fetched'] = time.monotonic()
+            return None
+
+        return self.cache_jwks(entry)
+
+    def start_fetch(self):
+        # Called with jwks_lock held; the caller must then run_fetch with the returned Event
+        done = threading.Event()
+        jwks_fetches[self.jwks_url] = done
+        return done
+
+    def run_fetch(self, kid, done):
+        try:
+            return self.refresh_jwks(kid)
+        finally:
+            with jwks_lock:
+                if jwks_fetches.get(self.jwks_url) is done:
+                    del jwks_fetches[self.jwks_url]
+            done.set()
+
+    def preload(self):
+        # Warm-up invocations: load the shared set into this container unless it has a fresh one
+        entry = jwks_cache.get(self.jwks_url)
+
+        if not JWKS_STORE_TABLE or entry is not None and time.monotonic() < entry['expires']:
+            return False
+
+        shared = self.load_shared_jwks()
+
+        if shared is None:
+            return False
+
+        self.cache_jwks(shared)
+        return True
+
     def get_public_key(self,kid):
-        
-        r = self.http.request("GET", self.jwks_url)
+        while True:
+            now = time.monotonic()
 
-        keys = json.loads(r.data)
+            with jwks_lock:
+                entry = jwks_cache.get(self.jwks_url)
+                fetching = jwks_fetches.get(self.jwks_url)
 
-        self.logger.debug(f"LTIValidation->get_public_key: keys" + pformat(keys))
+                if entry is not None:
+                    key = entry['keys'].get(kid)
 
-        for key in keys['keys']:
-            if key['kid'] == kid:
-                return key
-        
-        return None
-        
-    def process_launch(self, id_token):
-        self.logger.debug(f"LTIValidation->process_launch: id_token: {id_token}")
+                    if key is not None:
+                        # Keep serving the cached key while a stale set is refreshed in the background
+                        if now >= entry['expires'] and fetching is None and now - entry['fetched'] >= JWKS_MIN_REFRESH_INTERVAL:
+                            done = self.start_fetch()
+                            threading.Thread(target=self.run_fetch, args=(None, done), daemon=True).start()
+                        return key
+
+                if fetching is None:
+                    if entry is not None and now - entry['fetched'] < JWKS_MIN_REFRESH_INTERVAL:
+                        # The last fetch didn't have this kid: don't let bad tokens force a refetch storm
+                        self.logger.debug("LTIValidation->get_public_key: unknown kid %s, refresh rate limited", kid)
+                        return None
+
+                    done = self.start_fetch()
+                    break
+
+            # Another launch is already fetching this set; look again once it has finished
+            self.logger.debug("LTIValidation->get_public_key: waiting for %s for kid %s", self.jwks_url, kid)
+            fetching.wait()
+
+        self.logger.debug("LTIValidation->get_public_key: fetching %s for kid %s", self.jwks_url, kid)
+
+        entry = self.run_fetch(kid, done)
+
+        if entry is None:
+            return None
+
+        return entry['keys'].get(kid)
+
+    def get_verifying_key(self, kid):
+        public_key = self.get_public_key(kid)
+
+        if public_key is None:
+            return None
+
+        cache_key = (self.jwks_url, kid, jwk_thumbprint(public_key))
+
+        with jwks_lock:
+            verifying_key = verifying_keys.get(cache_key)
+            if verifying_key is not None:
+                verifying_keys.move_to_end(cache_key)
+                return verifying_key
+
+        try:
+            verifying_key = get_verifier().load_key(public_key)
+        except Exception as e:
+            # Not an RSA key, or a malformed one: refused like a kid the platform doesn't have
+            self.logger.error("LTIValidation->get_verifying_key: Error loading kid %s from %s - %s", kid, self.jwks_url, e)
+            return None
+
+        with jwks_lock:
+            verifying_keys[cache_key] = verifying_key
+            while len(verifying_keys) > VERIFYING_KEY_CACHE_SIZE:
+                verifying_keys.popitem(last=False)
+
+        return verifying_key
+
+    def process_launch(self, id_token, parsed=None, nonce=None, replay_guard=None, now=None):
+        # parsed: parse_jwt(id_token) when the caller already has it
+        # nonce: the nonce sent with the login, which the token's nonce claim must match
+        # replay_guard: a nonce_guard.NonceGuard, to refuse a verified token seen before
+        # now: the time exp, nbf and iat are checked against (default the current time)
+        if parsed is None:
+            with metrics.stage('parse'):
+                parsed = parse_jwt(id_token)
+
+        if parsed is None:
+            return {
+                'statusCode' : 401,
+                'body' : 'Malformed id_token',
+                "headers": {
+                    "Content-Type": "text/plain"
+                }
+            }
 
-        jwt_parts = id_token.split(".")
-        self.logger.debug(f"LTIValidation->process_launch: jwt_parts: {jwt_parts}")
-        self.logger.debug(f"LTIValidation->process_launch: jwt_parts: {jwt_parts[0]}")
-        self.logger.debug(f"LTIValidation->process_launch: jwt_parts: {jwt_parts[1]}")
-        self.logger.debug(f"LTIValidation->process_launch: jwt_parts: {jwt_parts[2]}")
+        jwt_header, jwt_body, signing_input, signature = parsed
+        self.logger.debug("LTIValidation->process_launch: jwt_header: %s", structured_log.Pretty(jwt_header))
+        self.logger.debug("LTIValidation->process_launch: jwt_body: %s", structured_log.Pretty(jwt_body))
 
-        jwt_header = json.loads(self.decode_jwt_parts(jwt_parts[0]))
-        self.logger.debug(f"LTIValidation->process_launch: jwt_header: " + pformat(jwt_header))
+        alg = jwt_header.get('alg')
 
-        jwt_body = json.loads(self.decode_jwt_parts(jwt_parts[1]))
-        self.logger.debug(f"LTIValidation->process_launch: jwt_body: " + pformat(jwt_body))
+        if alg not in ALLOWED_ALGORITHMS:
+            return {
+                'statusCode' : 401,
+                'body' : 'Unsupported signing algorithm',
+                "headers": {
+                    "Content-Type": "text/plain"
+                }
+            }
 
-        aud = ""
-        if isinstance(jwt_body['aud'], list):
-            aud = jwt_body['aud'][0]
-        else:
-            aud = jwt_body['aud']
+        aud = lti_claims.audience(jwt_body)
 
-        self.logger.debug(f"LTIValidation->process_launch: aud: {aud}")
-        self.logger.debug(f"LTIValidation->process_launch: client_id: {self.client_id}")
+        self.logger.debug("LTIValidation->process_launch: aud: %s client_id: %s", aud, self.client_id)
         
         if aud != self.client_id:
             return {
@@ -85,11 +438,33 @@ class lti_util:
                 }
             }
 
-        self.logger.debug(f"LTIValidation->process_launch: get public key: {jwt_header['kid']}")
+        # Expired, not-yet-valid or nonce-less tokens are rejected before any key lookup or RSA work
+        claims_error = check_claims(jwt_body, now)
+
+        if claims_error is not None:
+            return {
+                'statusCode' : 401,
+                'body' : claims_error,
+                "headers": {
+                    "Content-Type": "text/plain"
+                }
+            }
+
+        if nonce is not None and jwt_body['nonce'] != nonce:
+            return {
+                'statusCode' : 401,
+                'body' : 'Invalid nonce',
+                "headers": {
+                    "Content-Type": "text/plain"
+                }
+            }
+
+        self.logger.debug("LTIValidation->process_launch: get public key: %s", jwt_header.get('kid'))
         
-        public_key = self.get_public_key(jwt_header['kid'])
+        with metrics.stage('jwks'):
+            verifying_key = self.get_verifying_key(jwt_header.get('kid'))
 
-        if public_key is None:
+        if verifying_key is None:
             return {
                 'statusCode' : 401,
                 'body' : 'Invalid client_id',
@@ -98,28 +473,55 @@ class lti_util:
                 }
             }
 
-        instance = jwt.JWT()
-        
-        verifying_key = jwt.jwk_from_dict(public_key)
-        
         try:
 
-            data = instance.decode(
-                id_token, verifying_key, do_time_check=True
-            )
-        
-            self.logger.debug(f"LTIValidation->process_launch: post_validation_data: {data}")
+            with metrics.stage('verify'):
+                verified = get_verifier().verify(alg, signing_input, signature, verifying_key)
+
+            if not verified:
+                return {
+                    'statusCode' : 401,
+                    'body' : 'Invalid signature',
+                    "headers": {
+                        "Content-Type": "text/plain"
+                    }
+                }
+
+            if replay_guard is not None:
+                # Only verified tokens are recorded, so nobody can use up another user's nonce
+                with metrics.stage('nonce'):
+                    first_use = replay_guard.first_use(jwt_body['nonce'], jwt_body.get('exp'))
+
+                if not first_use:
+                    return {
+                        'statusCode' : 401,
+                        'body' : 'Replayed id_token',
+                        "headers": {
+                            "Content-Type": "text/plain"
+                        }
+                    }
+
+            self.logger.debug("LTIValidation->process_launch: post_validation_data: %s", jwt_body)
+
+            self.claims = jwt_body
+
+            body = {'claims': jwt_body}
+
+            if session_token.SESSION_SECRET_ARN:
+                # Lets the tool authenticate the user's follow-up requests without another launch
+                with metrics.stage('session'):
+                    body['session_token'], body['session_expires'] = session_token.mint(jwt_body)
 
             return {
                 'statusCode' : 200,
-                'body' : pformat(json.dumps(data)),
+                'body' : json.dumps(body, separators=(',', ':')),
                 "headers": {
                     "Content-Type": "application/json"
                 }
             }
 
         except Exception as e:
-            self.logger.error(f"LTIValidation->process_launch: Exception: {e}")
+            self.logger.error("LTIValidation->process_launch: Exception: %s", e)
             return {
                 'statusCode' : 500,
                 'body' : f"LTIValidation->process_launch: Exception: {e}",
@@ -1,45 +1,77 @@
+import audit
+import aws_clients
 import base64
-import boto3
-from botocore.exceptions import ClientError
-from boto3.dynamodb.conditions import Key
+from concurrent.futures import ThreadPoolExecutor
+import config_cache
+import ddb_codec
+import deployment_index
 import json
-import logging
+import lti_claims
 import lti_util
+import metrics
+import nonce_guard
 import os
-from pprint import pformat
+import prevalidate
+import signed_token
+import structured_log
+import time
 from urllib import parse as urlparse
 
 
-dynamodb = boto3.resource('dynamodb')
+# The DynamoDB client is created lazily through aws_clients on the first request that needs it
 TABLE_NAME = os.environ['TABLE_NAME']
-table = dynamodb.Table(TABLE_NAME)
-
 CACHE_NAME = os.environ['CACHE_NAME']
-cache = dynamodb.Table(CACHE_NAME)
 
-LOG_LEVEL = os.environ['LOG_LEVEL']
-logger = logging.getLogger()
+# STATE_MODE=signed verifies the HMAC-signed state locally instead of consuming it from ltiCacheTable
+STATE_MODE = os.environ.get('STATE_MODE', 'table')
+STATE_SECRET_ARN = os.environ.get('STATE_SECRET_ARN')
+
+# The id_token's nonce must match the one sent with the login. A table state can only be consumed
+# once, which already stops a replay; a signed state is not consumed, so there the nonce itself is
+# recorded through nonce_guard and a second use refused.
+REPLAY_GUARD = nonce_guard.guard if STATE_MODE == 'signed' else None
 
-if LOG_LEVEL == "DEBUG":
-    logger.setLevel(logging.DEBUG)
-elif LOG_LEVEL == "ERROR":
-    logger.setLevel(logging.ERROR)
-elif LOG_LEVEL == "WARN":
-    logger.setLevel(logging.WARN)
-else:
-    logger.setLevel(logging.INFO)
+# With PREFETCH=true the deployment config and platform key are looked up from the unverified
+# id_token while the state record is read, instead of after it
+PREFETCH = os.environ.get('PREFETCH', 'false').lower() == 'true'
+
+prefetch_pool = None
+
+LOG_LEVEL = os.environ['LOG_LEVEL']
+logger = structured_log.configure(LOG_LEVEL)
 
 def get_body(event):
     return base64.b64decode(str(event['body'])).decode('ascii')
 
+def load_deployment(deployment_id):
+    results = aws_clients.client('dynamodb').get_item(
+        TableName=TABLE_NAME,
+        Key={
+            'deployment_id': {'S': deployment_id}
+        }
+    )
+
+    if 'Item' in results:
+        return ddb_codec.deserialize(results['Item'])
+
+    return None
+
 def get_config(login_params):
 
     config = {}
     
     try:
-        results = table.query(KeyConditionExpression=Key("deployment_id").eq(login_params['lti_deployment_id']))
+        if deployment_index.deployments is not None and login_params.get('iss') and login_params.get('client_id'):
+            # Every deployment of the issuer is held in memory; works without a deployment_id too
+            deployment_id = login_params.get('lti_deployment_id')
+            item = deployment_index.deployments.find(login_params['iss'], login_params['client_id'], deployment_id)
+        else:
+            deployment_id = login_params['lti_deployment_id']
+            item = config_cache.deployments.get(deployment_id, lambda: load_deployment(deployment_id))
 
-        item = results['Items'][0]
+        if item is None:
+            logger.error("LTIValidation->get_config: Unknown deployment_id - %s", deployment_id)
+            return None
         
         config['deployment_id'] = item['deployment_id']
         config['client_id'] = item['client_id']
@@ -47,56 +79,201 @@ def get_config(login_params):
         config['key_set_url'] = item['key_set_url']
         config['auth_token_url'] = item['auth_token_url']        
         
-        logger.debug(f"LTIValidation->get_config: config=" + pformat(config))
+        logger.debug("LTIValidation->get_config: config=%s", structured_log.Pretty(config))
         
         return config
     except Exception as e:
-        logger.error(f"LTIValidation->get_config: Error getting configuration - {e}")
+        logger.error("LTIValidation->get_config: Error getting configuration - %s", e)
         return None
 
     return 
 
-def delete_cache(key):
-    cache.delete_item(
-        Key={
-            'key': key
-        }
-    )
-
 def get_cache_data(state):
+    # Consume the state in a single conditional delete so it can only ever be used once
     try:
-        results = cache.query(KeyConditionExpression=Key("key").eq(state))
-        
-        logger.debug(f"LTIValidation->get_cache_data: Results: " + pformat(results))
-        logger.debug(f"Count: {results['Count']}")
+        results = aws_clients.client('dynamodb').delete_item(
+            TableName=CACHE_NAME,
+            Key={
+                'key': {'S': state}
+            },
+            ConditionExpression='attribute_exists(#k) AND #e > :now',
+            ExpressionAttributeNames={
+                '#k': 'key',
+                '#e': 'expires_at'
+            },
+            ExpressionAttributeValues={
+                ':now': {'N': str(int(time.time()))}
+            },
+            ReturnValues='ALL_OLD'
+        )
 
-        if results['Count'] > 0:
-            item = results['Items'][0]
+        item = ddb_codec.deserialize(results['Attributes'])
 
-            logger.debug(f"LTIValidation->get_cache_data: Key: {state} Value: " + pformat(item))
-            
-            return item
+        logger.debug("LTIValidation->get_cache_data: Key: %s Value: %s", structured_log.Redacted(state), structured_log.Pretty(item))
+        
+        return item
+    except Exception as e:
+        if aws_clients.error_code(e) == 'ConditionalCheckFailedException':
+            logger.error("LTIValidation->get_cache_data: invalid state parameter - %s", structured_log.Redacted(state))
         else:
-            logger.error(f"LTIValidation->get_cache_data: invalid state parameter - {state}")
-            return None
+            logger.error("LTIValidation->get_cache_data: Error getting cache - %s", e)
+        return None
+
+def verify_state(state):
+    claims = signed_token.verify(state, signed_token.load_key(STATE_SECRET_ARN), 'state')
+
+    if claims is None:
+        logger.error("LTIValidation->verify_state: invalid state parameter - %s", structured_log.Redacted(state))
+        return None
+
+    # Same shape as the ltiCacheTable item written by oidc_login.cache_value
+    return {
+        'lti_deployment_id': claims['d'],
+        'client_id': claims['c'],
+        'iss': claims['i'],
+        'launch_id': claims['n'],
+        'ip': claims['ip']
+    }
+
+def get_state_data(state):
+    if STATE_MODE == 'signed':
+        return verify_state(state)
+
+    return get_cache_data(state)
+
+def prefetch_launch(login_params, kid):
+    # Warms the config and JWKS / verifying key caches; nothing here is trusted until
+    # the state check has passed and process_launch has verified the token
+    config = get_config(login_params)
+
+    if config is not None and kid:
+        lti_util.lti_util(logger, config['client_id'], config['key_set_url']).get_verifying_key(kid)
+
+    return config
+
+def start_prefetch(parsed):
+    global prefetch_pool
+
+    if parsed is None:
+        return None
+
+    jwt_header, jwt_body = parsed[0], parsed[1]
+    deployment_id = jwt_body.get(lti_claims.DEPLOYMENT_ID_CLAIM)
+    aud = lti_claims.audience(jwt_body)
+
+    if not isinstance(deployment_id, str) or not prevalidate.issuer_allowed(jwt_body.get('iss')):
+        return None
+
+    login_params = {'lti_deployment_id': deployment_id, 'iss': jwt_body.get('iss'), 'client_id': aud}
+
+    if prefetch_pool is None:
+        prefetch_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='prefetch')
+
+    return deployment_id, prefetch_pool.submit(prefetch_launch, login_params, jwt_header.get('kid'))
+
+def prefetched_config(prefetch, deployment_id):
+    if prefetch is None or prefetch[0] != deployment_id:
+        return None
+
+    try:
+        return prefetch[1].result()
     except Exception as e:
-        logger.error(f"LTIValidation->get_cache_data: Error getting cache - {e}")
+        logger.error("LTIValidation->prefetched_config: Prefetch failed - %s", e)
         return None
-    finally:
-        delete_cache(state)
+
+def warm(event):
+    # Keep-warm invocation from the jwks_warmer function: pays for the crypto import, the
+    # DynamoDB client and the platform keys now rather than during a launch
+    lti_util.get_verifier()
+    aws_clients.client('dynamodb')
+
+    loaded = sum(lti_util.lti_util(logger, None, url).preload() for url in event.get('key_set_urls', []))
+
+    # Held briefly so concurrent warm-up calls land on separate containers
+    time.sleep(event.get('delay_ms', 0) / 1000.0)
+
+    logger.debug("LTIValidation->warm: loaded %d key sets", loaded)
+
+    return {'warmed': True, 'loaded': loaded}
+
+def audit_record(fields, claims):
+    # One audit record per launch; the user's details only come from a verified id_token
+    claims = claims or {}
+
+    return {
+        't': int(time.time()),
+        'request_id': fields.get('request_id'),
+        'deployment_id': fields.get('deployment_id'),
+        'iss': claims.get('iss'),
+        'sub': claims.get('sub'),
+        'context_id': lti_claims.context_id(claims),
+        'roles': claims.get(lti_claims.ROLES_CLAIM),
+        'outcome': fields.get('outcome'),
+        'status': fields.get('status'),
+        'ms': fields.get('ms'),
+        'ip': fields.get('ip')
+    }
 
 def lambda_handler(event, context):
-    logger.debug(f"LTIValidation->lambda_handler: Event: " + pformat(event))
-    logger.debug(f"LTIValidation->lambda_handler: Context: " + pformat(context))
+    try:
+        if event.get('warmer'):
+            return warm(event)
+
+        request_log = structured_log.RequestLog('lti_validation').begin(event, context)
+        launch = {}
+        response = None
+
+        try:
+            response = handle_launch(event, request_log, launch)
+            return response
+        finally:
+            request_log.end(response)
+
+            if audit.log is not None:
+                audit.add(audit_record(request_log.fields, launch.get('claims')))
+    finally:
+        # The audit batch, if one is due, is written after the response has gone
+        audit.end_invocation(context)
+
+def handle_launch(event, request_log, launch):
+    # launch: receives the verified id_token claims for the audit record
+    logger.debug("LTIValidation->lambda_handler: Event: %s", structured_log.Event(event))
 
     try:
-        msg_map = dict(urlparse.parse_qsl(get_body(event)))
-        logger.debug(str(msg_map))
+        # Junk is turned away before the state lookup, config read or JWKS fetch
+        precheck = prevalidate.launch_body_error(event.get('body'))
+
+        if precheck is None:
+            msg_map = dict(urlparse.parse_qsl(get_body(event)))
+            precheck = prevalidate.launch_error(msg_map, STATE_MODE)
+
+        if precheck is not None:
+            logger.debug("LTIValidation->lambda_handler: rejected - %s", precheck)
+            request_log.add(outcome='rejected', reason=precheck)
+
+            return {
+                'statusCode' : 400,
+                'body' : precheck,
+                "headers": {
+                    "Content-Type": "text/plain"
+                }
+            }
+
+        id_token = msg_map['id_token']
+        state = msg_map['state']
+
+        logger.debug("LTIValidation->lambda_handler: id_token=%s state=%s", structured_log.Redacted(id_token), structured_log.Redacted(state))
 
-        id_token = msg_map.get('id_token','err')
-        state = msg_map.get('state','err')
+        parsed = None
+        prefetch = None
+
+        if PREFETCH:
+            with metrics.stage('parse'):
+                parsed = lti_util.parse_jwt(id_token)
+            prefetch = start_prefetch(parsed)
         
-        cache = get_cache_data(state)
+        with metrics.stage('state'):
+            cache = get_state_data(state)
 
         if not cache:
             retval={
@@ -106,7 +283,8 @@ def lambda_handler(event, context):
                     "Content-Type": "text/plain"
                 }
             }
-            logger.error(str(retval))
+            logger.error("LTIValidation->lambda_handler: %s", retval['body'])
+            request_log.add(outcome='invalid_state')
             return retval
         elif cache['ip'] != event['requestContext']['http']['sourceIp']:
             retval={
@@ -116,18 +294,31 @@ def lambda_handler(event, context):
                     "Content-Type": "text/plain"
                 }
             }
-            logger.error(str(retval))
+            logger.error("LTIValidation->lambda_handler: %s", retval['body'])
+            request_log.add(outcome='wrong_ip')
             return retval
 
-        config = get_config(cache)
+        request_log.add(deployment_id=cache.get('lti_deployment_id'))
+
+        with metrics.stage('config'):
+            config = prefetched_config(prefetch, cache.get('lti_deployment_id'))
+            if config is None:
+                config = get_config(cache)
 
         lti = lti_util.lti_util(logger,config['client_id'],config['key_set_url'])
         
-        return_json = lti.process_launch(id_token)
+        with metrics.stage('process_launch'):
+            return_json = lti.process_launch(id_token, parsed, cache.get('launch_id'), REPLAY_GUARD)
+
+        launch['claims'] = lti.claims
+
+        request_log.add(outcome='launched' if return_json['statusCode'] == 200 else 'rejected')
         
         return return_json
         
     except Exception as e:
+        logger.error("LTIValidation->lambda_handler: Exception: %s", e)
+        request_log.add(outcome='error')
         return {
             'statusCode' : 500,
             'body' : str(e),
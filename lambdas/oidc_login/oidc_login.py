@@ -1,66 +1,99 @@
-import boto3
-from botocore.exceptions import ClientError
-from boto3.dynamodb.conditions import Key
+import aws_clients
+import config_cache
+import ddb_codec
+import deployment_index
 import json
-import logging
+import metrics
 import os
-from pprint import pformat
+import math
+import prevalidate
+import rate_limit
+import signed_token
+import structured_log
+import time
 import uuid
 
 
-dynamodb = boto3.resource('dynamodb')
+# The DynamoDB client is created lazily through aws_clients on the first request that needs it
 TABLE_NAME = os.environ['TABLE_NAME']
-table = dynamodb.Table(TABLE_NAME)
-
 CACHE_NAME = os.environ['CACHE_NAME']
-cache = dynamodb.Table(CACHE_NAME)
 
-LOG_LEVEL = os.environ['LOG_LEVEL']
-logger = logging.getLogger()
+# Login states expire through DynamoDB TTL on expires_at, so abandoned logins clean themselves up
+STATE_TTL = int(os.environ.get('STATE_TTL', '600'))
 
-if LOG_LEVEL == "DEBUG":
-    logger.setLevel(logging.DEBUG)
-elif LOG_LEVEL == "ERROR":
-    logger.setLevel(logging.ERROR)
-elif LOG_LEVEL == "WARN":
-    logger.setLevel(logging.WARN)
-else:
-    logger.setLevel(logging.INFO)
+# STATE_MODE=signed carries the login state in an HMAC-signed state value instead of ltiCacheTable
+STATE_MODE = os.environ.get('STATE_MODE', 'table')
+STATE_SECRET_ARN = os.environ.get('STATE_SECRET_ARN')
+
+LOG_LEVEL = os.environ['LOG_LEVEL']
+logger = structured_log.configure(LOG_LEVEL)
 
 def cache_value(key,value,nonce,ip):
-    logger.debug(f"oidc_login->cache_value: key={key}")
-    logger.debug(f"oidc_login->cache_value: value={value}")
-    logger.debug(f"oidc_login->cache_value: nonce={nonce}")
-    logger.debug(f"oidc_login->cache_value: ip={ip}")
-    logger.debug(f"oidc_login->cache_value: value['client_id']={value['client_id']}")
-    logger.debug(f"oidc_login->cache_value: value['lti_deployment_id']={value['lti_deployment_id']}")
-    logger.debug(f"oidc_login->cache_value: value['iss']={value['iss']}")
-    logger.debug(f"oidc_login->cache_value: value['lti_message_hint']={value['lti_message_hint']}")
+    logger.debug("oidc_login->cache_value: key=%s value=%s ip=%s", structured_log.Redacted(key), value, ip)
     
     try:
-        response = cache.put_item(
-            Item={
+        response = aws_clients.client('dynamodb').put_item(
+            TableName=CACHE_NAME,
+            Item=ddb_codec.serialize({
                 'key': str(key),
                 'client_id': str(value['client_id']),
                 'lti_deployment_id': str(value['lti_deployment_id']),
                 'iss': str(value['iss']),
                 'launch_id' : str(nonce),
                 'lti_message_hint': str(value['lti_message_hint']),
-                'ip': str(ip)
-            }
+                'ip': str(ip),
+                'expires_at': int(time.time()) + STATE_TTL
+            })
         )
-        logger.info(f"{value} successfully cached as {key}")
+        logger.debug("oidc_login->cache_value: cached as %s", structured_log.Redacted(key))
     except Exception as e:
-        logger.error(f"Error caching {value} as {key} - {e}")
+        logger.error("oidc_login->cache_value: Error caching %s - %s", value, e)
+
+def load_deployment(deployment_id):
+    results = aws_clients.client('dynamodb').get_item(
+        TableName=TABLE_NAME,
+        Key={
+            'deployment_id': {'S': deployment_id}
+        }
+    )
+
+    if 'Item' in results:
+        return ddb_codec.deserialize(results['Item'])
+
+    return None
+
+def sign_state(value,nonce,ip):
+    logger.debug("oidc_login->sign_state: lti_deployment_id=%s", value['lti_deployment_id'])
+
+    return signed_token.sign(
+        {
+            'd': str(value['lti_deployment_id']),
+            'c': str(value['client_id']),
+            'i': str(value['iss']),
+            'n': str(nonce),
+            'ip': str(ip),
+            'exp': int(time.time()) + STATE_TTL
+        },
+        signed_token.load_key(STATE_SECRET_ARN),
+        'state'
+    )
 
 def get_config(login_params):
 
     config = {}
     
     try:
-        results = table.query(KeyConditionExpression=Key("deployment_id").eq(login_params['lti_deployment_id']))
-
-        item = results['Items'][0]
+        if deployment_index.deployments is not None and login_params.get('iss') and login_params.get('client_id'):
+            # Every deployment of the issuer is held in memory; works without a deployment_id too
+            deployment_id = login_params.get('lti_deployment_id')
+            item = deployment_index.deployments.find(login_params['iss'], login_params['client_id'], deployment_id)
+        else:
+            deployment_id = login_params['lti_deployment_id']
+            item = config_cache.deployments.get(deployment_id, lambda: load_deployment(deployment_id))
+
+        if item is None:
+            logger.error("OIDCLogin->get_config: Unknown deployment_id - %s", deployment_id)
+            return None
         
         config['deployment_id'] = item['deployment_id']
         config['client_id'] = item['client_id']
@@ -68,11 +101,11 @@ def get_config(login_params):
         config['auth_login_url'] = item['auth_login_url']
         config['auth_token_url'] = item['auth_token_url']        
         
-        logger.debug(f"OIDCLogin->get_config: config=" + pformat(config))
+        logger.debug("OIDCLogin->get_config: config=%s", structured_log.Pretty(config))
         
         return config
     except Exception as e:
-        logger.error(f"OIDCLogin->get_config: Error getting configuration - {e}")
+        logger.error("OIDCLogin->get_config: Error getting configuration - %s", e)
         return None
 
     return 
@@ -104,33 +137,83 @@ def build_url(login_params,config,state,nonce):
     
 
 def lambda_handler(event, context):
-    logger.debug(f"OIDCLogin->lambda_handler: Event: " + pformat(event))
-    logger.debug(f"OIDCLogin->lambda_handler: Context: " + pformat(context))
-    
-    login_params = event['queryStringParameters']
-    
-    logger.debug(f"oidc_login->lambda_handler: login_params={login_params}")
+    request_log = structured_log.RequestLog('oidc_login').begin(event, context)
+    response = None
+
+    try:
+        response = handle_login(event, request_log)
+        return response
+    finally:
+        request_log.end(response)
+
+def handle_login(event, request_log):
+    logger.debug("OIDCLogin->lambda_handler: Event: %s", structured_log.Event(event))
     
-    config = get_config(login_params)
+    login_params = event.get('queryStringParameters') or {}
     
-    logger.debug(f"oidc_login->lambda_handler: config={config}")
+    logger.debug("oidc_login->lambda_handler: login_params=%s", login_params)
+
+    # Junk is turned away before any DynamoDB read
+    precheck = prevalidate.login_error(login_params)
+
+    if precheck is not None:
+        logger.debug("oidc_login->lambda_handler: rejected - %s", precheck)
+        request_log.add(outcome='rejected', reason=precheck)
+
+        return {
+            'statusCode' : 400,
+            'body' : json.dumps(precheck),
+            "headers": {
+                "Content-Type": "application/json"
+            }
+        }
+
+    # Floods from one client or one deployment are turned away before they cost reads or state writes
+    throttled = rate_limit.login.check(
+        event['requestContext']['http']['sourceIp'],
+        login_params.get('lti_deployment_id') or f"{login_params['iss']}|{login_params['client_id']}"
+    )
+
+    if throttled is not None:
+        scope, retry_after = throttled
+        logger.debug("oidc_login->lambda_handler: throttled by %s, retry after %.2fs", scope, retry_after)
+        request_log.add(outcome='throttled', reason=scope)
+
+        return {
+            'statusCode' : 429,
+            'body' : json.dumps("Too many login requests"),
+            "headers": {
+                "Content-Type": "application/json",
+                "Retry-After": str(max(1, math.ceil(retry_after)))
+            }
+        }
+
+    with metrics.stage('config'):
+        config = get_config(login_params)
+
+    if config is not None and 'lti_deployment_id' not in login_params:
+        # The platform left it out and the deployment index resolved it from iss and client_id
+        login_params['lti_deployment_id'] = config['deployment_id']
+
+    request_log.add(deployment_id=login_params.get('lti_deployment_id'))
     
     if config is not None and validate_deployment(login_params,config):
-        
-        logger.debug(f"oidc_login->lambda_handler: set state")
 
-        state = uuid.uuid4()
         nonce = uuid.uuid4().hex
-        
-        logger.debug(f"oidc_login->lambda_handler: nonce={nonce}")
+        ip = event['requestContext']['http']['sourceIp']
+
+        with metrics.stage('store_state'):
+            if STATE_MODE == 'signed':
+                state = sign_state(login_params,nonce,ip)
+            else:
+                state = uuid.uuid4()
+                cache_value(state,login_params,nonce,ip)
         
         location = build_url(login_params,config,state,nonce)
         
-        logger.debug(f"oidc_login->lambda_handler: location={location}")
+        logger.debug("oidc_login->lambda_handler: redirecting to %s", config['auth_login_url'])
 
-        cache_value(state,login_params,nonce,event['requestContext']['http']['sourceIp'])
-        
-        logger.debug(f"oidc_login->lambda_handler: return")
+        request_log.add(outcome='redirect')
     
         return {
             'statusCode' : 302,
@@ -141,6 +224,8 @@ def lambda_handler(event, context):
     else:
         
         message = f"Invalid deployment ID, client ID, or issuer"
+
+        request_log.add(outcome='invalid_deployment')
     
         return {
             'statusCode' : 400,
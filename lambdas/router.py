@@ -0,0 +1,42 @@
+import audit
+import importlib
+import os
+import sys
+
+# Single-function deployment (function_mode=router): one Lambda serves both /login and /launch,
+# routing on the API Gateway routeKey. A user's login and launch, seconds apart, then land on the
+# same pool of containers and share their warm config cache, boto3 clients, HTTP connection pool
+# and JWKS cache. Each handler is imported on the first request for its route; audit is imported
+# up front so its Lambda extension registers during init.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+for name in ('lti_validation', 'oidc_login'):
+    sys.path.insert(0, os.path.join(HERE, name))
+
+ROUTES = {
+    'GET /login': 'oidc_login',
+    'POST /login': 'oidc_login',
+    'POST /launch': 'lti_validation'
+}
+
+def lambda_handler(event, context):
+    try:
+        return route(event, context)
+    finally:
+        audit.end_invocation(context)
+
+def route(event, context):
+    # Keep-warm calls from the jwks_warmer function are for the launch handler
+    module_name = 'lti_validation' if event.get('warmer') else ROUTES.get(event.get('routeKey'))
+
+    if module_name is None:
+        return {
+            'statusCode' : 404,
+            'body' : 'Not found',
+            "headers": {
+                "Content-Type": "text/plain"
+            }
+        }
+
+    return importlib.import_module(module_name).lambda_handler(event, context)
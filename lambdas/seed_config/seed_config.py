@@ -0,0 +1,112 @@
+import aws_clients
+import ddb_codec
+import json
+import os
+import random
+import structured_log
+import time
+
+# Custom resource handler (custom_resources.Provider on_event) that loads the deployments in
+# lti.json into ltiConfigTable. The file is deployed as an S3 asset, so any change to it gives
+# the resource new properties and CloudFormation sends an Update.
+#
+#   Create  writes every deployment
+#   Update  writes deployments that are new or changed and deletes the ones removed from the
+#           file, by diffing against the previous asset
+#   Delete  deletes the deployments in the file
+#
+# Writes go through BatchWriteItem in chunks of 25, retrying unprocessed items with backoff.
+
+BATCH_SIZE = 25
+SEED_MAX_ATTEMPTS = int(os.environ.get('SEED_MAX_ATTEMPTS', '8'))
+
+DEPLOYMENT_FIELDS = ('deployment_id', 'client_id', 'issuer', 'auth_login_url', 'auth_token_url', 'key_set_url', 'default')
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+logger = structured_log.configure(LOG_LEVEL)
+
+def load_deployments(bucket, key):
+    body = aws_clients.client('s3').get_object(Bucket=bucket, Key=key)['Body'].read()
+    dataset = json.loads(body)
+
+    # Keyed by deployment_id; a repeated deployment_id keeps its last entry, as the
+    # one-putItem-per-deployment seeding did
+    deployments = {}
+    for deployment in dataset['deployments']:
+        deployments[deployment['deployment_id']] = {field: deployment[field] for field in DEPLOYMENT_FIELDS}
+
+    return deployments
+
+def load_previous(properties):
+    try:
+        return load_deployments(properties['ConfigBucket'], properties['ConfigKey'])
+    except Exception as e:
+        logger.error("SeedConfig->load_previous: Previous config unavailable, not deleting anything - %s", e)
+        return {}
+
+def batch_write(table_name, requests):
+    client = aws_clients.client('dynamodb')
+
+    for start in range(0, len(requests), BATCH_SIZE):
+        pending = {table_name: requests[start:start + BATCH_SIZE]}
+        attempt = 0
+
+        while pending:
+            results = client.batch_write_item(RequestItems=pending)
+            pending = results.get('UnprocessedItems') or {}
+
+            if pending:
+                attempt += 1
+                if attempt >= SEED_MAX_ATTEMPTS:
+                    raise Exception(f"{len(pending[table_name])} items still unprocessed after {attempt} attempts")
+                time.sleep(random.uniform(0, min(0.05 * (2 ** attempt), 5)))
+
+def put_requests(deployments):
+    return [{'PutRequest': {'Item': ddb_codec.serialize(item)}} for item in deployments]
+
+def delete_requests(deployment_ids):
+    return [{'DeleteRequest': {'Key': {'deployment_id': {'S': deployment_id}}}} for deployment_id in deployment_ids]
+
+def on_event(event, context):
+    request_type = event['RequestType']
+    properties = event['ResourceProperties']
+    table_name = properties['TableName']
+    physical_id = event.get('PhysicalResourceId') or f"{table_name}-seed"
+
+    written = []
+    deleted = []
+
+    if request_type == 'Create':
+        written = list(load_deployments(properties['ConfigBucket'], properties['ConfigKey']).values())
+
+    elif request_type == 'Update':
+        current = load_deployments(properties['ConfigBucket'], properties['ConfigKey'])
+        old_properties = event.get('OldResourceProperties', {})
+
+        if old_properties.get('TableName') != table_name:
+            written = list(current.values())
+        else:
+            previous = load_previous(old_properties)
+            written = [item for deployment_id, item in current.items() if previous.get(deployment_id) != item]
+            deleted = [deployment_id for deployment_id in previous if deployment_id not in current]
+
+    elif request_type == 'Delete':
+        try:
+            deleted = list(load_deployments(properties['ConfigBucket'], properties['ConfigKey']))
+            batch_write(table_name, delete_requests(deleted))
+        except Exception as e:
+            # Never block a stack delete, the table may already be gone
+            logger.error("SeedConfig->on_event: Error deleting seeded deployments - %s", e)
+        return {'PhysicalResourceId': physical_id}
+
+    batch_write(table_name, put_requests(written) + delete_requests(deleted))
+
+    logger.info("SeedConfig->on_event: %s wrote %d and deleted %d deployments in %s", request_type, len(written), len(deleted), table_name)
+
+    return {
+        'PhysicalResourceId': physical_id,
+        'Data': {
+            'Written': len(written),
+            'Deleted': len(deleted)
+        }
+    }
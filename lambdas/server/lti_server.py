@@ -0,0 +1,272 @@
+import asyncio
+import base64
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+import importlib
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+from urllib import parse as urlparse
+import uuid
+
+# Long-running HTTP server for sustained launch traffic (server=fargate), serving /login and
+# /launch with the same handlers as the Lambda functions through lambdas/router.py.
+#
+# SERVER_WORKERS processes (default two per core) share one listening socket. Each runs an
+# asyncio loop that reads HTTP/1.1 keep-alive connections, turns every request into the API
+# Gateway v2 event the handlers expect and runs the handler on a pool of SERVER_THREADS threads,
+# so a worker keeps serving while requests wait on DynamoDB or a platform. The boto3 clients,
+# the HTTP connection pool and the config, JWKS and key caches are created once per process and
+# shared by all of its requests. The handler modules are imported before the workers are forked;
+# clients and connections are only made afterwards, in each worker.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+LAMBDAS = os.path.dirname(HERE)
+
+for path in (LAMBDAS, os.path.join(LAMBDAS, 'shared')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+SERVER_PORT = int(os.environ.get('SERVER_PORT', '8080'))
+SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', str(2 * (os.cpu_count() or 1))))
+SERVER_THREADS = int(os.environ.get('SERVER_THREADS', '32'))
+SERVER_KEEPALIVE = float(os.environ.get('SERVER_KEEPALIVE', '75'))
+SERVER_MAX_HEADER = int(os.environ.get('SERVER_MAX_HEADER', '65536'))
+SERVER_MAX_BODY = int(os.environ.get('SERVER_MAX_BODY', '1048576'))
+
+logger = logging.getLogger()
+
+class RequestContext:
+    # The parts of the Lambda context the handlers read
+
+    function_name = 'lti_server'
+    function_version = '$LATEST'
+
+    def __init__(self, request_id):
+        self.aws_request_id = request_id
+
+    def get_remaining_time_in_millis(self):
+        return 10000
+
+def preload():
+    # Imported once in the parent so the workers share the pages
+    import router
+
+    for module_name in ('oidc_login', 'lti_validation'):
+        importlib.import_module(module_name)
+
+    return router
+
+def make_event(method, target, headers, body, peer):
+    path, _, query = target.partition('?')
+
+    # Behind the ALB the client address is the last X-Forwarded-For entry; earlier ones are client supplied
+    forwarded = headers.get('x-forwarded-for')
+    source_ip = forwarded.split(',')[-1].strip() if forwarded else peer
+
+    route_key = f"{method} {path}"
+    request_id = str(uuid.uuid4())
+
+    return {
+        'version': '2.0',
+        'routeKey': route_key,
+        'rawPath': path,
+        'rawQueryString': query,
+        'headers': headers,
+        'queryStringParameters': dict(urlparse.parse_qsl(query)) or None,
+        'requestContext': {
+            'http': {
+                'method': method,
+                'path': path,
+                'protocol': 'HTTP/1.1',
+                'sourceIp': source_ip,
+                'userAgent': headers.get('user-agent', '')
+            },
+            'requestId': request_id,
+            'routeKey': route_key,
+            'timeEpoch': int(time.time() * 1000)
+        },
+        'body': base64.b64encode(body).decode('ascii') if body else None,
+        'isBase64Encoded': True
+    }
+
+def text_response(status, body):
+    return {
+        'statusCode' : status,
+        'body' : body,
+        "headers": {
+            "Content-Type": "text/plain"
+        }
+    }
+
+def render(response, keep_alive):
+    status = response.get('statusCode', 200)
+    body = response.get('body') or ''
+
+    if response.get('isBase64Encoded'):
+        data = base64.b64decode(body)
+    else:
+        data = body.encode('utf-8') if isinstance(body, str) else json.dumps(body).encode('utf-8')
+
+    try:
+        reason = HTTPStatus(status).phrase
+    except ValueError:
+        reason = ''
+
+    lines = [f"HTTP/1.1 {status} {reason}"]
+    for name, value in (response.get('headers') or {}).items():
+        lines.append(f"{name}: {value}")
+    lines.append(f"Content-Length: {len(data)}")
+    lines.append('Connection: keep-alive' if keep_alive else 'Connection: close')
+
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + data
+
+def invoke(router, event):
+    try:
+        return router.lambda_handler(event, RequestContext(event['requestContext']['requestId']))
+    except Exception as e:
+        logger.error("LTIServer->invoke: Exception: %s", e)
+        return text_response(500, 'Internal error')
+
+async def read_request(reader):
+    # (method, target, version, headers, body), None at the end of the connection, or a
+    # response to send before closing it
+    try:
+        head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), SERVER_KEEPALIVE)
+    except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+        return None
+    except asyncio.LimitOverrunError:
+        return text_response(431, 'Request headers too large')
+
+    request_line, *header_lines = head.decode('latin-1').split('\r\n')
+
+    try:
+        method, target, version = request_line.split(' ')
+    except ValueError:
+        return text_response(400, 'Bad request')
+
+    headers = {}
+    for line in header_lines:
+        if line:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        return text_response(411, 'Length required')
+
+    try:
+        length = int(headers.get('content-length', '0'))
+    except ValueError:
+        return text_response(400, 'Bad request')
+
+    if length > SERVER_MAX_BODY:
+        return text_response(413, 'Request too large')
+
+    try:
+        body = await reader.readexactly(length) if length else b''
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+
+    return method, target, version, headers, body
+
+def connection_handler(router):
+
+    async def handle_connection(reader, writer):
+        loop = asyncio.get_running_loop()
+        peer = (writer.get_extra_info('peername') or ('',))[0]
+
+        try:
+            while True:
+                request = await read_request(reader)
+
+                if request is None:
+                    return
+
+                if isinstance(request, dict):
+                    writer.write(render(request, False))
+                    await writer.drain()
+                    return
+
+                method, target, version, headers, body = request
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+
+                if target == '/health':
+                    response = text_response(200, 'OK')
+                else:
+                    response = await loop.run_in_executor(None, invoke, router, make_event(method, target, headers, body, peer))
+
+                writer.write(render(response, keep_alive))
+                await writer.drain()
+
+                if not keep_alive:
+                    return
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return handle_connection
+
+async def serve(sock, router):
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=SERVER_THREADS, thread_name_prefix='handler'))
+
+    server = await asyncio.start_server(connection_handler(router), sock=sock, limit=SERVER_MAX_HEADER)
+
+    # Stop accepting on SIGTERM (a task being stopped) and let serve_forever return
+    loop.add_signal_handler(signal.SIGTERM, server.close)
+
+    async with server:
+        try:
+            await server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+
+def run_worker(sock, router):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    try:
+        asyncio.run(serve(sock, router))
+    finally:
+        # Audit records the flusher thread has not written yet
+        import audit
+        if audit.log is not None:
+            audit.log.flush()
+
+def main(port=SERVER_PORT, workers=SERVER_WORKERS):
+    router = preload()
+
+    sock = socket.create_server(('0.0.0.0', port), backlog=1024)
+    sock.setblocking(False)
+
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(sock, router)
+            finally:
+                os._exit(0)
+        children.append(pid)
+
+    logger.info("LTIServer->main: %d workers on port %d", workers, port)
+
+    def stop(signum, frame):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for pid in children:
+        os.waitpid(pid, 0)
+
+if __name__ == '__main__':
+    main()
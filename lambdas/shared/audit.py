@@ -0,0 +1,279 @@
+import aws_clients
+import base64
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+
+# Audit records of launches, kept off the response path.
+#
+# Records are buffered in memory and written in batches of JSON lines, gzip compressed, to
+# AUDIT_SINK:
+#
+#   sqs       one message per batch (base64) to AUDIT_QUEUE_URL
+#   firehose  one record per batch to the AUDIT_STREAM_NAME delivery stream; concatenated gzip
+#             members are themselves a valid gzip file, so the objects it writes can be read as is
+#   file      appended to AUDIT_FILE, for local runs
+#
+# A batch is written once it holds AUDIT_BATCH_RECORDS records or its oldest record is
+# AUDIT_BATCH_AGE seconds old, never by the request that adds a record:
+#
+#  - In Lambda the module registers an internal extension during init. Lambda waits for its
+#    thread to ask for the next event before freezing the container, so once the handler has
+#    returned its response (and called end_invocation) the thread writes a batch that is due;
+#    otherwise buffered records wait for a later invocation. Every handler of a function that
+#    imports this module must call end_invocation, or Lambda holds each invocation open until its
+#    deadline. A container being shut down gets a SIGTERM, on which whatever is left is written
+#    (best effort).
+#  - Elsewhere (the Fargate server, benchmarks) a background thread writes batches as they
+#    become due.
+#
+# At most AUDIT_MAX_BUFFER records are held; beyond that, and for batches the sink refuses,
+# records are dropped and counted in the error log.
+
+AUDIT_SINK = os.environ.get('AUDIT_SINK', '')
+AUDIT_QUEUE_URL = os.environ.get('AUDIT_QUEUE_URL')
+AUDIT_STREAM_NAME = os.environ.get('AUDIT_STREAM_NAME')
+AUDIT_FILE = os.environ.get('AUDIT_FILE', 'audit.jsonl.gz')
+
+AUDIT_BATCH_RECORDS = int(os.environ.get('AUDIT_BATCH_RECORDS', '100'))
+AUDIT_BATCH_AGE = float(os.environ.get('AUDIT_BATCH_AGE', '10'))
+AUDIT_MAX_BUFFER = int(os.environ.get('AUDIT_MAX_BUFFER', '10000'))
+
+EXTENSION_NAME = 'lti-audit'
+EXTENSION_API = '2020-01-01/extension'
+
+# Largest compressed batch per sink (SQS messages are base64, so 3/4 of its 256 KiB limit)
+MAX_BATCH_BYTES = {
+    'sqs': 190000,
+    'firehose': 1000000,
+    'file': 1 << 30
+}
+
+logger = logging.getLogger()
+
+def encode(records):
+    lines = ''.join(json.dumps(r, separators=(',', ':'), default=str) + '\n' for r in records)
+    return gzip.compress(lines.encode('utf-8'))
+
+class SqsSink:
+
+    name = 'sqs'
+
+    def send(self, data, count):
+        aws_clients.client('sqs').send_message(
+            QueueUrl=AUDIT_QUEUE_URL,
+            MessageBody=base64.b64encode(data).decode('ascii'),
+            MessageAttributes={
+                'content-encoding': {'DataType': 'String', 'StringValue': 'gzip+base64'},
+                'records': {'DataType': 'Number', 'StringValue': str(count)}
+            }
+        )
+
+class FirehoseSink:
+
+    name = 'firehose'
+
+    def send(self, data, count):
+        aws_clients.client('firehose').put_record(
+            DeliveryStreamName=AUDIT_STREAM_NAME,
+            Record={'Data': data}
+        )
+
+class FileSink:
+
+    name = 'file'
+
+    def __init__(self, path=None):
+        self.path = path or AUDIT_FILE
+        self.lock = threading.Lock()
+
+    def send(self, data, count):
+        with self.lock, open(self.path, 'ab') as f:
+            f.write(data)
+
+SINKS = {
+    'sqs': SqsSink,
+    'firehose': FirehoseSink,
+    'file': FileSink
+}
+
+class AuditLog:
+
+    def __init__(self, sink, batch_records=AUDIT_BATCH_RECORDS, batch_age=AUDIT_BATCH_AGE, max_buffer=AUDIT_MAX_BUFFER):
+        self.sink = sink
+        self.batch_records = batch_records
+        self.batch_age = batch_age
+        self.max_buffer = max_buffer
+
+        self.records = []
+        self.oldest = None
+        self.dropped = 0
+        self.sent = 0
+        self.batches = 0
+
+        self.condition = threading.Condition()
+        self.flush_lock = threading.Lock()
+        self.flusher = None
+        self.extension = None
+        self.done_request = None
+
+    def add(self, record):
+        with self.condition:
+            if len(self.records) >= self.max_buffer:
+                self.dropped += 1
+                return
+
+            self.records.append(record)
+            if self.oldest is None:
+                self.oldest = time.monotonic()
+
+            if len(self.records) >= self.batch_records:
+                self.condition.notify()
+
+        if self.extension is None and self.flusher is None:
+            self.start_flusher()
+
+    def due(self, now):
+        return len(self.records) >= self.batch_records or (self.oldest is not None and now - self.oldest >= self.batch_age)
+
+    def take(self):
+        with self.condition:
+            records = self.records
+            self.records = []
+            self.oldest = None
+            return records
+
+    def flush(self):
+        # Writes out everything buffered; only ever called off the request path
+        with self.flush_lock:
+            records = self.take()
+
+            if records:
+                self.write(records)
+
+    def write(self, records):
+        data = encode(records)
+
+        if len(data) > MAX_BATCH_BYTES[self.sink.name] and len(records) > 1:
+            half = len(records) // 2
+            self.write(records[:half])
+            self.write(records[half:])
+            return
+
+        try:
+            self.sink.send(data, len(records))
+            self.sent += len(records)
+            self.batches += 1
+        except Exception as e:
+            self.dropped += len(records)
+            logger.error("Audit->write: Error writing %d records (%d dropped so far) - %s", len(records), self.dropped, e)
+
+    def start_flusher(self):
+        with self.condition:
+            if self.flusher is None:
+                self.flusher = threading.Thread(target=self.run_flusher, name='audit-flusher', daemon=True)
+                self.flusher.start()
+
+    def run_flusher(self):
+        while True:
+            with self.condition:
+                while not self.due(time.monotonic()):
+                    wait = None if self.oldest is None else self.batch_age - (time.monotonic() - self.oldest)
+                    self.condition.wait(wait)
+
+            self.flush()
+
+    def end_invocation(self, request_id):
+        # Called by the handler as it returns; hands the extension thread its turn. Calling it
+        # more than once for the same request (router -> lti_validation) is harmless.
+        if self.extension is not None:
+            with self.condition:
+                self.done_request = request_id
+                self.condition.notify_all()
+
+    def register_extension(self, runtime_api):
+        # Must run during the init phase; returns False when Lambda refuses the registration.
+        # http.client (and the ssl and email modules it pulls in) is only imported with a sink.
+        import http.client
+        import signal
+
+        try:
+            conn = http.client.HTTPConnection(runtime_api, timeout=2)
+            conn.request('POST', f'/{EXTENSION_API}/register', json.dumps({'events': ['INVOKE']}), {'Lambda-Extension-Name': EXTENSION_NAME})
+            response = conn.getresponse()
+            response.read()
+
+            if response.status != 200:
+                raise Exception(f"register returned HTTP {response.status}")
+
+            extension_id = response.getheader('Lambda-Extension-Identifier')
+        except Exception as e:
+            logger.error("Audit->register_extension: Error registering extension - %s", e)
+            return False
+
+        self.extension = threading.Thread(target=self.run_extension, args=(runtime_api, extension_id), name='audit-extension', daemon=True)
+        self.extension.start()
+
+        # Lambda sends SIGTERM before shutting down a container with a registered extension
+        try:
+            signal.signal(signal.SIGTERM, self.on_sigterm)
+        except ValueError:
+            pass
+
+        return True
+
+    def run_extension(self, runtime_api, extension_id):
+        import http.client
+
+        conn = http.client.HTTPConnection(runtime_api)
+
+        while True:
+            # Blocks until the next invocation starts; the container is frozen in between
+            conn.request('GET', f'/{EXTENSION_API}/event/next', headers={'Lambda-Extension-Identifier': extension_id})
+            event = json.loads(conn.getresponse().read() or b'{}')
+            request_id = event.get('requestId')
+            deadline = event.get('deadlineMs', 0) / 1000.0
+
+            with self.condition:
+                while self.done_request != request_id:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+
+                due = self.due(time.monotonic())
+
+            if due:
+                self.flush()
+
+    def on_sigterm(self, signum, frame):
+        self.flush()
+        raise SystemExit(0)
+
+def add(record):
+    if log is not None:
+        log.add(record)
+
+def end_invocation(context):
+    if log is not None:
+        log.end_invocation(getattr(context, 'aws_request_id', None))
+
+def create():
+    sink = SINKS.get(AUDIT_SINK)
+
+    if sink is None:
+        return None
+
+    audit_log = AuditLog(sink())
+
+    runtime_api = os.environ.get('AWS_LAMBDA_RUNTIME_API')
+    if runtime_api:
+        audit_log.register_extension(runtime_api)
+
+    return audit_log
+
+# None when AUDIT_SINK is unset
+log = create()
@@ -0,0 +1,25 @@
+import threading
+
+# Low-level boto3 clients, created on first use and reused for the life of the container.
+# boto3 itself is only imported when a client is first needed, which keeps it off the
+# import path of every request that never talks to AWS.
+
+clients = {}
+clients_lock = threading.Lock()
+
+def client(service):
+    c = clients.get(service)
+
+    if c is None:
+        with clients_lock:
+            c = clients.get(service)
+            if c is None:
+                import boto3
+                c = boto3.client(service)
+                clients[service] = c
+
+    return c
+
+def error_code(e):
+    # The AWS error code of a botocore ClientError, without importing botocore to catch it
+    return getattr(e, 'response', {}).get('Error', {}).get('Code')
@@ -0,0 +1,118 @@
+from collections import OrderedDict
+import json
+import logging
+import os
+import threading
+import time
+
+# In-process cache for ltiConfigTable items, shared by the oidc_login and lti_validation
+# functions through the shared layer. Deployment config almost never changes, so a warm
+# container answers config lookups from memory and only goes back to DynamoDB on expiry.
+CONFIG_CACHE_TTL = int(os.environ.get('CONFIG_CACHE_TTL', '300'))
+CONFIG_CACHE_SIZE = int(os.environ.get('CONFIG_CACHE_SIZE', '256'))
+CONFIG_CACHE_REPORT_EVERY = int(os.environ.get('CONFIG_CACHE_REPORT_EVERY', '100'))
+
+# Keys that don't exist (scanners, misconfigured platforms) are remembered briefly in a separate,
+# bounded map, so they cost one DynamoDB read per TTL and can't push real entries out
+CONFIG_CACHE_NEGATIVE_TTL = int(os.environ.get('CONFIG_CACHE_NEGATIVE_TTL', '30'))
+CONFIG_CACHE_NEGATIVE_SIZE = int(os.environ.get('CONFIG_CACHE_NEGATIVE_SIZE', '1024'))
+
+logger = logging.getLogger()
+
+class ConfigCache:
+
+    def __init__(self, name, ttl=CONFIG_CACHE_TTL, maxsize=CONFIG_CACHE_SIZE, report_every=CONFIG_CACHE_REPORT_EVERY,
+                 negative_ttl=CONFIG_CACHE_NEGATIVE_TTL, negative_maxsize=CONFIG_CACHE_NEGATIVE_SIZE):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.report_every = report_every
+        self.negative_ttl = negative_ttl
+        self.negative_maxsize = negative_maxsize
+
+        self.entries = OrderedDict()
+        self.negative = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+
+    def get(self, key, loader, ttl=None):
+        now = time.monotonic()
+
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                self.report()
+                return entry[1]
+
+            expires = self.negative.get(key)
+
+            if expires is not None and expires > now:
+                self.negative_hits += 1
+                self.report()
+                return None
+
+            self.misses += 1
+            self.report()
+
+        value = loader()
+
+        if value is not None:
+            self.put(key, value, ttl)
+        elif self.negative_ttl > 0:
+            self.put_negative(key)
+
+        return value
+
+    def put_negative(self, key):
+        with self.lock:
+            self.negative[key] = time.monotonic() + self.negative_ttl
+            self.negative.move_to_end(key)
+
+            while len(self.negative) > self.negative_maxsize:
+                self.negative.popitem(last=False)
+
+    def put(self, key, value, ttl=None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+
+        with self.lock:
+            self.negative.pop(key, None)
+            self.entries[key] = (expires, value)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, key=None):
+        with self.lock:
+            if key is None:
+                self.entries.clear()
+                self.negative.clear()
+            else:
+                self.entries.pop(key, None)
+                self.negative.pop(key, None)
+
+    def stats(self):
+        lookups = self.hits + self.negative_hits + self.misses
+
+        return {
+            'cache': self.name,
+            'hits': self.hits,
+            'misses': self.misses,
+            'negative_hits': self.negative_hits,
+            'size': len(self.entries),
+            'negative_size': len(self.negative),
+            'hit_ratio': round((self.hits + self.negative_hits) / lookups, 4) if lookups else 0.0
+        }
+
+    def report(self):
+        # Called with the lock held; logs the running hit ratio every report_every lookups
+        if self.report_every and (self.hits + self.negative_hits + self.misses) % self.report_every == 0:
+            logger.info(json.dumps(self.stats()))
+
+deployments = ConfigCache('deployments')
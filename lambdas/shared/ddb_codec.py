@@ -0,0 +1,42 @@
+# Hand-rolled DynamoDB attribute value serialization for the low-level client, covering
+# the types the LTI tables use. Numbers come back as int or float rather than Decimal.
+
+def serialize_value(value):
+    if isinstance(value, str):
+        return {'S': value}
+    if isinstance(value, bool):
+        return {'BOOL': value}
+    if isinstance(value, (int, float)):
+        return {'N': str(value)}
+    if value is None:
+        return {'NULL': True}
+    if isinstance(value, dict):
+        return {'M': serialize(value)}
+    if isinstance(value, (list, tuple)):
+        return {'L': [serialize_value(v) for v in value]}
+    if isinstance(value, bytes):
+        return {'B': value}
+    raise TypeError(f"Unsupported DynamoDB attribute type: {type(value).__name__}")
+
+def deserialize_value(value):
+    (kind, data), = value.items()
+
+    if kind == 'S' or kind == 'BOOL' or kind == 'B':
+        return data
+    if kind == 'N':
+        return int(data) if data.lstrip('-').isdigit() else float(data)
+    if kind == 'NULL':
+        return None
+    if kind == 'M':
+        return deserialize(data)
+    if kind == 'L':
+        return [deserialize_value(v) for v in data]
+    if kind == 'SS':
+        return set(data)
+    raise TypeError(f"Unsupported DynamoDB attribute type: {kind}")
+
+def serialize(item):
+    return {k: serialize_value(v) for k, v in item.items()}
+
+def deserialize(item):
+    return {k: deserialize_value(v) for k, v in item.items()}
@@ -0,0 +1,210 @@
+import aws_clients
+import config_cache
+import ddb_codec
+from collections import OrderedDict
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+# In-process index of ltiConfigTable deployments by (issuer, client_id), backed by the
+# issuer-client_id GSI (CONFIG_INDEX_NAME). The first lookup for an issuer loads every
+# deployment of that issuer with one paginated Query; later lookups, including ones without a
+# deployment_id, are answered from memory until DEPLOYMENT_INDEX_TTL runs out.
+#
+# Rows are kept as tuples of interned strings, which keeps tens of thousands of deployments
+# small (issuers and platform URLs repeat across rows). Issuers with no deployments at all are
+# only remembered for the config_cache negative TTL, in a bounded map of their own.
+#
+# Lookups are counted like config_cache counts them (a hit is answered from memory, a miss needs
+# a Query, a negative hit is an unknown issuer or deployment answered from memory), and the
+# running hit ratio is logged every CONFIG_CACHE_REPORT_EVERY lookups.
+
+CONFIG_INDEX_NAME = os.environ.get('CONFIG_INDEX_NAME')
+DEPLOYMENT_INDEX_TTL = int(os.environ.get('DEPLOYMENT_INDEX_TTL', str(config_cache.CONFIG_CACHE_TTL)))
+DEPLOYMENT_INDEX_MIN_RELOAD = int(os.environ.get('DEPLOYMENT_INDEX_MIN_RELOAD', '30'))
+
+FIELDS = ('deployment_id', 'client_id', 'issuer', 'auth_login_url', 'auth_token_url', 'key_set_url', 'default')
+
+logger = logging.getLogger()
+
+def compact(item):
+    return tuple(sys.intern(v) if isinstance(v, str) else v for v in (item.get(field) for field in FIELDS))
+
+class DeploymentIndex:
+
+    def __init__(self, table_name, index_name, ttl=DEPLOYMENT_INDEX_TTL, min_reload=DEPLOYMENT_INDEX_MIN_RELOAD,
+                 negative_ttl=config_cache.CONFIG_CACHE_NEGATIVE_TTL, negative_maxsize=config_cache.CONFIG_CACHE_NEGATIVE_SIZE,
+                 report_every=config_cache.CONFIG_CACHE_REPORT_EVERY):
+        self.table_name = table_name
+        self.index_name = index_name
+        self.ttl = ttl
+        self.min_reload = min_reload
+        self.negative_ttl = negative_ttl
+        self.negative_maxsize = negative_maxsize
+        self.report_every = report_every
+
+        self.issuers = {}
+        self.unknown_issuers = OrderedDict()
+        self.lock = threading.Lock()
+        self.queries = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+
+    def query_issuer(self, issuer):
+        kwargs = {
+            'TableName': self.table_name,
+            'IndexName': self.index_name,
+            'KeyConditionExpression': '#i = :i',
+            'ExpressionAttributeNames': {'#i': 'issuer'},
+            'ExpressionAttributeValues': {':i': {'S': issuer}}
+        }
+
+        while True:
+            results = aws_clients.client('dynamodb').query(**kwargs)
+            self.queries += 1
+
+            for item in results.get('Items', []):
+                yield ddb_codec.deserialize(item)
+
+            if 'LastEvaluatedKey' not in results:
+                return
+            kwargs['ExclusiveStartKey'] = results['LastEvaluatedKey']
+
+    def load(self, issuer):
+        clients = {}
+        defaults = {}
+
+        for item in self.query_issuer(issuer):
+            row = compact(item)
+            clients.setdefault(row[1], {})[row[0]] = row
+            if row[6]:
+                defaults[row[1]] = row
+
+        now = time.monotonic()
+
+        if not clients:
+            with self.lock:
+                self.issuers.pop(issuer, None)
+                self.unknown_issuers[issuer] = now + self.negative_ttl
+                self.unknown_issuers.move_to_end(issuer)
+                while len(self.unknown_issuers) > self.negative_maxsize:
+                    self.unknown_issuers.popitem(last=False)
+            return None
+
+        entry = {'clients': clients, 'defaults': defaults, 'expires': now + self.ttl, 'loaded': now}
+
+        with self.lock:
+            self.unknown_issuers.pop(issuer, None)
+            self.issuers[issuer] = entry
+
+        return entry
+
+    def known_unknown(self, issuer, now):
+        expires = self.unknown_issuers.get(issuer)
+        return expires is not None and expires > now
+
+    def entry(self, issuer, now):
+        # (entry or None, whether it had to be loaded)
+        entry = self.issuers.get(issuer)
+
+        if entry is not None and now < entry['expires']:
+            return entry, False
+
+        try:
+            return self.load(issuer), True
+        except Exception as e:
+            if entry is None:
+                raise
+            # Keep answering from the expired copy rather than failing logins
+            logger.error("DeploymentIndex->entry: Error reloading %s - %s", issuer, e)
+            return entry, True
+
+    @staticmethod
+    def match(entry, client_id, deployment_id):
+        deployments = entry['clients'].get(client_id)
+
+        if not deployments:
+            return None
+
+        if deployment_id is None:
+            # No deployment_id from the platform: the client's default deployment, or its only one
+            row = entry['defaults'].get(client_id)
+            if row is None and len(deployments) == 1:
+                row = next(iter(deployments.values()))
+            return row
+
+        return deployments.get(deployment_id)
+
+    def find(self, issuer, client_id, deployment_id=None):
+        now = time.monotonic()
+
+        if self.known_unknown(issuer, now):
+            self.count('negative_hits')
+            return None
+
+        entry, loaded = self.entry(issuer, now)
+
+        if entry is None:
+            self.count('misses')
+            return None
+
+        row = self.match(entry, client_id, deployment_id)
+
+        if row is None and now - entry['loaded'] >= self.min_reload:
+            # May have been added since the issuer was loaded; reloads are rate limited so
+            # unknown ids can't turn every login into a Query
+            loaded = True
+            entry = self.load(issuer)
+            row = self.match(entry, client_id, deployment_id) if entry is not None else None
+
+        if loaded:
+            self.count('misses')
+        elif row is None:
+            self.count('negative_hits')
+        else:
+            self.count('hits')
+
+        if row is None:
+            return None
+
+        return dict(zip(FIELDS, row))
+
+    def count(self, outcome):
+        with self.lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+            self.report()
+
+    def stats(self):
+        lookups = self.hits + self.negative_hits + self.misses
+
+        return {
+            'cache': 'deployment_index',
+            'hits': self.hits,
+            'misses': self.misses,
+            'negative_hits': self.negative_hits,
+            'size': sum(len(deployments) for entry in self.issuers.values() for deployments in entry['clients'].values()),
+            'negative_size': len(self.unknown_issuers),
+            'queries': self.queries,
+            'hit_ratio': round((self.hits + self.negative_hits) / lookups, 4) if lookups else 0.0
+        }
+
+    def report(self):
+        # Called with the lock held, like ConfigCache.report
+        if self.report_every and (self.hits + self.negative_hits + self.misses) % self.report_every == 0:
+            logger.info(json.dumps(self.stats()))
+
+    def invalidate(self, issuer=None):
+        with self.lock:
+            if issuer is None:
+                self.issuers.clear()
+                self.unknown_issuers.clear()
+            else:
+                self.issuers.pop(issuer, None)
+                self.unknown_issuers.pop(issuer, None)
+
+deployments = DeploymentIndex(os.environ.get('TABLE_NAME'), CONFIG_INDEX_NAME) if CONFIG_INDEX_NAME else None
@@ -0,0 +1,143 @@
+import os
+import random
+import threading
+import time
+
+# One pooled HTTP client per container for every outbound platform call (JWKS, token endpoint).
+#
+# The pool lives at module level, so keep-alive connections to a platform survive across warm
+# invocations instead of paying TCP + TLS setup on every request. Requests have connect/read
+# timeouts and a bounded number of retries with full-jitter backoff. GETs can opt into
+# conditional revalidation (ETag / Last-Modified) against a small in-memory response cache.
+#
+# urllib3 is imported when the first request is made, not at init.
+
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', '2'))
+HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', '3'))
+HTTP_RETRIES = int(os.environ.get('HTTP_RETRIES', '2'))
+HTTP_BACKOFF = float(os.environ.get('HTTP_BACKOFF', '0.1'))
+HTTP_BACKOFF_MAX = float(os.environ.get('HTTP_BACKOFF_MAX', '1'))
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', '4'))
+HTTP_CACHE_SIZE = int(os.environ.get('HTTP_CACHE_SIZE', '64'))
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Headers a 304 is allowed to update on the stored response
+REVALIDATED_HEADERS = ('Cache-Control', 'Expires', 'Date', 'ETag', 'Last-Modified')
+
+pool = None
+pool_lock = threading.Lock()
+
+response_cache = {}
+response_cache_lock = threading.Lock()
+
+class Response:
+
+    __slots__ = ('status', 'headers', 'data', 'cached')
+
+    def __init__(self, status, headers, data, cached=False):
+        self.status = status
+        self.headers = headers
+        self.data = data
+        self.cached = cached
+
+    def json(self):
+        import json
+        return json.loads(self.data)
+
+def new_pool(**kwargs):
+    import urllib3
+
+    options = {
+        'num_pools': 10,
+        'maxsize': HTTP_POOL_SIZE,
+        'timeout': urllib3.Timeout(connect=HTTP_CONNECT_TIMEOUT, read=HTTP_READ_TIMEOUT),
+        # Retries are done here, with jitter, rather than by urllib3; redirects are still
+        # followed, since some platforms move their key_set_url behind a 301
+        'retries': urllib3.Retry(total=None, connect=0, read=0, status=0, redirect=3)
+    }
+    options.update(kwargs)
+    return urllib3.PoolManager(**options)
+
+def get_pool():
+    global pool
+
+    if pool is None:
+        with pool_lock:
+            if pool is None:
+                pool = new_pool()
+    return pool
+
+def backoff(attempt, retry_after=None):
+    if retry_after is not None:
+        try:
+            return min(float(retry_after), HTTP_BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, min(HTTP_BACKOFF * (2 ** attempt), HTTP_BACKOFF_MAX))
+
+def remember(url, response):
+    if not (response.headers.get('ETag') or response.headers.get('Last-Modified')):
+        return
+
+    with response_cache_lock:
+        response_cache.pop(url, None)
+        if len(response_cache) >= HTTP_CACHE_SIZE:
+            response_cache.pop(next(iter(response_cache)))
+        response_cache[url] = response
+
+def request(method, url, fields=None, headers=None, body=None, revalidate=False, retry=None):
+    # revalidate: send the stored validators for a GET and answer a 304 from the stored response
+    # retry: defaults to retrying idempotent methods only
+    headers = dict(headers or {})
+    if retry is None:
+        retry = method in IDEMPOTENT_METHODS
+
+    stored = None
+    if revalidate and method == 'GET':
+        with response_cache_lock:
+            stored = response_cache.get(url)
+        if stored is not None:
+            if stored.headers.get('ETag'):
+                headers['If-None-Match'] = stored.headers['ETag']
+            if stored.headers.get('Last-Modified'):
+                headers['If-Modified-Since'] = stored.headers['Last-Modified']
+
+    # urllib3 rejects fields and body together, even when one of them is None
+    kwargs = {'headers': headers}
+    if fields is not None:
+        kwargs['fields'] = fields
+    if body is not None:
+        kwargs['body'] = body
+
+    attempts = 1 + (HTTP_RETRIES if retry else 0)
+
+    for attempt in range(attempts):
+        last = attempt == attempts - 1
+
+        try:
+            r = get_pool().request(method, url, **kwargs)
+        except Exception:
+            if last:
+                raise
+            time.sleep(backoff(attempt))
+            continue
+
+        if r.status in RETRY_STATUS and not last:
+            time.sleep(backoff(attempt, r.headers.get('Retry-After')))
+            continue
+
+        if r.status == 304 and stored is not None:
+            merged = stored.headers.copy()
+            for name in REVALIDATED_HEADERS:
+                if name in r.headers:
+                    merged[name] = r.headers[name]
+            response = Response(stored.status, merged, stored.data, cached=True)
+        else:
+            response = Response(r.status, r.headers, r.data)
+
+        if revalidate and response.status == 200:
+            remember(url, response)
+
+        return response
@@ -0,0 +1,113 @@
+import aws_clients
+import ddb_codec
+import hashlib
+import json
+import logging
+import os
+import time
+
+# Platform key sets shared by every container through ltiCacheTable. The jwks_warmer function
+# refreshes each configured key_set_url on a schedule, revalidating with the stored ETag, so a
+# cold container reads a platform's keys with one GetItem instead of fetching them from the
+# platform. Launch functions only go to the key_set_url itself when the stored set doesn't have
+# the kid they need, and write what they fetch back here for the other containers.
+#
+# Items are keyed "jwks#<sha256 of the url>" and hold the document as JSON with its ETag, a
+# version bumped whenever the keys change, when it was fetched and its max-age. expires_at lets
+# the table TTL drop the sets of platforms that are no longer configured.
+
+JWKS_SHARED = os.environ.get('JWKS_SHARED', 'false').lower() == 'true'
+JWKS_DEFAULT_TTL = int(os.environ.get('JWKS_DEFAULT_TTL', '300'))
+JWKS_STORE_RETENTION = int(os.environ.get('JWKS_STORE_RETENTION', '86400'))
+
+logger = logging.getLogger()
+
+def max_age(headers):
+    # Seconds a fetched key set may be used for, from its Cache-Control header
+    cache_control = headers.get('Cache-Control', '') if headers else ''
+
+    for directive in cache_control.split(','):
+        name, _, value = directive.strip().partition('=')
+        name = name.lower()
+
+        if name in ('no-cache', 'no-store'):
+            return 0
+        if name == 'max-age':
+            try:
+                return max(int(value.strip('"')), 0)
+            except ValueError:
+                break
+
+    return JWKS_DEFAULT_TTL
+
+def store_key(url):
+    return "jwks#" + hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+def load(table_name, url):
+    # The stored item with its document parsed into 'jwks', or None
+    results = aws_clients.client('dynamodb').get_item(
+        TableName=table_name,
+        Key={'key': {'S': store_key(url)}}
+    )
+
+    if 'Item' not in results:
+        return None
+
+    item = ddb_codec.deserialize(results['Item'])
+    item['jwks'] = json.loads(item['jwks'])
+
+    return item
+
+def touch(table_name, url, etag, age, now=None):
+    # The platform answered 304 (or the same keys): only the freshness changes
+    now = int(time.time()) if now is None else now
+
+    aws_clients.client('dynamodb').update_item(
+        TableName=table_name,
+        Key={'key': {'S': store_key(url)}},
+        UpdateExpression='SET #t = :t, #f = :f, #m = :m, #e = :e',
+        ConditionExpression='attribute_exists(#j)',
+        ExpressionAttributeNames={'#t': 'etag', '#f': 'fetched_at', '#m': 'max_age', '#e': 'expires_at', '#j': 'jwks'},
+        ExpressionAttributeValues=ddb_codec.serialize({
+            ':t': etag or '',
+            ':f': now,
+            ':m': age,
+            ':e': now + JWKS_STORE_RETENTION
+        })
+    )
+
+def save(table_name, url, jwks, etag, age, now=None):
+    # Stores a fetched key set; the version is only bumped when the document differs from the
+    # stored one. Returns True when it changed.
+    now = int(time.time()) if now is None else now
+    document = json.dumps(jwks, separators=(',', ':'), sort_keys=True)
+    digest = hashlib.sha256(document.encode('utf-8')).hexdigest()
+
+    try:
+        aws_clients.client('dynamodb').update_item(
+            TableName=table_name,
+            Key={'key': {'S': store_key(url)}},
+            UpdateExpression='SET #u = :u, #j = :j, #d = :d, #t = :t, #f = :f, #m = :m, #e = :e ADD #v :one',
+            ConditionExpression='attribute_not_exists(#d) OR #d <> :d',
+            ExpressionAttributeNames={
+                '#u': 'url', '#j': 'jwks', '#d': 'digest', '#t': 'etag',
+                '#f': 'fetched_at', '#m': 'max_age', '#e': 'expires_at', '#v': 'version'
+            },
+            ExpressionAttributeValues=ddb_codec.serialize({
+                ':u': url,
+                ':j': document,
+                ':d': digest,
+                ':t': etag or '',
+                ':f': now,
+                ':m': age,
+                ':e': now + JWKS_STORE_RETENTION,
+                ':one': 1
+            })
+        )
+        return True
+    except Exception as e:
+        if aws_clients.error_code(e) != 'ConditionalCheckFailedException':
+            raise
+
+    touch(table_name, url, etag, age, now)
+    return False
@@ -0,0 +1,20 @@
+# LTI 1.3 id_token claims the functions read, and how they are read, so launch validation,
+# session tokens and tools/bulk_validate.py agree on them.
+
+LTI = 'https://purl.imsglobal.org/spec/lti/claim/'
+DEPLOYMENT_ID_CLAIM = LTI + 'deployment_id'
+CONTEXT_CLAIM = LTI + 'context'
+ROLES_CLAIM = LTI + 'roles'
+
+def audience(claims):
+    # The client_id a token is for: aud, or the first entry when aud is a list
+    aud = claims.get('aud')
+
+    if isinstance(aud, list):
+        return aud[0] if aud else None
+
+    return aud
+
+def context_id(claims):
+    context = claims.get(CONTEXT_CLAIM)
+    return context.get('id') if isinstance(context, dict) else None
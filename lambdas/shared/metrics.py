@@ -0,0 +1,83 @@
+import contextvars
+import functools
+import os
+import time
+
+# Per-stage latency for the LTI functions, emitted as CloudWatch Embedded Metric Format.
+#
+# Handlers wrap their stages in `with metrics.stage('name'):` (or decorate with @metrics.timed).
+# The timings of the current request are collected in memory and written out by
+# structured_log.RequestLog.end as part of the per-request JSON line, which CloudWatch Logs turns
+# into metrics. No network calls are made. METRICS_ENABLED=false turns timing off entirely.
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() not in ('0', 'false', 'off', 'no')
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'LTI13')
+
+# Every metric is published per outcome and per deployment
+DIMENSIONS = [['function', 'outcome'], ['function', 'deployment_id']]
+
+current = contextvars.ContextVar('metrics_timings', default=None)
+
+def begin():
+    timings = {} if METRICS_ENABLED else None
+    current.set(timings)
+    return timings
+
+def end():
+    timings = current.get()
+    current.set(None)
+    return timings
+
+class stage:
+
+    __slots__ = ('name', 'timings', 'start')
+
+    def __init__(self, name):
+        self.name = name
+        self.timings = None
+        self.start = 0.0
+
+    def __enter__(self):
+        self.timings = current.get()
+        if self.timings is not None:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.timings is not None:
+            elapsed = (time.perf_counter() - self.start) * 1000
+            self.timings[self.name] = self.timings.get(self.name, 0.0) + elapsed
+        return False
+
+def timed(name):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def document(fields, timings, total_ms):
+    doc = dict(fields)
+
+    for dimension in ('function', 'outcome', 'deployment_id'):
+        if doc.get(dimension) is None:
+            doc[dimension] = 'none'
+
+    names = []
+    for name, value in timings.items():
+        doc[name] = round(value, 3)
+        names.append(name)
+    doc['duration'] = total_ms
+    names.append('duration')
+
+    doc['_aws'] = {
+        'Timestamp': int(time.time() * 1000),
+        'CloudWatchMetrics': [{
+            'Namespace': METRICS_NAMESPACE,
+            'Dimensions': DIMENSIONS,
+            'Metrics': [{'Name': name, 'Unit': 'Milliseconds'} for name in names]
+        }]
+    }
+    return doc
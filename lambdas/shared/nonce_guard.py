@@ -0,0 +1,126 @@
+import aws_clients
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+
+# Replay protection for id_token nonces.
+#
+# Each nonce may be used for one launch. The authoritative check is a conditional PutItem of
+# nonce#<nonce> in ltiCacheTable, which expires through the table TTL with the id_token, so a
+# nonce seen for the first time costs one write. In front of it each container keeps a
+# time-windowed Bloom filter of the nonces it has already seen, so a token replayed to the same
+# container is turned away with no I/O.
+#
+# The filter has two generations of NONCE_FILTER_CAPACITY nonces each, and a new one is started
+# every NONCE_FILTER_WINDOW seconds or when the current one is full, so a nonce stays in it for
+# at least one window. A Bloom filter never misses a nonce it holds but can claim one it does not:
+# about 2 * NONCE_FILTER_ERROR of first-time launches on a container are refused as replays.
+#
+# Records of tokens without an exp are kept for NONCE_RETENTION seconds.
+
+NONCE_FILTER_WINDOW = int(os.environ.get('NONCE_FILTER_WINDOW', '3600'))
+NONCE_FILTER_CAPACITY = int(os.environ.get('NONCE_FILTER_CAPACITY', '100000'))
+NONCE_FILTER_ERROR = float(os.environ.get('NONCE_FILTER_ERROR', '0.000001'))
+NONCE_RETENTION = int(os.environ.get('NONCE_RETENTION', '86400'))
+
+logger = logging.getLogger()
+
+class BloomFilter:
+
+    def __init__(self, capacity, error_rate):
+        # Optimal bit count and number of hashes for capacity items at error_rate
+        ln2 = math.log(2)
+        self.bits = max(int(-capacity * math.log(error_rate) / (ln2 * ln2)), 8)
+        self.hashes = max(int(round(self.bits / capacity * ln2)), 1)
+        self.array = bytearray((self.bits + 7) // 8)
+        self.count = 0
+
+    def positions(self, item):
+        # Double hashing over one 128 bit digest (Kirsch and Mitzenmacher)
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def contains(self, positions):
+        return all(self.array[p >> 3] & (1 << (p & 7)) for p in positions)
+
+    def add(self, positions):
+        for p in positions:
+            self.array[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+class WindowedFilter:
+
+    def __init__(self, window=NONCE_FILTER_WINDOW, capacity=NONCE_FILTER_CAPACITY, error_rate=NONCE_FILTER_ERROR):
+        self.window = window
+        self.capacity = capacity
+        self.error_rate = error_rate
+
+        self.current = BloomFilter(capacity, error_rate)
+        self.previous = None
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+
+    def rotate(self, now):
+        if now - self.started >= self.window or self.current.count >= self.capacity:
+            self.previous = self.current
+            self.current = BloomFilter(self.capacity, self.error_rate)
+            self.started = now
+
+    def seen(self, item):
+        positions = self.current.positions(item)
+
+        with self.lock:
+            self.rotate(time.monotonic())
+            return self.current.contains(positions) or (self.previous is not None and self.previous.contains(positions))
+
+    def add(self, item):
+        positions = self.current.positions(item)
+
+        with self.lock:
+            self.rotate(time.monotonic())
+            self.current.add(positions)
+
+class NonceGuard:
+
+    def __init__(self, table_name=None, local=None):
+        self.table_name = table_name or os.environ.get('CACHE_NAME')
+        self.local = WindowedFilter() if local is None else local
+
+    def first_use(self, nonce, expires_at=None):
+        # True the first time nonce is presented, False for a replay; DynamoDB errors are raised
+        # to the caller, so a launch is never accepted without the authoritative check
+        if self.local.seen(nonce):
+            logger.error("NonceGuard->first_use: replayed nonce (local)")
+            return False
+
+        if expires_at is None:
+            expires_at = time.time() + NONCE_RETENTION
+
+        try:
+            aws_clients.client('dynamodb').put_item(
+                TableName=self.table_name,
+                Item={
+                    'key': {'S': f"nonce#{nonce}"},
+                    'expires_at': {'N': str(int(expires_at))}
+                },
+                ConditionExpression='attribute_not_exists(#k)',
+                ExpressionAttributeNames={'#k': 'key'}
+            )
+        except Exception as e:
+            if aws_clients.error_code(e) != 'ConditionalCheckFailedException':
+                raise
+
+            logger.error("NonceGuard->first_use: replayed nonce")
+            self.local.add(nonce)
+            return False
+
+        self.local.add(nonce)
+        return True
+
+guard = NonceGuard()
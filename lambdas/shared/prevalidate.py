@@ -0,0 +1,72 @@
+import os
+import re
+
+# Structural checks run before a login or launch does any I/O, so scanner and misconfigured
+# platform traffic is turned away in microseconds without DynamoDB reads or JWKS fetches.
+# Each check returns an error message, or None when the request may go on. They only reject
+# what can never succeed; everything that passes is still fully validated afterwards.
+#
+# KNOWN_ISSUERS (comma separated) optionally restricts the platforms that may log in. Without
+# it a login from a new issuer passes and costs one deployment Query before it is rejected.
+
+MAX_PARAM_LENGTH = int(os.environ.get('MAX_PARAM_LENGTH', '2048'))
+MAX_ID_TOKEN_SIZE = int(os.environ.get('MAX_ID_TOKEN_SIZE', '65536'))
+KNOWN_ISSUERS = frozenset(i.strip() for i in os.environ.get('KNOWN_ISSUERS', '').split(',') if i.strip())
+
+# base64 of a form body holding the largest id_token plus state and the other fields
+MAX_LAUNCH_BODY = (MAX_ID_TOKEN_SIZE + 4096) * 4 // 3
+
+LOGIN_REQUIRED = ('iss', 'client_id', 'login_hint', 'target_link_uri')
+
+ID_TOKEN = re.compile(r'[A-Za-z0-9_-]+\.[A-Za-z0-9_-]+\.[A-Za-z0-9_-]+')
+TABLE_STATE = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}')
+SIGNED_STATE = re.compile(r'[A-Za-z0-9_-]{1,1024}\.[A-Za-z0-9_-]{43}')
+
+def issuer_allowed(iss):
+    return not KNOWN_ISSUERS or iss in KNOWN_ISSUERS
+
+def login_error(login_params):
+    if not login_params:
+        return 'Missing login parameters'
+
+    for name in LOGIN_REQUIRED:
+        if not login_params.get(name):
+            return f"Missing {name}"
+
+    for name, value in login_params.items():
+        if len(value) > MAX_PARAM_LENGTH:
+            return f"{name} too long"
+
+    if not login_params['iss'].startswith('https://'):
+        return 'Invalid iss'
+
+    if not issuer_allowed(login_params['iss']):
+        return 'Unknown iss'
+
+    return None
+
+def launch_body_error(body):
+    if not body:
+        return 'Missing body'
+
+    if len(body) > MAX_LAUNCH_BODY:
+        return 'Body too large'
+
+    return None
+
+def launch_error(msg_map, state_mode):
+    id_token = msg_map.get('id_token')
+    state = msg_map.get('state')
+
+    if not id_token or not state:
+        return 'Missing id_token or state'
+
+    # The length check comes first so the pattern never scans an oversized value
+    if len(id_token) > MAX_ID_TOKEN_SIZE or id_token.count('.') != 2 or not ID_TOKEN.fullmatch(id_token):
+        return 'Malformed id_token'
+
+    state_pattern = SIGNED_STATE if state_mode == 'signed' else TABLE_STATE
+    if len(state) > MAX_PARAM_LENGTH or not state_pattern.fullmatch(state):
+        return 'Malformed state'
+
+    return None
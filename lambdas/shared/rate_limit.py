@@ -0,0 +1,170 @@
+import aws_clients
+from collections import OrderedDict
+import logging
+import os
+import threading
+import time
+
+# Admission control for OIDC logins, keyed on source IP and on deployment.
+#
+# Each container keeps token buckets in memory, so a flood is turned away without any I/O.
+# With RATE_LIMIT_SHARED=true, requests a container admits are also counted in fixed-window
+# counters in ltiCacheTable (one atomic UpdateItem each, expiring through the table TTL), so the
+# limits hold across containers too. Counters are only touched once the in-memory buckets have
+# admitted a request, and once a key is over its shared limit the container stops asking DynamoDB
+# until the window ends, for that key and for requests it shares with other keys. Counter errors fail open.
+#
+# A rate of 0 turns that limit off.
+
+LOGIN_RATE_PER_IP = float(os.environ.get('LOGIN_RATE_PER_IP', '20'))
+LOGIN_BURST_PER_IP = float(os.environ.get('LOGIN_BURST_PER_IP', '40'))
+LOGIN_RATE_PER_DEPLOYMENT = float(os.environ.get('LOGIN_RATE_PER_DEPLOYMENT', '200'))
+LOGIN_BURST_PER_DEPLOYMENT = float(os.environ.get('LOGIN_BURST_PER_DEPLOYMENT', '400'))
+
+RATE_LIMIT_SHARED = os.environ.get('RATE_LIMIT_SHARED', 'false').lower() == 'true'
+RATE_LIMIT_WINDOW = int(os.environ.get('RATE_LIMIT_WINDOW', '1'))
+RATE_LIMIT_KEYS = int(os.environ.get('RATE_LIMIT_KEYS', '4096'))
+
+logger = logging.getLogger()
+
+def bounded_set(entries, key, value, maxsize):
+    entries[key] = value
+    entries.move_to_end(key)
+
+    while len(entries) > maxsize:
+        entries.popitem(last=False)
+
+class TokenBucket:
+
+    def __init__(self, rate, burst, maxsize=RATE_LIMIT_KEYS):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.maxsize = maxsize
+
+        # key -> (tokens, updated); least recently seen keys are dropped first, which only
+        # ever hands a forgotten key a full bucket again
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, key, now=None):
+        # Returns 0 when admitted, otherwise the seconds until a token is available
+        if self.rate <= 0:
+            return 0
+
+        now = time.monotonic() if now is None else now
+
+        with self.lock:
+            bucket = self.buckets.get(key)
+            tokens = self.burst if bucket is None else min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+
+            if tokens >= 1:
+                bounded_set(self.buckets, key, (tokens - 1, now), self.maxsize)
+                return 0
+
+            bounded_set(self.buckets, key, (tokens, now), self.maxsize)
+            return (1 - tokens) / self.rate
+
+class SharedWindow:
+
+    def __init__(self, scope, rate, table_name, window=RATE_LIMIT_WINDOW, maxsize=RATE_LIMIT_KEYS):
+        self.scope = scope
+        self.limit = rate * window
+        self.table_name = table_name
+        self.window = window
+        self.maxsize = maxsize
+
+        self.blocked = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, key, now=None):
+        if self.limit <= 0:
+            return 0
+
+        now = time.time() if now is None else now
+        window_start = int(now // self.window) * self.window
+
+        wait = self.blocked_for(key, now)
+        if wait:
+            return wait
+
+        try:
+            results = aws_clients.client('dynamodb').update_item(
+                TableName=self.table_name,
+                Key={'key': {'S': f"rate#{self.scope}#{key}#{window_start}"}},
+                UpdateExpression='SET #e = :e ADD #c :one',
+                ExpressionAttributeNames={'#e': 'expires_at', '#c': 'count'},
+                ExpressionAttributeValues={':e': {'N': str(window_start + 2 * self.window)}, ':one': {'N': '1'}},
+                ReturnValues='UPDATED_NEW'
+            )
+            count = int(results['Attributes']['count']['N'])
+        except Exception as e:
+            logger.error("RateLimit->take: Error counting %s - %s", self.scope, e)
+            return 0
+
+        if count <= self.limit:
+            return 0
+
+        blocked_until = window_start + self.window
+
+        with self.lock:
+            bounded_set(self.blocked, key, blocked_until, self.maxsize)
+
+        return blocked_until - now
+
+    def blocked_for(self, key, now=None):
+        # Seconds left on a block this container already knows about, without any I/O
+        if self.limit <= 0:
+            return 0
+
+        now = time.time() if now is None else now
+
+        with self.lock:
+            blocked_until = self.blocked.get(key)
+
+        if blocked_until is not None and blocked_until > now:
+            return blocked_until - now
+
+        return 0
+
+class LoginLimiter:
+
+    def __init__(self, shared=RATE_LIMIT_SHARED, table_name=None):
+        table_name = table_name or os.environ.get('CACHE_NAME')
+
+        self.limits = []
+        for scope, rate, burst in (
+            ('ip', LOGIN_RATE_PER_IP, LOGIN_BURST_PER_IP),
+            ('deployment', LOGIN_RATE_PER_DEPLOYMENT, LOGIN_BURST_PER_DEPLOYMENT)
+        ):
+            self.limits.append((
+                scope,
+                TokenBucket(rate, burst),
+                SharedWindow(scope, rate, table_name) if shared else None
+            ))
+
+    def check(self, ip, deployment):
+        # Returns (scope, retry_after seconds) for a request to turn away, or None
+        keys = (ip, deployment)
+
+        for (scope, bucket, shared), key in zip(self.limits, keys):
+            wait = bucket.take(key)
+            if wait:
+                return scope, wait
+
+        # A key already known to be over its shared limit turns the request away before any
+        # counter is incremented for the other key
+        shared_limits = [(scope, shared, key) for (scope, bucket, shared), key in zip(self.limits, keys) if shared is not None]
+
+        for scope, shared, key in shared_limits:
+            wait = shared.blocked_for(key)
+            if wait:
+                return scope, wait
+
+        for scope, shared, key in shared_limits:
+            wait = shared.take(key)
+            if wait:
+                return scope, wait
+
+        return None
+
+login = LoginLimiter()
@@ -0,0 +1,65 @@
+import lti_claims
+import os
+import signed_token
+import time
+
+# Session tokens minted after a validated launch, so the tool can authenticate the user's
+# follow-up requests without another LTI launch. They are signed_token tokens with their own
+# purpose, keyed from SESSION_SECRET_ARN, holding the launch's key claims:
+#
+#   s sub   i iss   c client_id   d deployment_id   x context id   r roles   exp
+#
+# verify() needs only the key (read from Secrets Manager once per container) and an HMAC, with
+# no DynamoDB or JWKS access.
+
+SESSION_SECRET_ARN = os.environ.get('SESSION_SECRET_ARN')
+SESSION_TTL = int(os.environ.get('SESSION_TTL', '3600'))
+
+PURPOSE = 'session'
+
+# Short claim names in the token -> names handed back by verify()
+NAMES = {
+    's': 'sub',
+    'i': 'iss',
+    'c': 'client_id',
+    'd': 'deployment_id',
+    'x': 'context_id',
+    'r': 'roles',
+    'exp': 'exp'
+}
+
+def mint(jwt_body, key=None, ttl=SESSION_TTL, now=None):
+    # Returns (token, exp) for the verified id_token claims jwt_body
+    key = signed_token.load_key(SESSION_SECRET_ARN) if key is None else key
+    exp = int(time.time() if now is None else now) + ttl
+
+    claims = {
+        's': jwt_body.get('sub'),
+        'i': jwt_body.get('iss'),
+        'c': lti_claims.audience(jwt_body),
+        'd': jwt_body.get(lti_claims.DEPLOYMENT_ID_CLAIM),
+        'x': lti_claims.context_id(jwt_body),
+        'r': jwt_body.get(lti_claims.ROLES_CLAIM) or [],
+        'exp': exp
+    }
+
+    return signed_token.sign(claims, key, PURPOSE), exp
+
+def verify(token, key=None, now=None):
+    # Returns the session's claims by their full names, or None if the token is malformed,
+    # forged, expired or was minted for another purpose
+    key = signed_token.load_key(SESSION_SECRET_ARN) if key is None else key
+    claims = signed_token.verify(token, key, PURPOSE, now)
+
+    if claims is None:
+        return None
+
+    return {name: claims.get(short) for short, name in NAMES.items()}
+
+def bearer(headers):
+    # The token from an "Authorization: Bearer <token>" header, or None
+    for name, value in (headers or {}).items():
+        if name.lower() == 'authorization' and value[:7].lower() == 'bearer ':
+            return value[7:].strip()
+
+    return None
@@ -0,0 +1,67 @@
+import aws_clients
+import base64
+import hashlib
+import hmac
+import json
+import threading
+import time
+
+# Compact HMAC-SHA256 signed tokens: base64url(json claims) + '.' + base64url(mac).
+# The purpose is mixed into the MAC so a token minted for one use (e.g. login state)
+# can never be accepted for another.
+
+keys = {}
+keys_lock = threading.Lock()
+
+def load_key(secret_arn):
+    # Signing keys come from Secrets Manager once per container
+    key = keys.get(secret_arn)
+
+    if key is None:
+        with keys_lock:
+            key = keys.get(secret_arn)
+            if key is None:
+                response = aws_clients.client('secretsmanager').get_secret_value(SecretId=secret_arn)
+                key = response['SecretString'].encode('utf-8')
+                keys[secret_arn] = key
+
+    return key
+
+def b64url_encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+def b64url_decode(segment):
+    return base64.urlsafe_b64decode(segment + '=' * (-len(segment) % 4))
+
+def mac(key, purpose, payload):
+    return hmac.new(key, f"{purpose}.{payload}".encode('ascii'), hashlib.sha256).digest()
+
+def sign(claims, key, purpose):
+    payload = b64url_encode(json.dumps(claims, separators=(',', ':')).encode('utf-8'))
+    return f"{payload}.{b64url_encode(mac(key, purpose, payload))}"
+
+def verify(token, key, purpose, now=None):
+    # Returns the claims, or None if the token is malformed, forged or expired
+    if not isinstance(token, str) or token.count('.') != 1:
+        return None
+
+    payload, signature = token.split('.')
+
+    try:
+        if not hmac.compare_digest(b64url_decode(signature), mac(key, purpose, payload)):
+            return None
+
+        claims = json.loads(b64url_decode(payload))
+    except ValueError:
+        return None
+
+    if not isinstance(claims, dict):
+        return None
+
+    if now is None:
+        now = time.time()
+
+    if not isinstance(claims.get('exp'), int) or now >= claims['exp']:
+        return None
+
+    return claims
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import logging
+import metrics
+import os
+import random
+import sys
+import time
+
+# Logging helpers for the LTI functions.
+#
+# Log calls on the hot path use logging's own %-style arguments, so nothing is formatted
+# unless the record is actually emitted. Values that are expensive to render (pformat of an
+# event, a token digest) are wrapped in Lazy so that work also only happens on emit.
+#
+# Each request additionally writes one compact JSON line to stdout with its outcome and
+# timings (in EMF form when metrics are enabled, see metrics.py). DEBUG_SAMPLE_RATE turns on full debug logging for a random fraction of requests.
+
+DEBUG_SAMPLE_RATE = float(os.environ.get('DEBUG_SAMPLE_RATE', '0'))
+
+LEVELS = {
+    'DEBUG': logging.DEBUG,
+    'INFO': logging.INFO,
+    'WARN': logging.WARN,
+    'WARNING': logging.WARN,
+    'ERROR': logging.ERROR,
+}
+
+logger = logging.getLogger()
+
+def configure(log_level):
+    logger.setLevel(LEVELS.get(log_level, logging.INFO))
+    return logger
+
+class Lazy:
+
+    __slots__ = ('fn', 'args')
+
+    def __init__(self, fn, *args):
+        self.fn = fn
+        self.args = args
+
+    def __str__(self):
+        return str(self.fn(*self.args))
+
+def pretty(value):
+    from pprint import pformat
+    return pformat(value)
+
+def Pretty(value):
+    return Lazy(pretty, value)
+
+def token_digest(token):
+    # Enough to correlate a token across log lines without ever writing the token itself
+    if not token:
+        return '<empty>'
+    token = str(token)
+    return f"<{len(token)} chars sha256:{hashlib.sha256(token.encode('utf-8')).hexdigest()[:12]}>"
+
+def Redacted(token):
+    return Lazy(token_digest, token)
+
+def event_summary(event):
+    summary = {k: v for k, v in event.items() if k not in ('body', 'queryStringParameters', 'rawQueryString', 'cookies')}
+    if 'body' in event:
+        summary['body'] = token_digest(event['body'])
+    if event.get('queryStringParameters'):
+        summary['queryStringParameters'] = sorted(event['queryStringParameters'])
+    return pretty(summary)
+
+def Event(event):
+    return Lazy(event_summary, event)
+
+class RequestLog:
+
+    def __init__(self, function):
+        self.function = function
+        self.fields = {}
+        self.start = 0.0
+        self.restore_level = None
+
+    def begin(self, event, context):
+        self.start = time.perf_counter()
+        self.fields = {
+            'function': self.function,
+            'request_id': getattr(context, 'aws_request_id', None),
+            'route': event.get('routeKey'),
+            'ip': event.get('requestContext', {}).get('http', {}).get('sourceIp')
+        }
+
+        self.restore_level = None
+        if DEBUG_SAMPLE_RATE and not logger.isEnabledFor(logging.DEBUG) and random.random() < DEBUG_SAMPLE_RATE:
+            self.restore_level = logger.level
+            logger.setLevel(logging.DEBUG)
+            self.fields['debug_sampled'] = True
+
+        metrics.begin()
+        return self
+
+    def add(self, **fields):
+        self.fields.update(fields)
+
+    def end(self, response):
+        status = response.get('statusCode') if isinstance(response, dict) else None
+        self.fields['status'] = status
+        self.fields['ms'] = round((time.perf_counter() - self.start) * 1000, 2)
+
+        timings = metrics.end()
+        if timings is not None:
+            # Metrics are written regardless of LOG_LEVEL
+            line = metrics.document(self.fields, timings, self.fields['ms'])
+        elif logger.isEnabledFor(logging.INFO) or (status or 500) >= 500:
+            line = self.fields
+        else:
+            line = None
+
+        if line is not None:
+            sys.stdout.write(json.dumps(line, separators=(',', ':'), default=str) + '\n')
+
+        if self.restore_level is not None:
+            logger.setLevel(self.restore_level)
+            self.restore_level = None
+
+        return response
@@ -0,0 +1,220 @@
+import aws_clients
+import ddb_codec
+import hashlib
+import http_client
+import json
+import logging
+import os
+import threading
+import time
+from urllib import parse as urlparse
+import uuid
+
+# OAuth2 client-credentials access tokens for the LTI Advantage services (NRPS, AGS, Deep
+# Linking), requested from the platform's auth_token_url with a JWT client assertion signed by the
+# tool's private key (TOOL_KEY_SECRET_ARN, a JSON secret {"kid": ..., "private_key": <PEM>}).
+#
+# Tokens are cached per (issuer, client_id, scope set) until TOKEN_REFRESH_MARGIN seconds before
+# they expire: in memory, and in ltiCacheTable so every container shares them. Refreshes are
+# single-flight, within a container through a per-key lock and across containers through a
+# conditional lease on the shared item, so a burst of requests causes one token endpoint call.
+#
+# Signing needs the jwt library, which is imported on first use.
+
+TOKEN_REFRESH_MARGIN = int(os.environ.get('TOKEN_REFRESH_MARGIN', '60'))
+TOKEN_LEASE_SECONDS = int(os.environ.get('TOKEN_LEASE_SECONDS', '10'))
+TOKEN_WAIT_SECONDS = float(os.environ.get('TOKEN_WAIT_SECONDS', '5'))
+TOKEN_POLL_INTERVAL = float(os.environ.get('TOKEN_POLL_INTERVAL', '0.05'))
+TOOL_KEY_SECRET_ARN = os.environ.get('TOOL_KEY_SECRET_ARN')
+
+CLIENT_ASSERTION_TYPE = 'urn:ietf:params:oauth:client-assertion-type:jwt-bearer'
+
+logger = logging.getLogger()
+
+signing_keys = {}
+signing_keys_lock = threading.Lock()
+
+def load_signing_key(secret_arn):
+    # (kid, jwt key object), from Secrets Manager once per container
+    key = signing_keys.get(secret_arn)
+
+    if key is None:
+        with signing_keys_lock:
+            key = signing_keys.get(secret_arn)
+            if key is None:
+                import jwt
+                secret = json.loads(aws_clients.client('secretsmanager').get_secret_value(SecretId=secret_arn)['SecretString'])
+                key = (secret['kid'], jwt.jwk_from_pem(secret['private_key'].encode('utf-8')))
+                signing_keys[secret_arn] = key
+
+    return key
+
+def cache_key(issuer, client_id, scopes):
+    scope = ' '.join(sorted(set(scopes)))
+    digest = hashlib.sha256(f"{issuer}|{client_id}|{scope}".encode('utf-8')).hexdigest()
+    return f"token#{digest}", scope
+
+class TokenService:
+
+    def __init__(self, table_name, key_secret_arn=TOOL_KEY_SECRET_ARN, shared=True):
+        self.table_name = table_name
+        self.key_secret_arn = key_secret_arn
+        self.shared = shared and bool(table_name)
+        self.owner = uuid.uuid4().hex
+
+        # key -> (access_token, expires epoch seconds)
+        self.tokens = {}
+        self.key_locks = {}
+        self.lock = threading.Lock()
+
+        self.requests = 0
+
+    def usable(self, entry, now):
+        return entry is not None and entry[1] - TOKEN_REFRESH_MARGIN > now
+
+    def key_lock(self, key):
+        with self.lock:
+            lock = self.key_locks.get(key)
+            if lock is None:
+                lock = self.key_locks[key] = threading.Lock()
+            return lock
+
+    def access_token(self, config, scopes):
+        # config: a deployment config with iss, client_id and auth_token_url
+        key, scope = cache_key(config['iss'], config['client_id'], scopes)
+
+        entry = self.tokens.get(key)
+        if self.usable(entry, time.time()):
+            return entry[0]
+
+        with self.key_lock(key):
+            entry = self.tokens.get(key)
+            if self.usable(entry, time.time()):
+                return entry[0]
+
+            entry = self.load_shared(key) if self.shared else None
+
+            if entry is None:
+                entry = self.refresh(key, config, scope)
+
+            self.tokens[key] = entry
+            return entry[0]
+
+    def refresh(self, key, config, scope):
+        if self.shared:
+            deadline = time.time() + TOKEN_WAIT_SECONDS
+
+            # Another container holding the lease is fetching this token; wait for it to appear
+            while not self.acquire_lease(key):
+                time.sleep(TOKEN_POLL_INTERVAL)
+
+                entry = self.load_shared(key)
+                if entry is not None:
+                    return entry
+
+                if time.time() >= deadline:
+                    logger.error("TokenService->refresh: Gave up waiting for the token lease on %s", config['auth_token_url'])
+                    break
+
+        entry = self.request_token(config, scope)
+
+        if self.shared:
+            self.store_shared(key, entry)
+
+        return entry
+
+    def client_assertion(self, config):
+        import jwt
+
+        kid, signing_key = load_signing_key(self.key_secret_arn)
+        now = int(time.time())
+
+        return jwt.JWT().encode(
+            {
+                'iss': config['client_id'],
+                'sub': config['client_id'],
+                'aud': config['auth_token_url'],
+                'iat': now,
+                'exp': now + 300,
+                'jti': uuid.uuid4().hex
+            },
+            signing_key,
+            alg='RS256',
+            optional_headers={'kid': kid}
+        )
+
+    def request_token(self, config, scope):
+        self.requests += 1
+
+        r = http_client.request(
+            'POST',
+            config['auth_token_url'],
+            headers={'Content-Type': 'application/x-www-form-urlencoded', 'Accept': 'application/json'},
+            body=urlparse.urlencode({
+                'grant_type': 'client_credentials',
+                'client_assertion_type': CLIENT_ASSERTION_TYPE,
+                'client_assertion': self.client_assertion(config),
+                'scope': scope
+            }),
+            # A client-credentials grant can safely be asked for again
+            retry=True
+        )
+
+        if r.status != 200:
+            raise Exception(f"Token request to {config['auth_token_url']} returned HTTP {r.status}")
+
+        body = r.json()
+        return body['access_token'], int(time.time()) + int(body.get('expires_in', 3600))
+
+    def load_shared(self, key):
+        try:
+            results = aws_clients.client('dynamodb').get_item(
+                TableName=self.table_name,
+                Key={'key': {'S': key}},
+                ConsistentRead=True
+            )
+        except Exception as e:
+            logger.error("TokenService->load_shared: Error reading token - %s", e)
+            return None
+
+        item = ddb_codec.deserialize(results.get('Item', {}))
+        entry = (item.get('access_token'), item.get('token_expires', 0))
+
+        return entry if entry[0] and self.usable(entry, time.time()) else None
+
+    def acquire_lease(self, key):
+        now = int(time.time())
+
+        try:
+            aws_clients.client('dynamodb').update_item(
+                TableName=self.table_name,
+                Key={'key': {'S': key}},
+                UpdateExpression='SET #o = :o, #l = :l, #e = if_not_exists(#e, :l)',
+                ConditionExpression='attribute_not_exists(#l) OR #l < :now',
+                ExpressionAttributeNames={'#o': 'lease_owner', '#l': 'lease_until', '#e': 'expires_at'},
+                ExpressionAttributeValues=ddb_codec.serialize({':o': self.owner, ':l': now + TOKEN_LEASE_SECONDS, ':now': now})
+            )
+            return True
+        except Exception as e:
+            if aws_clients.error_code(e) == 'ConditionalCheckFailedException':
+                return False
+            # Without DynamoDB, fetch the token rather than fail the request
+            logger.error("TokenService->acquire_lease: Error taking lease - %s", e)
+            return True
+
+    def store_shared(self, key, entry):
+        try:
+            # Replaces the item, which also releases the lease
+            aws_clients.client('dynamodb').put_item(
+                TableName=self.table_name,
+                Item=ddb_codec.serialize({
+                    'key': key,
+                    'access_token': entry[0],
+                    'token_expires': entry[1],
+                    'expires_at': entry[1]
+                })
+            )
+        except Exception as e:
+            logger.error("TokenService->store_shared: Error storing token - %s", e)
+
+tokens = TokenService(os.environ.get('CACHE_NAME'))
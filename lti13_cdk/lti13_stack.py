@@ -25,11 +25,11 @@ from aws_cdk import (
     aws_ecs as ecs,
     aws_logs as logs,
     aws_ecs_patterns as ecs_patterns,
-    aws_elasticloadbalancingv2 as elbv2
+    aws_elasticloadbalancingv2 as elbv2,
+    aws_events as events,
+    aws_events_targets as targets
 )
 
-import json
-
 from Config import r53
 
 class Lti13Stack(cdk.Stack):
@@ -39,6 +39,43 @@ class Lti13Stack(cdk.Stack):
         super().__init__(scope, construct_id, **kwargs)
 
         log_level = "DEBUG"
+
+        # "table" keeps login state in ltiCacheTable, "signed" carries it in an HMAC-signed state value
+        state_mode = self.node.try_get_context("state_mode") or "table"
+
+        # "off" stops the functions writing per-stage latency metrics (EMF) to their logs
+        metrics_enabled = "false" if self.node.try_get_context("metrics") == "off" else "true"
+
+        # "on" overlaps the launch's config and JWKS lookups with the state lookup
+        prefetch = "true" if self.node.try_get_context("prefetch") == "on" else "false"
+
+        # Comma separated platform issuers; logins from any other issuer are rejected before any lookup
+        known_issuers = self.node.try_get_context("known_issuers") or ""
+
+        # "local" (default) rate limits logins per IP and per deployment in each container, "shared"
+        # also counts them across containers in ltiCacheTable, "off" disables it
+        login_rate_limit = self.node.try_get_context("login_rate_limit") or "local"
+
+        # ARN of an existing secret {"kid": ..., "private_key": <PEM>} holding the tool's private key,
+        # used to sign client assertions for LTI Advantage service access tokens
+        tool_key_secret_arn = self.node.try_get_context("tool_key_secret_arn")
+
+        # "off" drops the scheduled function that keeps platform key sets in ltiCacheTable for the
+        # launch function; warm_containers is how many launch containers it keeps warm
+        jwks_warmer = self.node.try_get_context("jwks_warmer") != "off"
+        warm_containers = str(self.node.try_get_context("warm_containers") or 1)
+
+        # "split" (default) deploys login and launch as separate functions, "router" as one function
+        # that routes on the request, so both share containers, caches and connection pools
+        function_mode = self.node.try_get_context("function_mode") or "split"
+
+        # "fargate" also runs the long-lived server (lambdas/server) on Fargate behind an ALB at
+        # lti-server.<domain>, for sustained launch traffic; server_tasks is its task count
+        server = self.node.try_get_context("server")
+        server_tasks = int(self.node.try_get_context("server_tasks") or 2)
+
+        # "sqs" writes an audit record of every launch, in compressed batches, to an SQS queue
+        audit_sink = self.node.try_get_context("audit") or "off"
         
         lti_config_table = _dynamo.Table(
             self, id="ltiConfigTable",
@@ -48,35 +85,26 @@ class Lti13Stack(cdk.Stack):
             encryption=_dynamo.TableEncryption.AWS_MANAGED
         )
 
+        # Lookup by issuer (and client_id) for platforms that leave out lti_deployment_id, and so a
+        # function can load all of an issuer's deployments with one query
+        config_index_name = "issuer-client_id-index"
+
+        lti_config_table.add_global_secondary_index(
+            index_name=config_index_name,
+            partition_key=_dynamo.Attribute(name="issuer", type=_dynamo.AttributeType.STRING),
+            sort_key=_dynamo.Attribute(name="client_id", type=_dynamo.AttributeType.STRING),
+            projection_type=_dynamo.ProjectionType.ALL
+        )
+
         lti_cache_table = _dynamo.Table(
             self, id="ltiCacheTable",
             table_name="ltiCacheTable",
             partition_key=_dynamo.Attribute(name="key", type=_dynamo.AttributeType.STRING),
+            time_to_live_attribute="expires_at",
             removal_policy=cdk.RemovalPolicy.DESTROY,
             encryption=_dynamo.TableEncryption.AWS_MANAGED
         )
 
-        # Set up the custom resource policy so we can populate the database upon creation
-        policy = _resources.AwsCustomResourcePolicy.from_sdk_calls(
-            resources=['*']
-        )
-
-        # Get the data to be added to the new table
-        data = self.get_initial_data()
-
-        # Create and execute custom resources to add data to the new table
-        for i in range(0,len(data)):
-            lti_config = _resources.AwsCustomResource (
-                self, 'initDBResource' + str(i), 
-                policy=policy,
-                on_create=_resources.AwsSdkCall(
-                    service='DynamoDB',
-                    action='putItem',
-                    parameters={ 'TableName': lti_config_table.table_name, 'Item': data[i] },
-                    physical_resource_id=_resources.PhysicalResourceId.of('initDBData' + str(i)),
-                ),
-            )
-        
         jwt_lambda_layer = lambpy.PythonLayerVersion(
             self, 'JwtLambdaLayer',
             entry='jwt',
@@ -85,41 +113,190 @@ class Lti13Stack(cdk.Stack):
             layer_version_name='JWTLambdaLayer'
         )
 
-        oidc_login_lambda = lambpy.PythonFunction(
-            self, "OIDCLambda",
-            entry="lambdas/oidc_login",
-            index="oidc_login.py",
-            runtime=_lambda.Runtime.PYTHON_3_8,
-            handler="lambda_handler",
-            timeout=cdk.Duration.seconds(10),
-            environment = {
-                'TABLE_NAME': lti_config_table.table_name,
-                'CACHE_NAME': lti_cache_table.table_name,
-                'LOG_LEVEL' : log_level
-            },
+        shared_lambda_layer = lambpy.PythonLayerVersion(
+            self, 'SharedLambdaLayer',
+            entry='lambdas/shared',
+            compatible_runtimes=[_lambda.Runtime.PYTHON_3_8],
+            description='Modules shared by the LTI functions',
+            layer_version_name='LTISharedLambdaLayer'
+        )
+
+        # Seed ltiConfigTable from lti.json with one custom resource, whatever the number of deployments
+        lti_config_asset = s3assets.Asset(
+            self, 'LTIConfigAsset',
+            path='lti.json'
         )
 
-        lti_validation_lambda =  lambpy.PythonFunction(
-            self, "LTIValidationLambda",
-            entry="lambdas/lti_validation",
-            index="lti_validation.py",
+        seed_config_lambda = lambpy.PythonFunction(
+            self, "SeedConfigLambda",
+            entry="lambdas/seed_config",
+            index="seed_config.py",
             runtime=_lambda.Runtime.PYTHON_3_8,
-            layers=[jwt_lambda_layer],
-            handler="lambda_handler",
-            timeout=cdk.Duration.seconds(10),
+            layers=[shared_lambda_layer],
+            handler="on_event",
+            timeout=cdk.Duration.minutes(5),
             environment = {
-                'TABLE_NAME': lti_config_table.table_name,
-                'CACHE_NAME': lti_cache_table.table_name,
                 'LOG_LEVEL' : log_level
             }
         )
 
+        lti_config_asset.grant_read(seed_config_lambda)
+        lti_config_table.grant_write_data(seed_config_lambda)
+
+        seed_config_provider = _resources.Provider(
+            self, 'SeedConfigProvider',
+            on_event_handler=seed_config_lambda
+        )
+
+        cdk.CustomResource(
+            self, 'SeedConfigResource',
+            service_token=seed_config_provider.service_token,
+            properties={
+                'TableName': lti_config_table.table_name,
+                'ConfigBucket': lti_config_asset.s3_bucket_name,
+                'ConfigKey': lti_config_asset.s3_object_key
+            }
+        )
+
+        login_environment = {
+            'TABLE_NAME': lti_config_table.table_name,
+            'CONFIG_INDEX_NAME': config_index_name,
+            'CACHE_NAME': lti_cache_table.table_name,
+            'STATE_MODE': state_mode,
+            'METRICS_ENABLED': metrics_enabled,
+            'KNOWN_ISSUERS': known_issuers,
+            'LOG_LEVEL' : log_level
+        }
+
+        launch_environment = dict(login_environment, PREFETCH=prefetch)
+
+        if function_mode == "router":
+            lti_router_lambda = lambpy.PythonFunction(
+                self, "LTIRouterLambda",
+                entry="lambdas",
+                index="router.py",
+                runtime=_lambda.Runtime.PYTHON_3_8,
+                layers=[jwt_lambda_layer, shared_lambda_layer],
+                handler="lambda_handler",
+                timeout=cdk.Duration.seconds(10),
+                environment=launch_environment
+            )
+
+            # Everything below that configures either function configures the router
+            oidc_login_lambda = lti_validation_lambda = lti_router_lambda
+        else:
+            oidc_login_lambda = lambpy.PythonFunction(
+                self, "OIDCLambda",
+                entry="lambdas/oidc_login",
+                index="oidc_login.py",
+                runtime=_lambda.Runtime.PYTHON_3_8,
+                layers=[shared_lambda_layer],
+                handler="lambda_handler",
+                timeout=cdk.Duration.seconds(10),
+                environment=login_environment
+            )
+
+            lti_validation_lambda =  lambpy.PythonFunction(
+                self, "LTIValidationLambda",
+                entry="lambdas/lti_validation",
+                index="lti_validation.py",
+                runtime=_lambda.Runtime.PYTHON_3_8,
+                layers=[jwt_lambda_layer, shared_lambda_layer],
+                handler="lambda_handler",
+                timeout=cdk.Duration.seconds(10),
+                environment=launch_environment
+            )
+
+        if login_rate_limit == "off":
+            oidc_login_lambda.add_environment('LOGIN_RATE_PER_IP', '0')
+            oidc_login_lambda.add_environment('LOGIN_RATE_PER_DEPLOYMENT', '0')
+        elif login_rate_limit == "shared":
+            oidc_login_lambda.add_environment('RATE_LIMIT_SHARED', 'true')
+
         lti_config_table.grant_read_data(oidc_login_lambda)
         lti_config_table.grant_read_data(lti_validation_lambda)
 
         lti_cache_table.grant_full_access(oidc_login_lambda)
         lti_cache_table.grant_full_access(lti_validation_lambda)
 
+        if state_mode == "signed":
+            state_secret = secretsmanager.Secret(
+                self, "LTIStateSecret",
+                description="HMAC key for signed LTI login state",
+                generate_secret_string=secretsmanager.SecretStringGenerator(
+                    password_length=64,
+                    exclude_punctuation=True
+                )
+            )
+
+            for function in (oidc_login_lambda, lti_validation_lambda):
+                function.add_environment('STATE_SECRET_ARN', state_secret.secret_arn)
+                state_secret.grant_read(function)
+
+        # HMAC key for the session tokens returned by successful launches; tool backends that verify
+        # them need read access to it too
+        session_secret = secretsmanager.Secret(
+            self, "LTISessionSecret",
+            description="HMAC key for LTI launch session tokens",
+            generate_secret_string=secretsmanager.SecretStringGenerator(
+                password_length=64,
+                exclude_punctuation=True
+            )
+        )
+
+        lti_validation_lambda.add_environment('SESSION_SECRET_ARN', session_secret.secret_arn)
+        session_secret.grant_read(lti_validation_lambda)
+
+        cdk.CfnOutput(self, "Session Secret", value=session_secret.secret_arn)
+
+        if tool_key_secret_arn:
+            tool_key_secret = secretsmanager.Secret.from_secret_complete_arn(self, "ToolKeySecret", tool_key_secret_arn)
+            lti_validation_lambda.add_environment('TOOL_KEY_SECRET_ARN', tool_key_secret.secret_arn)
+            tool_key_secret.grant_read(lti_validation_lambda)
+
+        if audit_sink == "sqs":
+            audit_queue = sqs.Queue(
+                self, "LTIAuditQueue",
+                retention_period=cdk.Duration.days(14),
+                encryption=sqs.QueueEncryption.KMS_MANAGED
+            )
+
+            lti_validation_lambda.add_environment('AUDIT_SINK', 'sqs')
+            lti_validation_lambda.add_environment('AUDIT_QUEUE_URL', audit_queue.queue_url)
+            audit_queue.grant_send_messages(lti_validation_lambda)
+
+            cdk.CfnOutput(self, "Audit Queue", value=audit_queue.queue_url)
+
+        if jwks_warmer:
+            jwks_warmer_lambda = lambpy.PythonFunction(
+                self, "JwksWarmerLambda",
+                entry="lambdas/jwks_warmer",
+                index="jwks_warmer.py",
+                runtime=_lambda.Runtime.PYTHON_3_8,
+                layers=[shared_lambda_layer],
+                handler="lambda_handler",
+                timeout=cdk.Duration.minutes(1),
+                environment = {
+                    'TABLE_NAME': lti_config_table.table_name,
+                    'CACHE_NAME': lti_cache_table.table_name,
+                    'WARM_FUNCTION_NAME': lti_validation_lambda.function_name,
+                    'WARM_CONTAINERS': warm_containers,
+                    'LOG_LEVEL' : log_level
+                }
+            )
+
+            lti_config_table.grant_read_data(jwks_warmer_lambda)
+            lti_cache_table.grant_read_write_data(jwks_warmer_lambda)
+            lti_validation_lambda.grant_invoke(jwks_warmer_lambda)
+
+            lti_validation_lambda.add_environment('JWKS_SHARED', 'true')
+
+            events.Rule(
+                self, "JwksWarmerSchedule",
+                schedule=events.Schedule.rate(cdk.Duration.minutes(5)),
+                targets=[targets.LambdaFunction(jwks_warmer_lambda)]
+            )
+
         hosted_zone = route53.HostedZone.from_hosted_zone_attributes(
             self, 'BbDevConZone',
             hosted_zone_id=r53['LTI_TOOL_HOSTED_ZONE'],
@@ -193,23 +370,56 @@ class Lti13Stack(cdk.Stack):
         cdk.CfnOutput(self, "GET OIDC Login Endpoint: ", value=get_oidc_login_route.path)
         cdk.CfnOutput(self, "POST OIDC Login Endpoint: ", value=post_oidc_login_route.path)
         cdk.CfnOutput(self, "LTI Launch Endpoint: ", value=lti_tool_validation_route.path)
-    
-    def get_initial_data(self):
-
-        with open('lti.json') as json_file:
-            dataset = json.load(json_file)
-            
-            data = []
-
-            for deployment in dataset['deployments']:
-                data.append({
-                    'deployment_id': { 'S': deployment['deployment_id'] },
-                    'client_id': { 'S': deployment['client_id'] },
-                    'issuer': { 'S': deployment['issuer'] },
-                    'auth_login_url': { 'S': deployment['auth_login_url'] },
-                    'auth_token_url': { 'S': deployment['auth_token_url'] },
-                    'key_set_url': { 'S': deployment['key_set_url'] },
-                    'default': { 'BOOL': deployment['default'] }
-                })
-        
-        return data
\ No newline at end of file
+
+        if server == "fargate":
+            # Same settings as the launch function, which also serves logins in router mode
+            server_environment = dict(launch_environment, SESSION_SECRET_ARN=session_secret.secret_arn)
+
+            if state_mode == "signed":
+                server_environment['STATE_SECRET_ARN'] = state_secret.secret_arn
+            if jwks_warmer:
+                server_environment['JWKS_SHARED'] = 'true'
+            if tool_key_secret_arn:
+                server_environment['TOOL_KEY_SECRET_ARN'] = tool_key_secret.secret_arn
+            if login_rate_limit == "off":
+                server_environment.update(LOGIN_RATE_PER_IP='0', LOGIN_RATE_PER_DEPLOYMENT='0')
+            elif login_rate_limit == "shared":
+                server_environment['RATE_LIMIT_SHARED'] = 'true'
+            if audit_sink == "sqs":
+                server_environment.update(AUDIT_SINK='sqs', AUDIT_QUEUE_URL=audit_queue.queue_url)
+
+            lti_server = ecs_patterns.ApplicationLoadBalancedFargateService(
+                self, "LTIServer",
+                cpu=1024,
+                memory_limit_mib=2048,
+                desired_count=server_tasks,
+                domain_name=f"lti-server.{r53['LTI_TOOL_DOMAIN_NAME']}",
+                domain_zone=hosted_zone,
+                protocol=elbv2.ApplicationProtocol.HTTPS,
+                redirect_http=True,
+                task_image_options=ecs_patterns.ApplicationLoadBalancedTaskImageOptions(
+                    image=ecs.ContainerImage.from_asset("lambdas", file="server/Dockerfile"),
+                    container_port=8080,
+                    environment=server_environment,
+                    log_driver=ecs.LogDrivers.aws_logs(
+                        stream_prefix="lti-server",
+                        log_retention=logs.RetentionDays.ONE_MONTH
+                    )
+                )
+            )
+
+            lti_server.target_group.configure_health_check(path="/health")
+
+            task_role = lti_server.task_definition.task_role
+            lti_config_table.grant_read_data(task_role)
+            lti_cache_table.grant_full_access(task_role)
+            session_secret.grant_read(task_role)
+
+            if state_mode == "signed":
+                state_secret.grant_read(task_role)
+            if tool_key_secret_arn:
+                tool_key_secret.grant_read(task_role)
+            if audit_sink == "sqs":
+                audit_queue.grant_send_messages(task_role)
+
+            cdk.CfnOutput(self, "Server URL", value=f"https://lti-server.{r53['LTI_TOOL_DOMAIN_NAME']}")
@@ -48,6 +48,8 @@ setuptools.setup(
         f"aws-cdk.aws-ecs-patterns=={cdk_ver}",
         f"aws-cdk.aws-elasticloadbalancingv2=={cdk_ver}",
         f"aws-cdk.aws-ecr-assets=={cdk_ver}",
+        f"aws-cdk.aws-events=={cdk_ver}",
+        f"aws-cdk.aws-events-targets=={cdk_ver}",
     ],
 
     python_requires=">=3.6",
@@ -0,0 +1,52 @@
+# Shared setup for the tests: the function modules are imported from lambdas/ as Lambda would
+# (shared layer on the path) and talk to the in-memory AWS stand-ins in benchmarks/local_aws.py
+# instead of AWS.
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+for path in ('benchmarks', 'tools', 'lambdas', 'lambdas/shared', 'lambdas/oidc_login', 'lambdas/lti_validation', 'lambdas/seed_config', 'lambdas/jwks_warmer', 'lambdas/server'):
+    sys.path.insert(0, os.path.join(ROOT, path))
+
+# Read by the function modules at import
+os.environ.update({
+    'TABLE_NAME': 'ltiConfigTable',
+    'CONFIG_INDEX_NAME': 'issuer-client_id-index',
+    'CACHE_NAME': 'ltiCacheTable',
+    'LOG_LEVEL': 'INFO',
+    'STATE_MODE': 'table',
+    'LOGIN_RATE_PER_IP': '0',
+    'LOGIN_RATE_PER_DEPLOYMENT': '0',
+    'AWS_DEFAULT_REGION': 'us-east-1'
+})
+
+import aws_clients
+import config_cache
+import deployment_index
+import local_aws
+
+
+@pytest.fixture
+def dynamodb(monkeypatch):
+    db = local_aws.FakeDynamoDB()
+    aws_clients.clients['dynamodb'] = db
+
+    # Deployments cached from another test's table would outlive it
+    monkeypatch.setattr(config_cache, 'deployments', config_cache.ConfigCache('deployments'))
+    if deployment_index.deployments is not None:
+        monkeypatch.setattr(deployment_index, 'deployments', deployment_index.DeploymentIndex(
+            deployment_index.deployments.table_name, deployment_index.CONFIG_INDEX_NAME))
+
+    yield db
+    aws_clients.clients.pop('dynamodb', None)
+
+
+@pytest.fixture
+def s3():
+    bucket = local_aws.FakeS3()
+    aws_clients.clients['s3'] = bucket
+    yield bucket
+    aws_clients.clients.pop('s3', None)
@@ -0,0 +1,89 @@
+# Launch audit records written to a FileSink: exactly one per launch, including refused ones,
+# and in Lambda the extension thread writes a due batch once the handler has called
+# end_invocation, not before.
+import contextlib
+import io
+import signal
+
+import pytest
+
+import audit
+import lti_validation
+import oidc_login
+from bench_audit import ExtensionsApi, read_records
+from bench_launch_flow import DEPLOYMENT_ID, LambdaContext, config_item, launch_event, login_event
+from fake_platform import FakePlatform, JwksServer
+
+
+@pytest.fixture(scope='module')
+def platform():
+    platform = FakePlatform()
+    server = JwksServer(platform)
+    yield platform, server
+    server.close()
+
+
+def launches(dynamodb, platform, count):
+    # Returns the request ids of count launches, each followed by a replay of its form
+    platform, server = platform
+    dynamodb.seed('ltiConfigTable', config_item(server.url))
+    request_ids = []
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(count):
+            login = oidc_login.lambda_handler(login_event(), LambdaContext())
+            form = platform.authorize(login['headers']['Location'], deployment_id=DEPLOYMENT_ID)
+
+            for status in (200, 401):
+                context = LambdaContext()
+                assert lti_validation.lambda_handler(launch_event(form), context)['statusCode'] == status
+                request_ids.append(context.aws_request_id)
+
+    return request_ids
+
+
+def test_each_launch_writes_one_record(dynamodb, platform, tmp_path, monkeypatch):
+    path = str(tmp_path / 'audit.jsonl.gz')
+    audit_log = audit.AuditLog(audit.FileSink(path), batch_records=4)
+    monkeypatch.setattr(audit, 'log', audit_log)
+
+    request_ids = launches(dynamodb, platform, 5)
+    audit_log.flush()
+
+    records = read_records(path)
+    assert sorted(r['request_id'] for r in records) == sorted(request_ids)
+    assert [r['outcome'] for r in records].count('launched') == 5
+    # The replays are refused at the state lookup, before the token says who the user is
+    for record in records:
+        if record['outcome'] == 'launched':
+            assert record['deployment_id'] == DEPLOYMENT_ID and record['sub'] and record['context_id']
+        else:
+            assert record['status'] == 401 and record['sub'] is None
+    assert audit_log.sent == 10 and audit_log.dropped == 0
+
+
+def test_extension_flushes_after_end_invocation(tmp_path, monkeypatch):
+    path = str(tmp_path / 'audit.jsonl.gz')
+    api = ExtensionsApi()
+    audit_log = audit.AuditLog(audit.FileSink(path), batch_records=2)
+
+    # Not pytest's SIGTERM handler
+    monkeypatch.setattr(signal, 'signal', lambda *args: None)
+    assert audit_log.register_extension(api.address)
+
+    try:
+        for i in range(2):
+            api.invoke(f'request-{i}')
+            audit_log.add({'request_id': f'request-{i}'})
+
+            # The extension holds the invocation open until the handler is done with it
+            assert not api.waiting.wait(0.2)
+            assert audit_log.flusher is None
+
+            audit_log.end_invocation(f'request-{i}')
+            assert api.waiting.wait(5)
+
+            # The batch is written once it is due, before the invocation completes
+            assert [r['request_id'] for r in read_records(path)] == ([] if i == 0 else ['request-0', 'request-1'])
+    finally:
+        api.server.shutdown()
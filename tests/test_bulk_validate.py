@@ -0,0 +1,78 @@
+# Offline re-validation of captured id_tokens (tools/bulk_validate.py): deployments resolve the
+# way a login resolves them, and every capture line gets its result once with one key set fetch
+# per platform.
+import json
+
+import pytest
+
+import bulk_validate
+from bench_bulk_validate import check, corpus, run_tool, write_capture
+from fake_platform import CLIENT_ID, DEPLOYMENT_ID, FakePlatform, JwksServer
+
+ISSUER = 'https://platform.example.com'
+
+
+def row(deployment_id, client_id='client', issuer=ISSUER, default=False):
+    return {'deployment_id': deployment_id, 'client_id': client_id, 'issuer': issuer, 'key_set_url': f'{issuer}/jwks.json',
+            'auth_login_url': '', 'auth_token_url': '', 'default': default}
+
+
+def test_deployments_match_like_a_login():
+    deployments = bulk_validate.Deployments([
+        row('d-1'), row('d-2', default=True), row('d-3', client_id='only'), row('d-4', client_id='many'), row('d-5', client_id='many')
+    ])
+
+    assert deployments.find(ISSUER, 'client', 'd-1')['deployment_id'] == 'd-1'
+    # Without a deployment_id: the client's default, or its only deployment
+    assert deployments.find(ISSUER, 'client', None)['deployment_id'] == 'd-2'
+    assert deployments.find(ISSUER, 'only', None)['deployment_id'] == 'd-3'
+    assert deployments.find(ISSUER, 'many', None) is None
+
+    assert deployments.find(ISSUER, 'client', 'd-3') is None
+    assert deployments.find(ISSUER, 'nobody', 'd-1') is None
+    assert deployments.find('https://other.example.com', 'client', 'd-1') is None
+    assert deployments.queries == 0
+
+
+def test_tokens_are_read_from_json_or_bare_lines():
+    lines = ['{"id_token": "a.b.c"}', '', '"d.e.f"', '{"id_token": 42}', 'g.h.i', '{broken']
+
+    assert list(bulk_validate.read_tokens(lines, 'id_token')) == [(1, 'a.b.c'), (3, 'd.e.f'), (4, None), (5, 'g.h.i'), (6, None)]
+
+
+def test_time_modes():
+    assert bulk_validate.check_time({'iat': 100}, 'now') is None
+    assert bulk_validate.check_time({'iat': 100}, 'iat') == 100
+    assert bulk_validate.check_time({}, 'iat') is None
+    assert bulk_validate.check_time({'iat': 100}, '250') == 250.0
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_capture_is_validated(tmp_path, workers):
+    first = FakePlatform()
+    second = FakePlatform(issuer='https://canvas.example.com', kid='canvas-key')
+    rotated = FakePlatform(kid='platform-key-2')
+    first.jwks['keys'].append(rotated.jwks['keys'][0])
+    rotated.issuer = first.issuer
+
+    servers = [JwksServer(first), JwksServer(second)]
+    second_mint = second.mint_id_token
+    second.mint_id_token = lambda **kwargs: second_mint(**dict({'deployment_id': DEPLOYMENT_ID + '-canvas'}, **kwargs))
+
+    config = str(tmp_path / 'lti.json')
+    with open(config, 'w') as f:
+        json.dump({'deployments': [
+            dict(row(DEPLOYMENT_ID, CLIENT_ID, first.issuer, True), key_set_url=servers[0].url),
+            dict(row(DEPLOYMENT_ID + '-canvas', CLIENT_ID, second.issuer), key_set_url=servers[1].url)
+        ]}, f)
+
+    try:
+        capture, output = str(tmp_path / 'capture.jsonl'), str(tmp_path / 'results.jsonl')
+        expected = write_capture(capture, corpus((first, second, rotated), 30), 300)
+        run_tool(capture, config, output, workers)
+
+        assert check(output, expected) == (True, 0, 0)
+        assert [server.requests for server in servers] == [1, 1]
+    finally:
+        for server in servers:
+            server.close()
@@ -0,0 +1,66 @@
+# Deployment lookups through the issuer index: answered from memory after one Query per issuer,
+# counted as hits, misses and negative hits, with the hit ratio logged like config_cache does.
+import json
+import logging
+
+import deployment_index
+
+TABLE = 'ltiConfigTable'
+INDEX = 'issuer-client_id-index'
+ISSUER = 'https://platform.example.com'
+
+
+def seed(dynamodb, count=3):
+    for i in range(count):
+        dynamodb.seed(TABLE, {
+            'deployment_id': f'deployment-{i}',
+            'client_id': 'client',
+            'issuer': ISSUER,
+            'auth_login_url': 'https://platform.example.com/auth',
+            'auth_token_url': 'https://platform.example.com/token',
+            'key_set_url': 'https://platform.example.com/jwks.json',
+            'default': i == 0
+        })
+
+
+def counts(index):
+    stats = index.stats()
+    return stats['hits'], stats['misses'], stats['negative_hits']
+
+
+def test_lookups_are_counted(dynamodb):
+    seed(dynamodb)
+    index = deployment_index.DeploymentIndex(TABLE, INDEX, report_every=0)
+
+    assert index.find(ISSUER, 'client', 'deployment-1')['deployment_id'] == 'deployment-1'
+    assert counts(index) == (0, 1, 0)
+
+    assert index.find(ISSUER, 'client', 'deployment-2')['deployment_id'] == 'deployment-2'
+    assert index.find(ISSUER, 'client')['deployment_id'] == 'deployment-0'
+    assert counts(index) == (2, 1, 0)
+
+    # Unknown deployment of a loaded issuer, within the reload interval: no Query
+    assert index.find(ISSUER, 'client', 'not-a-deployment') is None
+    assert counts(index) == (2, 1, 1)
+
+    # Unknown issuer: one Query, then remembered
+    assert index.find('https://scanner.example.com', 'client', 'x') is None
+    assert index.find('https://scanner.example.com', 'client', 'y') is None
+    assert counts(index) == (2, 2, 2)
+
+    assert dynamodb.calls == {'Query': 2}
+    assert index.stats()['hit_ratio'] == round(4 / 6, 4)
+    assert index.stats()['size'] == 3
+
+
+def test_hit_ratio_is_reported(dynamodb, caplog):
+    seed(dynamodb)
+    index = deployment_index.DeploymentIndex(TABLE, INDEX, report_every=4)
+
+    with caplog.at_level(logging.INFO):
+        for _ in range(8):
+            index.find(ISSUER, 'client', 'deployment-0')
+
+    reports = [json.loads(r.getMessage()) for r in caplog.records if r.getMessage().startswith('{"cache": "deployment_index"')]
+    assert [(r['hits'], r['misses']) for r in reports] == [(3, 1), (7, 1)]
+    assert reports[-1]['hit_ratio'] == 0.875
@@ -0,0 +1,87 @@
+# The shared http_client against a local HTTPS JWKS stand-in: one keep-alive TLS connection
+# across launches, 304 revalidation from the stored response, retried 503s and followed 301s.
+import logging
+
+import pytest
+
+import http_client
+import lti_util
+from fake_platform import FakePlatform, JwksServer
+
+
+@pytest.fixture(scope='module')
+def platform():
+    return FakePlatform()
+
+
+@pytest.fixture
+def server(request, platform, monkeypatch):
+    # request.param: how many requests the stand-in answers with a 503 first
+    server = JwksServer(platform, tls=True, fail_first=getattr(request, 'param', 0))
+    monkeypatch.setattr(http_client, 'pool', http_client.new_pool(ca_certs=server.ca_file))
+    monkeypatch.setattr(http_client, 'response_cache', {})
+    monkeypatch.setattr(http_client, 'HTTP_BACKOFF', 0.01)
+    yield server
+    http_client.pool.clear()
+    server.close()
+
+
+def fetch(url):
+    # A fresh lti_util per fetch, as each launch makes its own
+    return lti_util.lti_util(logging.getLogger(), 'client', url).fetch_jwks()
+
+
+def test_launches_share_one_tls_connection(server):
+    for _ in range(6):
+        assert 'platform-key-1' in fetch(server.url)['keys']
+
+    assert server.requests == 6
+    assert server.connections == 1
+
+
+def test_not_modified_returns_the_stored_body(server):
+    first = http_client.request('GET', server.url, revalidate=True)
+    second = http_client.request('GET', server.url, revalidate=True)
+
+    assert first.status == second.status == 200
+    assert not first.cached and second.cached
+    assert second.data == first.data
+    assert second.json()['keys'][0]['kid'] == 'platform-key-1'
+    assert second.headers['ETag'] == first.headers['ETag']
+    assert server.not_modified == 1
+
+
+def test_without_revalidate_the_body_is_fetched(server):
+    http_client.request('GET', server.url, revalidate=True)
+    r = http_client.request('GET', server.url)
+
+    assert r.status == 200 and not r.cached
+    assert server.not_modified == 0
+
+
+@pytest.mark.parametrize('server', [1], indirect=True)
+def test_unavailable_is_retried_then_served(server):
+    assert 'platform-key-1' in fetch(server.url)['keys']
+    assert server.requests == 2
+
+
+@pytest.mark.parametrize('server', [http_client.HTTP_RETRIES + 1], indirect=True)
+def test_retries_are_bounded(server):
+    r = http_client.request('GET', server.url)
+
+    assert r.status == 503
+    assert server.requests == http_client.HTTP_RETRIES + 1
+
+
+@pytest.mark.parametrize('server', [1], indirect=True)
+def test_retry_can_be_turned_off(server):
+    r = http_client.request('GET', server.url, retry=False)
+
+    assert r.status == 503
+    assert server.requests == 1
+
+
+def test_moved_key_set_is_followed(server):
+    assert 'platform-key-1' in fetch(server.moved_url)['keys']
+    assert server.redirects == 1
+    assert server.connections == 1
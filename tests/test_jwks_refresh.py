@@ -0,0 +1,94 @@
+# Platform key set refreshes in lti_util: one fetch per key_set_url at a time, which concurrent
+# launches with a new kid wait for, and a rate limit only for kids the last fetch didn't have.
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+import pytest
+
+import lti_util
+from fake_platform import FakePlatform, JwksServer
+
+LAUNCHES = 5
+
+
+@pytest.fixture
+def platform():
+    platform = FakePlatform()
+    server = JwksServer(platform, latency=0.2)
+    lti_util.jwks_cache.clear()
+    lti_util.jwks_fetches.clear()
+    yield platform, server
+    server.close()
+
+
+def cache(server, platform, expires_in, fetched_ago):
+    now = time.monotonic()
+    lti_util.jwks_cache[server.url] = {
+        'keys': {key['kid']: key for key in platform.jwks['keys']},
+        'expires': now + expires_in,
+        'fetched': now - fetched_ago
+    }
+
+
+def lookup(server, kid):
+    return lti_util.lti_util(logging.getLogger(), 'client', server.url).get_public_key(kid)
+
+
+def concurrent_lookups(server, kid):
+    with ThreadPoolExecutor(LAUNCHES) as pool:
+        return list(pool.map(lambda _: lookup(server, kid), range(LAUNCHES)))
+
+
+def test_rotated_kid_is_fetched_once_for_concurrent_launches(platform):
+    platform, server = platform
+    cache(server, platform, expires_in=300, fetched_ago=60)
+    platform.rotate('platform-key-2')
+
+    keys = concurrent_lookups(server, 'platform-key-2')
+
+    assert all(key is not None and key['kid'] == 'platform-key-2' for key in keys)
+    assert server.requests == 1
+
+
+def test_new_kid_waits_for_background_refresh(platform):
+    platform, server = platform
+    cache(server, platform, expires_in=-1, fetched_ago=60)
+    platform.rotate('platform-key-2')
+
+    # A launch with the old kid starts the background refresh of the stale set
+    assert lookup(server, 'platform-key-1') is not None
+    assert server.url in lti_util.jwks_fetches
+
+    keys = concurrent_lookups(server, 'platform-key-2')
+
+    assert all(key is not None and key['kid'] == 'platform-key-2' for key in keys)
+    assert server.requests == 1
+
+
+def test_unknown_kid_is_rate_limited_after_fetch(platform):
+    platform, server = platform
+    cache(server, platform, expires_in=300, fetched_ago=60)
+
+    assert concurrent_lookups(server, 'not-a-kid') == [None] * LAUNCHES
+    assert server.requests == 1
+
+    # The fetch that just completed didn't have it either
+    assert lookup(server, 'not-a-kid') is None
+    assert server.requests == 1
+
+
+def test_failed_fetch_releases_waiters(platform):
+    platform, server = platform
+    cache(server, platform, expires_in=300, fetched_ago=60)
+    server.fail_first = 100
+    platform.rotate('platform-key-2')
+
+    done = threading.Event()
+    keys = []
+    threading.Thread(target=lambda: (keys.extend(concurrent_lookups(server, 'platform-key-2')), done.set())).start()
+
+    assert done.wait(30)
+    assert keys == [None] * LAUNCHES
+    assert server.url not in lti_util.jwks_fetches
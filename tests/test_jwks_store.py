@@ -0,0 +1,100 @@
+# Platform key sets shared through ltiCacheTable: the scheduled warmer revalidates them with the
+# stored ETag, a cold launch container reads them with one GetItem, and only a kid the stored
+# set lacks sends a container to the platform.
+import logging
+import time
+
+import pytest
+
+import http_client
+import jwks_store
+import jwks_warmer
+import lti_util
+from bench_launch_flow import config_item
+from fake_platform import FakePlatform, JwksServer
+
+CACHE = 'ltiCacheTable'
+
+
+@pytest.fixture
+def platform(dynamodb, monkeypatch):
+    platform = FakePlatform()
+    server = JwksServer(platform)
+    dynamodb.seed('ltiConfigTable', config_item(server.url))
+    monkeypatch.setattr(lti_util, 'JWKS_STORE_TABLE', CACHE)
+    yield platform, server
+    lti_util.jwks_cache.pop(server.url, None)
+    server.close()
+
+
+def test_max_age():
+    assert jwks_store.max_age({'Cache-Control': 'public, max-age=600'}) == 600
+    assert jwks_store.max_age({'Cache-Control': 'no-cache'}) == 0
+    assert jwks_store.max_age({'Cache-Control': 'max-age=soon'}) == jwks_store.JWKS_DEFAULT_TTL
+    assert jwks_store.max_age({}) == jwks_store.JWKS_DEFAULT_TTL
+
+
+def test_version_only_changes_with_the_keys(dynamodb):
+    url = 'https://platform.example.com/jwks.json'
+    keys = {'keys': [{'kid': 'a', 'kty': 'RSA', 'n': 'n', 'e': 'AQAB'}]}
+
+    assert jwks_store.save(CACHE, url, keys, '"1"', 300, now=1000)
+    assert not jwks_store.save(CACHE, url, keys, '"1"', 600, now=2000)
+
+    item = jwks_store.load(CACHE, url)
+    assert item['jwks'] == keys
+    assert (item['version'], item['fetched_at'], item['max_age']) == (1, 2000, 600)
+
+    assert jwks_store.save(CACHE, url, {'keys': keys['keys'] * 2}, '"2"', 300, now=3000)
+    assert jwks_store.load(CACHE, url)['version'] == 2
+    assert jwks_store.load(CACHE, 'https://other.example.com/jwks.json') is None
+
+
+def test_warmer_revalidates_with_the_stored_etag(platform):
+    platform, server = platform
+
+    assert jwks_warmer.lambda_handler({}, None) == {'changed': 1, 'unchanged': 0, 'failed': 0}
+    assert jwks_warmer.lambda_handler({}, None) == {'changed': 0, 'unchanged': 1, 'failed': 0}
+    assert server.not_modified == 1
+
+    platform.rotate('platform-key-2')
+    assert jwks_warmer.lambda_handler({}, None) == {'changed': 1, 'unchanged': 0, 'failed': 0}
+    assert [key['kid'] for key in jwks_store.load(CACHE, server.url)['jwks']['keys']] == ['platform-key-1', 'platform-key-2']
+
+
+def test_failing_platform_keeps_the_stored_set(platform, monkeypatch):
+    platform, server = platform
+    jwks_warmer.lambda_handler({}, None)
+    monkeypatch.setattr(http_client, 'HTTP_BACKOFF', 0.01)
+    server.fail_first = http_client.HTTP_RETRIES + 1
+
+    assert jwks_warmer.lambda_handler({}, None) == {'changed': 0, 'unchanged': 0, 'failed': 1}
+    assert jwks_store.load(CACHE, server.url) is not None
+
+
+def test_cold_container_reads_the_stored_set(platform):
+    platform, server = platform
+    jwks_warmer.lambda_handler({}, None)
+    requests = server.requests
+
+    lti = lti_util.lti_util(logging.getLogger(), 'client', server.url)
+
+    assert lti.get_public_key('platform-key-1')['kid'] == 'platform-key-1'
+    assert server.requests == requests
+
+
+def test_new_kid_is_fetched_and_shared(platform):
+    platform, server = platform
+    jwks_warmer.lambda_handler({}, None)
+    platform.rotate('platform-key-2')
+    requests = server.requests
+
+    lti = lti_util.lti_util(logging.getLogger(), 'client', server.url)
+
+    assert lti.get_public_key('platform-key-2')['kid'] == 'platform-key-2'
+    assert server.requests == requests + 1
+
+    # Written back for the other containers
+    stored = jwks_store.load(CACHE, server.url)
+    assert stored['version'] == 2
+    assert stored['fetched_at'] <= time.time()
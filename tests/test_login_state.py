@@ -0,0 +1,50 @@
+# Login state in ltiCacheTable: written once by oidc_login.cache_value and consumed at most once
+# by lti_validation.get_cache_data.
+import time
+
+import lti_validation
+import oidc_login
+
+LOGIN = {
+    'client_id': 'test-client-id',
+    'lti_deployment_id': 'test-deployment-id',
+    'iss': 'https://platform.example.com',
+    'lti_message_hint': 'hint'
+}
+
+
+def test_first_consume_returns_state(dynamodb):
+    oidc_login.cache_value('state-1', LOGIN, 'nonce-1', '203.0.113.10')
+
+    item = lti_validation.get_cache_data('state-1')
+
+    assert item['client_id'] == 'test-client-id'
+    assert item['lti_deployment_id'] == 'test-deployment-id'
+    assert item['iss'] == 'https://platform.example.com'
+    assert item['launch_id'] == 'nonce-1'
+    assert item['ip'] == '203.0.113.10'
+
+
+def test_second_consume_is_refused(dynamodb):
+    oidc_login.cache_value('state-1', LOGIN, 'nonce-1', '203.0.113.10')
+
+    assert lti_validation.get_cache_data('state-1') is not None
+    assert lti_validation.get_cache_data('state-1') is None
+    assert dynamodb.tables['ltiCacheTable'] == {}
+
+
+def test_expired_state_is_refused(dynamodb):
+    dynamodb.seed('ltiCacheTable', dict(
+        LOGIN,
+        key='state-1',
+        launch_id='nonce-1',
+        ip='203.0.113.10',
+        expires_at=int(time.time()) - 1
+    ))
+
+    assert lti_validation.get_cache_data('state-1') is None
+
+
+def test_missing_state_is_refused(dynamodb):
+    assert lti_validation.get_cache_data('never-issued') is None
+    assert dynamodb.calls == {'DeleteItem': 1}
@@ -0,0 +1,73 @@
+# Per-stage latency as CloudWatch EMF: each request writes one JSON line to stdout, with an _aws
+# block describing its metrics unless METRICS_ENABLED is off.
+import contextlib
+import io
+import json
+
+import pytest
+
+import lti_validation
+import metrics
+import oidc_login
+from bench_launch_flow import DEPLOYMENT_ID, LambdaContext, config_item, launch_event, login_event
+from fake_platform import FakePlatform, JwksServer
+
+
+@pytest.fixture(scope='module')
+def platform():
+    platform = FakePlatform()
+    server = JwksServer(platform)
+    yield platform, server
+    server.close()
+
+
+def request_lines(dynamodb, platform):
+    # The JSON lines a login followed by its launch write to stdout
+    platform, server = platform
+    dynamodb.seed('ltiConfigTable', config_item(server.url))
+    stdout = io.StringIO()
+
+    with contextlib.redirect_stdout(stdout):
+        login = oidc_login.lambda_handler(login_event(), LambdaContext())
+        form = platform.authorize(login['headers']['Location'], deployment_id=DEPLOYMENT_ID)
+        launch = lti_validation.lambda_handler(launch_event(form), LambdaContext())
+
+    assert login['statusCode'] == 302
+    assert launch['statusCode'] == 200
+
+    lines = [json.loads(line) for line in stdout.getvalue().splitlines() if line.startswith('{')]
+    return {line['function']: line for line in lines}
+
+
+def emf_metrics(line):
+    directive = line['_aws']['CloudWatchMetrics'][0]
+    return directive, {metric['Name'] for metric in directive['Metrics']}
+
+
+def test_login_and_launch_write_emf(dynamodb, platform):
+    lines = request_lines(dynamodb, platform)
+    login, launch = lines['oidc_login'], lines['lti_validation']
+
+    for line in (login, launch):
+        directive, names = emf_metrics(line)
+        assert directive['Namespace'] == metrics.METRICS_NAMESPACE
+        assert directive['Dimensions'] == [['function', 'outcome'], ['function', 'deployment_id']]
+        assert line['deployment_id'] == DEPLOYMENT_ID
+        assert line['outcome']
+        assert isinstance(line['_aws']['Timestamp'], int)
+        # Every metric named in the directive is a number on the line
+        assert all(isinstance(line[name], (int, float)) for name in names)
+
+    assert {'config', 'store_state', 'duration'} <= emf_metrics(login)[1]
+    assert {'parse', 'state', 'config', 'process_launch', 'jwks', 'verify', 'duration'} <= emf_metrics(launch)[1]
+
+
+def test_metrics_disabled_drops_emf(dynamodb, platform, monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_ENABLED', False)
+
+    lines = request_lines(dynamodb, platform)
+
+    for line in lines.values():
+        assert '_aws' not in line
+        assert 'duration' not in line
+        assert line['status'] in (200, 302)
@@ -0,0 +1,102 @@
+# Replay protection for id_token nonces: the per-container Bloom filter turns a replay away
+# without I/O, the conditional write in ltiCacheTable across containers, and concurrent first
+# uses of one nonce admit exactly one launch.
+from concurrent.futures import ThreadPoolExecutor
+import math
+import uuid
+
+import pytest
+
+import aws_clients
+import local_aws
+import nonce_guard
+
+CACHE = 'ltiCacheTable'
+
+
+def nonces(count):
+    return [uuid.uuid4().hex for _ in range(count)]
+
+
+def test_replay_is_refused_locally(dynamodb):
+    guard = nonce_guard.NonceGuard(CACHE)
+
+    assert guard.first_use('nonce-1', 2000000000)
+    assert not guard.first_use('nonce-1', 2000000000)
+
+    # The replay never reached DynamoDB
+    assert dynamodb.calls == {'PutItem': 1}
+    assert dynamodb.tables[CACHE]['nonce#nonce-1']['expires_at'] == {'N': '2000000000'}
+
+
+def test_replay_is_refused_across_containers(dynamodb):
+    first = nonce_guard.NonceGuard(CACHE)
+    second = nonce_guard.NonceGuard(CACHE)
+
+    assert first.first_use('nonce-1')
+    assert not second.first_use('nonce-1')
+
+    # The container that hit the conditional write remembers the nonce from then on
+    assert not second.first_use('nonce-1')
+    assert dynamodb.calls == {'PutItem': 2}
+
+
+def test_concurrent_first_uses_admit_one(monkeypatch):
+    monkeypatch.setitem(aws_clients.clients, 'dynamodb', local_aws.FakeDynamoDB(latency=0.002))
+    guards = [nonce_guard.NonceGuard(CACHE) for _ in range(4)]
+    attempts = [(nonce, guards[i % len(guards)]) for nonce in nonces(20) for i in range(8)]
+
+    with ThreadPoolExecutor(32) as pool:
+        results = list(pool.map(lambda attempt: (attempt[0], attempt[1].first_use(attempt[0])), attempts))
+
+    admitted = {}
+    for nonce, first in results:
+        admitted[nonce] = admitted.get(nonce, 0) + first
+
+    assert sorted(set(admitted.values())) == [1]
+
+
+def test_write_errors_are_raised(monkeypatch):
+    class Failing:
+        def put_item(self, **kwargs):
+            raise RuntimeError('throttled')
+
+    monkeypatch.setitem(aws_clients.clients, 'dynamodb', Failing())
+    guard = nonce_guard.NonceGuard(CACHE)
+
+    with pytest.raises(RuntimeError):
+        guard.first_use('nonce-1')
+
+    # Not remembered, so a retry is checked again
+    assert not guard.local.seen('nonce-1')
+
+
+@pytest.mark.parametrize('error_rate', [0.01, 0.001])
+def test_false_positive_rate(error_rate):
+    capacity, probes = 10000, 100000
+    bloom = nonce_guard.BloomFilter(capacity, error_rate)
+
+    for nonce in nonces(capacity):
+        bloom.add(bloom.positions(nonce))
+
+    observed = sum(bloom.contains(bloom.positions(nonce)) for nonce in nonces(probes)) / probes
+
+    assert observed <= 2 * error_rate
+
+
+def test_configured_filter_is_sized_for_its_error_rate():
+    # NONCE_FILTER_ERROR is too small to measure here; check the expected rate of a full filter
+    bloom = nonce_guard.BloomFilter(nonce_guard.NONCE_FILTER_CAPACITY, nonce_guard.NONCE_FILTER_ERROR)
+    expected = (1 - math.exp(-bloom.hashes * nonce_guard.NONCE_FILTER_CAPACITY / bloom.bits)) ** bloom.hashes
+
+    assert expected <= 1.5 * nonce_guard.NONCE_FILTER_ERROR
+
+
+def test_windowed_filter_keeps_the_last_window():
+    window = nonce_guard.WindowedFilter(window=3600, capacity=1000, error_rate=0.001)
+    added = nonces(2500)
+
+    for nonce in added:
+        window.add(nonce)
+
+    assert all(window.seen(nonce) for nonce in added[-1000:])
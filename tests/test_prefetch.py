@@ -0,0 +1,83 @@
+# PREFETCH=true: the launch's deployment config and platform key are looked up from the
+# unverified id_token while the state is read. The launch comes out the same, the config is
+# read once, and a prefetch for another deployment than the state's is not used.
+import contextlib
+import io
+
+import pytest
+
+import lti_claims
+import lti_util
+import lti_validation
+import oidc_login
+import prevalidate
+from bench_launch_flow import DEPLOYMENT_ID, LambdaContext, config_item, launch_event, login_event
+from fake_platform import FakePlatform, JwksServer
+
+
+@pytest.fixture(scope='module')
+def platform():
+    platform = FakePlatform()
+    server = JwksServer(platform)
+    yield platform, server
+    server.close()
+
+
+@pytest.fixture
+def prefetch(dynamodb, platform, monkeypatch):
+    monkeypatch.setattr(lti_validation, 'PREFETCH', True)
+    monkeypatch.delitem(lti_util.jwks_cache, platform[1].url, raising=False)
+    dynamodb.seed('ltiConfigTable', config_item(platform[1].url))
+    return dynamodb
+
+
+def login(platform):
+    with contextlib.redirect_stdout(io.StringIO()):
+        response = oidc_login.lambda_handler(login_event(), LambdaContext())
+    return platform[0].authorize(response['headers']['Location'], deployment_id=DEPLOYMENT_ID)
+
+
+def launch(form):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return lti_validation.lambda_handler(launch_event(form), LambdaContext())
+
+
+def test_prefetched_launch(prefetch, platform):
+    form = login(platform)
+    prefetch.calls.clear()
+    requests = platform[1].requests
+
+    assert launch(form)['statusCode'] == 200
+
+    # The deployment's issuer was already loaded by the login; one key set fetch, by the prefetch
+    assert prefetch.calls == {'DeleteItem': 1}
+    assert platform[1].requests == requests + 1
+
+
+def test_invalid_state_is_still_refused(prefetch, platform):
+    form = dict(login(platform), state='0123abcd-0123-4567-89ab-0123456789ab')
+
+    response = launch(form)
+
+    assert response['statusCode'] == 401
+    assert response['body'] == 'Invalid state parameter. You no hax0r!'
+
+
+def test_prefetch_for_another_deployment_is_not_used(prefetch, platform):
+    parsed = lti_util.parse_jwt(platform[0].mint_id_token(deployment_id=DEPLOYMENT_ID))
+    started = lti_validation.start_prefetch(parsed)
+
+    assert started[0] == DEPLOYMENT_ID
+    assert lti_validation.prefetched_config(started, DEPLOYMENT_ID)['key_set_url'] == platform[1].url
+    assert lti_validation.prefetched_config(started, 'another-deployment') is None
+
+
+def test_no_prefetch_for_unusable_tokens(prefetch, platform, monkeypatch):
+    assert lti_validation.start_prefetch(None) is None
+
+    claims = platform[0].launch_claims()
+    del claims[lti_claims.DEPLOYMENT_ID_CLAIM]
+    assert lti_validation.start_prefetch(({}, claims)) is None
+
+    monkeypatch.setattr(prevalidate, 'KNOWN_ISSUERS', frozenset({'https://elsewhere.example.com'}))
+    assert lti_validation.start_prefetch(lti_util.parse_jwt(platform[0].mint_id_token())) is None
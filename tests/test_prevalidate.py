@@ -0,0 +1,48 @@
+# Structural checks ahead of any I/O. Unknown issuers are only turned away here when
+# KNOWN_ISSUERS is set; otherwise they pass and cost a deployment Query.
+import prevalidate
+
+LOGIN = {
+    'iss': 'https://platform.example.com',
+    'client_id': 'client',
+    'login_hint': 'hint',
+    'target_link_uri': 'https://lti.example.com/launch'
+}
+
+
+def login(**params):
+    return dict(LOGIN, **params)
+
+
+def test_valid_login_passes():
+    assert prevalidate.login_error(login()) is None
+
+
+def test_malformed_login_is_rejected():
+    assert prevalidate.login_error({}) == 'Missing login parameters'
+    assert prevalidate.login_error(login(login_hint='')) == 'Missing login_hint'
+    assert prevalidate.login_error(login(iss='http://platform.example.com')) == 'Invalid iss'
+    assert prevalidate.login_error(login(login_hint='A' * (prevalidate.MAX_PARAM_LENGTH + 1))) == 'login_hint too long'
+
+
+def test_any_issuer_passes_without_known_issuers(monkeypatch):
+    monkeypatch.setattr(prevalidate, 'KNOWN_ISSUERS', frozenset())
+
+    assert prevalidate.login_error(login(iss='https://0123456789.example.com')) is None
+
+
+def test_unknown_issuer_is_rejected_with_known_issuers(monkeypatch):
+    monkeypatch.setattr(prevalidate, 'KNOWN_ISSUERS', frozenset({'https://platform.example.com'}))
+
+    assert prevalidate.login_error(login()) is None
+    assert prevalidate.login_error(login(iss='https://0123456789.example.com')) == 'Unknown iss'
+    assert not prevalidate.issuer_allowed('https://platform.example.com/other')
+
+
+def test_malformed_launch_is_rejected():
+    assert prevalidate.launch_body_error('') == 'Missing body'
+    assert prevalidate.launch_body_error('A' * (prevalidate.MAX_LAUNCH_BODY + 1)) == 'Body too large'
+    assert prevalidate.launch_error({'state': 'x'}, 'table') == 'Missing id_token or state'
+    assert prevalidate.launch_error({'id_token': '@@@.###.$$$', 'state': 'x'}, 'table') == 'Malformed id_token'
+    assert prevalidate.launch_error({'id_token': 'a.b.c', 'state': 'err'}, 'table') == 'Malformed state'
+    assert prevalidate.launch_error({'id_token': 'a.b.c', 'state': '0123abcd-0123-4567-89ab-0123456789ab'}, 'table') is None
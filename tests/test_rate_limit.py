@@ -0,0 +1,73 @@
+# Login admission control: in-memory token buckets per container, and fixed-window counters in
+# ltiCacheTable shared across containers once RATE_LIMIT_SHARED is on.
+import time
+
+import rate_limit
+
+CACHE = 'ltiCacheTable'
+
+
+def limiter(monkeypatch, per_ip=20, per_deployment=200):
+    monkeypatch.setattr(rate_limit, 'LOGIN_RATE_PER_IP', per_ip)
+    monkeypatch.setattr(rate_limit, 'LOGIN_BURST_PER_IP', per_ip)
+    monkeypatch.setattr(rate_limit, 'LOGIN_RATE_PER_DEPLOYMENT', per_deployment)
+    monkeypatch.setattr(rate_limit, 'LOGIN_BURST_PER_DEPLOYMENT', per_deployment)
+    return rate_limit.LoginLimiter(shared=True, table_name=CACHE)
+
+
+def shared_window(limiter, scope):
+    return next(shared for name, bucket, shared in limiter.limits if name == scope)
+
+
+def test_bucket_refills_at_its_rate():
+    bucket = rate_limit.TokenBucket(rate=2, burst=2)
+
+    assert bucket.take('ip', now=0) == 0
+    assert bucket.take('ip', now=0) == 0
+    assert bucket.take('ip', now=0) == 0.5
+    assert bucket.take('ip', now=0.5) == 0
+
+
+def test_shared_window_is_counted_across_containers(dynamodb):
+    # 2 logins per minute
+    first = rate_limit.SharedWindow('deployment', 2 / 60, CACHE, window=60)
+    second = rate_limit.SharedWindow('deployment', 2 / 60, CACHE, window=60)
+
+    assert first.take('dep', now=120) == 0
+    assert second.take('dep', now=121) == 0
+    assert first.take('dep', now=122) == 58
+
+    # Blocked until the window ends without asking DynamoDB again
+    assert first.take('dep', now=130) == 50
+    assert first.blocked_for('dep', now=130) == 50
+    assert dynamodb.calls == {'UpdateItem': 3}
+
+    assert first.take('dep', now=180) == 0
+
+
+def test_known_block_skips_counters_for_other_keys(dynamodb, monkeypatch):
+    login = limiter(monkeypatch)
+    shared_window(login, 'deployment').blocked['dep'] = time.time() + 60
+
+    scope, wait = login.check('203.0.113.10', 'dep')
+
+    assert scope == 'deployment'
+    assert 0 < wait <= 60
+    assert dynamodb.calls == {}
+
+
+def test_admitted_login_counts_each_key(dynamodb, monkeypatch):
+    login = limiter(monkeypatch)
+
+    assert login.check('203.0.113.10', 'dep') is None
+    assert dynamodb.calls == {'UpdateItem': 2}
+
+
+def test_counter_errors_fail_open(monkeypatch):
+    class Failing:
+        def update_item(self, **kwargs):
+            raise RuntimeError('throttled')
+
+    monkeypatch.setitem(rate_limit.aws_clients.clients, 'dynamodb', Failing())
+
+    assert limiter(monkeypatch).check('203.0.113.10', 'dep') is None
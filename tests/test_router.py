@@ -0,0 +1,70 @@
+# Single-function mode: lambdas/router.py serves /login and /launch from one function by routeKey,
+# sends keep-warm calls to the launch handler and always hands the audit extension its turn.
+import contextlib
+import io
+
+import pytest
+
+import audit
+import router
+from bench_launch_flow import DEPLOYMENT_ID, LambdaContext, config_item, launch_event, login_event
+from fake_platform import FakePlatform, JwksServer
+
+
+@pytest.fixture(scope='module')
+def platform():
+    platform = FakePlatform()
+    server = JwksServer(platform)
+    yield platform, server
+    server.close()
+
+
+@pytest.fixture
+def ended(monkeypatch):
+    contexts = []
+    monkeypatch.setattr(audit, 'end_invocation', contexts.append)
+    return contexts
+
+
+def handle(event):
+    context = LambdaContext()
+    with contextlib.redirect_stdout(io.StringIO()):
+        return router.lambda_handler(event, context), context
+
+
+def test_login_and_launch_are_routed(dynamodb, platform, ended):
+    platform, server = platform
+    dynamodb.seed('ltiConfigTable', config_item(server.url))
+
+    login, login_context = handle(login_event())
+    assert login['statusCode'] == 302
+
+    form = platform.authorize(login['headers']['Location'], deployment_id=DEPLOYMENT_ID)
+    launch, launch_context = handle(launch_event(form))
+    assert launch['statusCode'] == 200
+
+    # Once by the router, and once more by the launch handler itself, which is harmless
+    assert ended.count(login_context) == 1
+    assert ended.count(launch_context) == 2
+
+
+def test_unknown_route_is_not_found(ended):
+    response, context = handle(dict(login_event(), routeKey='GET /admin'))
+
+    assert response['statusCode'] == 404
+    assert ended == [context]
+
+
+def test_warmer_calls_go_to_the_launch_handler(ended):
+    response, context = handle({'warmer': True, 'key_set_urls': []})
+
+    assert response == {'warmed': True, 'loaded': 0}
+
+
+def test_invocation_ends_when_a_handler_raises(ended, monkeypatch):
+    monkeypatch.setitem(router.ROUTES, 'GET /boom', 'no_such_module')
+
+    with pytest.raises(ImportError):
+        handle(dict(login_event(), routeKey='GET /boom'))
+
+    assert len(ended) == 1
@@ -0,0 +1,111 @@
+# The seed_config custom resource: Create writes every deployment in lti.json, Update writes
+# only what changed and deletes what was removed, Delete removes the file's deployments.
+import json
+
+import ddb_codec
+import seed_config
+
+BUCKET = 'cdk-assets'
+TABLE = 'ltiConfigTable'
+
+
+def deployment(i, **changes):
+    return dict({
+        'deployment_id': f'deployment-{i}',
+        'client_id': f'client-{i}',
+        'issuer': 'https://platform.example.com',
+        'auth_login_url': 'https://platform.example.com/auth',
+        'auth_token_url': 'https://platform.example.com/token',
+        'key_set_url': 'https://platform.example.com/jwks.json',
+        'default': i == 0
+    }, **changes)
+
+
+def upload(s3, key, deployments):
+    s3.put(BUCKET, key, json.dumps({'deployments': deployments}).encode('utf-8'))
+    return {'TableName': TABLE, 'ConfigBucket': BUCKET, 'ConfigKey': key}
+
+
+def table(dynamodb):
+    return {key: ddb_codec.deserialize(item) for key, item in dynamodb.tables[TABLE].items()}
+
+
+def event(request_type, properties, old_properties=None):
+    event = {'RequestType': request_type, 'ResourceProperties': properties}
+    if request_type != 'Create':
+        event['PhysicalResourceId'] = f'{TABLE}-seed'
+    if old_properties is not None:
+        event['OldResourceProperties'] = old_properties
+    return event
+
+
+def test_create_writes_every_deployment_in_batches(dynamodb, s3):
+    deployments = [deployment(i) for i in range(60)]
+
+    result = seed_config.on_event(event('Create', upload(s3, 'v1.json', deployments)), None)
+
+    assert result == {'PhysicalResourceId': f'{TABLE}-seed', 'Data': {'Written': 60, 'Deleted': 0}}
+    assert table(dynamodb) == {d['deployment_id']: d for d in deployments}
+    assert dynamodb.calls == {'BatchWriteItem': 3}
+
+
+def test_update_writes_changes_and_deletes_removed(dynamodb, s3):
+    before = [deployment(i) for i in range(30)]
+    old = upload(s3, 'v1.json', before)
+    seed_config.on_event(event('Create', old), None)
+
+    # 0-9 unchanged, 10-19 changed, 20-29 removed, 30-34 added
+    after = before[:10] + [deployment(i, key_set_url='https://platform.example.com/rotated.json') for i in range(10, 20)]
+    after += [deployment(i) for i in range(30, 35)]
+
+    result = seed_config.on_event(event('Update', upload(s3, 'v2.json', after), old), None)
+
+    assert result['Data'] == {'Written': 15, 'Deleted': 10}
+    assert table(dynamodb) == {d['deployment_id']: d for d in after}
+
+
+def test_update_without_previous_file_deletes_nothing(dynamodb, s3):
+    dynamodb.seed(TABLE, deployment(99))
+    old = {'TableName': TABLE, 'ConfigBucket': BUCKET, 'ConfigKey': 'gone.json'}
+
+    result = seed_config.on_event(event('Update', upload(s3, 'v2.json', [deployment(0)]), old), None)
+
+    assert result['Data'] == {'Written': 1, 'Deleted': 0}
+    assert set(table(dynamodb)) == {'deployment-0', 'deployment-99'}
+
+
+def test_update_to_a_new_table_writes_everything(dynamodb, s3):
+    deployments = [deployment(i) for i in range(5)]
+    old = dict(upload(s3, 'v1.json', deployments), TableName='oldConfigTable')
+
+    result = seed_config.on_event(event('Update', upload(s3, 'v1.json', deployments), old), None)
+
+    assert result['Data'] == {'Written': 5, 'Deleted': 0}
+    assert len(table(dynamodb)) == 5
+
+
+def test_delete_removes_the_file_deployments(dynamodb, s3):
+    properties = upload(s3, 'v1.json', [deployment(i) for i in range(3)])
+    seed_config.on_event(event('Create', properties), None)
+    dynamodb.seed(TABLE, deployment(99))
+
+    result = seed_config.on_event(event('Delete', properties), None)
+
+    assert result == {'PhysicalResourceId': f'{TABLE}-seed'}
+    assert set(table(dynamodb)) == {'deployment-99'}
+
+
+def test_delete_never_fails_the_stack_delete(dynamodb, s3):
+    properties = {'TableName': TABLE, 'ConfigBucket': BUCKET, 'ConfigKey': 'gone.json'}
+
+    assert seed_config.on_event(event('Delete', properties), None) == {'PhysicalResourceId': f'{TABLE}-seed'}
+
+
+def test_unprocessed_items_are_retried(dynamodb, s3):
+    deployments = [deployment(i) for i in range(25)]
+    dynamodb.unprocessed_batches = 3
+
+    seed_config.on_event(event('Create', upload(s3, 'v1.json', deployments)), None)
+
+    assert len(table(dynamodb)) == 25
+    assert dynamodb.calls == {'BatchWriteItem': 4}
@@ -0,0 +1,127 @@
+# The long-running server mode: lambdas/server/lti_server.py turns HTTP/1.1 keep-alive requests
+# into API Gateway events for the router and renders the handlers' responses. Served here by one
+# asyncio loop in a thread instead of forked workers.
+import asyncio
+import base64
+import contextlib
+import http.client
+import io
+import socket
+import threading
+from urllib import parse as urlparse
+
+import pytest
+
+import lti_server
+from bench_launch_flow import CLIENT_ID, DEPLOYMENT_ID, ISSUER, config_item
+from fake_platform import FakePlatform, JwksServer
+
+LOGIN_QUERY = urlparse.urlencode({
+    'iss': ISSUER,
+    'login_hint': 'student',
+    'lti_message_hint': 'launch',
+    'target_link_uri': 'https://lti.example.com/launch',
+    'lti_deployment_id': DEPLOYMENT_ID,
+    'client_id': CLIENT_ID
+})
+
+
+@pytest.fixture(scope='module')
+def platform():
+    platform = FakePlatform()
+    server = JwksServer(platform)
+    yield platform, server
+    server.close()
+
+
+@pytest.fixture
+def port(dynamodb, platform):
+    dynamodb.seed('ltiConfigTable', config_item(platform[1].url))
+
+    sock = socket.create_server(('127.0.0.1', 0))
+    started = threading.Event()
+    running = {}
+
+    async def serve():
+        running['loop'], running['stop'] = asyncio.get_running_loop(), asyncio.Event()
+        server = await asyncio.start_server(
+            lti_server.connection_handler(lti_server.preload()), sock=sock, limit=lti_server.SERVER_MAX_HEADER)
+        started.set()
+
+        async with server:
+            await running['stop'].wait()
+
+    thread = threading.Thread(target=asyncio.run, args=(serve(),), daemon=True)
+    thread.start()
+    started.wait(5)
+
+    # The handlers' request lines go to stdout
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield sock.getsockname()[1]
+
+    running['loop'].call_soon_threadsafe(running['stop'].set)
+    thread.join(5)
+
+
+def test_event_shape():
+    event = lti_server.make_event('POST', '/launch?a=1', {'x-forwarded-for': '198.51.100.1, 203.0.113.10'}, b'state=s', '10.0.0.5')
+
+    assert event['routeKey'] == 'POST /launch'
+    assert event['queryStringParameters'] == {'a': '1'}
+    assert event['requestContext']['http']['sourceIp'] == '203.0.113.10'
+    assert base64.b64decode(event['body']) == b'state=s'
+    assert lti_server.make_event('GET', '/login', {}, b'', '10.0.0.5')['requestContext']['http']['sourceIp'] == '10.0.0.5'
+
+
+def test_flow_over_one_connection(port, platform):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+
+    conn.request('GET', '/login?' + LOGIN_QUERY)
+    login = conn.getresponse()
+    login.read()
+    assert login.status == 302
+
+    form = platform[0].authorize(login.getheader('Location'), deployment_id=DEPLOYMENT_ID)
+    conn.request('POST', '/launch', urlparse.urlencode(form), {'Content-Type': 'application/x-www-form-urlencoded'})
+    launch = conn.getresponse()
+    body = launch.read()
+
+    assert launch.status == 200
+    assert launch.getheader('Content-Type') == 'application/json'
+    assert b'"claims"' in body
+    assert launch.getheader('Connection') == 'keep-alive'
+    conn.close()
+
+
+def test_health_and_unknown_routes(port):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+
+    conn.request('GET', '/health')
+    r = conn.getresponse()
+    assert (r.status, r.read()) == (200, b'OK')
+
+    conn.request('GET', '/admin')
+    r = conn.getresponse()
+    assert (r.status, r.read()) == (404, b'Not found')
+    conn.close()
+
+
+def raw(port, request):
+    with socket.create_connection(('127.0.0.1', port)) as s:
+        s.sendall(request)
+        s.shutdown(socket.SHUT_WR)
+        return b''.join(iter(lambda: s.recv(65536), b''))
+
+
+def test_malformed_requests_are_refused(port):
+    assert raw(port, b'POST /launch HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n').startswith(b'HTTP/1.1 411 ')
+    assert raw(port, b'POST /launch HTTP/1.1\r\nContent-Length: %d\r\n\r\n' % (lti_server.SERVER_MAX_BODY + 1)).startswith(b'HTTP/1.1 413 ')
+    assert raw(port, b'GARBAGE\r\n\r\n').startswith(b'HTTP/1.1 400 ')
+    assert raw(port, b'GET / HTTP/1.1\r\nX: ' + b'a' * lti_server.SERVER_MAX_HEADER + b'\r\n\r\n').startswith(b'HTTP/1.1 431 ')
+
+
+def test_connection_close_is_honoured(port):
+    response = raw(port, b'GET /health HTTP/1.1\r\nConnection: close\r\n\r\n')
+
+    assert response.startswith(b'HTTP/1.1 200 OK\r\n')
+    assert b'Connection: close\r\n' in response
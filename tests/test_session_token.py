@@ -0,0 +1,84 @@
+# Session tokens minted after a launch: verified with the key alone, and refused when tampered
+# with, expired, signed with another key or minted for another purpose.
+import lti_claims
+import session_token
+import signed_token
+from fake_platform import FakePlatform
+
+KEY = b'session-key'
+NOW = 1700000000
+
+
+def mint(**kwargs):
+    claims = FakePlatform().launch_claims(**kwargs)
+    token, exp = session_token.mint(claims, key=KEY, ttl=600, now=NOW)
+    return token, exp, claims
+
+
+def test_round_trip():
+    token, exp, claims = mint()
+
+    session = session_token.verify(token, key=KEY, now=NOW + 1)
+
+    assert exp == NOW + 600
+    assert session == {
+        'sub': claims['sub'],
+        'iss': claims['iss'],
+        'client_id': claims['aud'],
+        'deployment_id': claims[lti_claims.DEPLOYMENT_ID_CLAIM],
+        'context_id': claims[lti_claims.CONTEXT_CLAIM]['id'],
+        'roles': claims[lti_claims.ROLES_CLAIM],
+        'exp': exp
+    }
+
+
+def test_list_audience_uses_first_client():
+    claims = FakePlatform().launch_claims()
+    claims['aud'] = ['client-a', 'client-b']
+    token, exp = session_token.mint(claims, key=KEY, now=NOW)
+
+    assert session_token.verify(token, key=KEY, now=NOW)['client_id'] == 'client-a'
+
+
+def test_tampered_token_is_refused():
+    token, exp, claims = mint()
+    payload, signature = token.split('.')
+
+    forged = signed_token.b64url_encode(signed_token.b64url_decode(payload).replace(b'"r":[', b'"r":["Administrator",'))
+    assert forged != payload
+
+    assert session_token.verify(f"{forged}.{signature}", key=KEY, now=NOW) is None
+    assert session_token.verify(f"{payload}.{signature[:-2]}AA", key=KEY, now=NOW) is None
+    assert session_token.verify(token, key=b'another-key', now=NOW) is None
+
+
+def token_without_claims():
+    return signed_token.sign(['not', 'a', 'dict'], KEY, session_token.PURPOSE)
+
+
+def test_malformed_token_is_refused():
+    for token in (None, '', 'no-dot', 'a.b.c', '!!!.???', token_without_claims()):
+        assert session_token.verify(token, key=KEY, now=NOW) is None
+
+
+def test_expired_token_is_refused():
+    token, exp, claims = mint()
+
+    assert session_token.verify(token, key=KEY, now=exp - 1) is not None
+    assert session_token.verify(token, key=KEY, now=exp) is None
+    assert session_token.verify(token, key=KEY, now=exp + 3600) is None
+
+
+def test_token_for_another_purpose_is_refused():
+    token, exp, claims = mint()
+    state = signed_token.sign({'exp': NOW + 600}, KEY, 'state')
+
+    assert signed_token.verify(token, KEY, 'state', NOW) is None
+    assert session_token.verify(state, key=KEY, now=NOW) is None
+
+
+def test_bearer_header():
+    assert session_token.bearer({'Authorization': 'Bearer abc.def'}) == 'abc.def'
+    assert session_token.bearer({'authorization': 'bearer  abc.def '}) == 'abc.def'
+    assert session_token.bearer({'authorization': 'Basic abc'}) is None
+    assert session_token.bearer(None) is None
@@ -0,0 +1,70 @@
+# Synthesizes the stack for lti.json files of different sizes: ltiConfigTable is seeded by one
+# custom resource, so the template must not grow with the number of deployments.
+#
+# Needs the CDK packages from setup.py. Lambda bundling is skipped, but aws-lambda-python still
+# builds its bundling image when a PythonFunction is created, so Docker must be available too.
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip('aws_cdk.core')
+
+if shutil.which(os.environ.get('CDK_DOCKER', 'docker')) is None:
+    pytest.skip('aws-lambda-python needs Docker to create its functions', allow_module_level=True)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in the project directory given as argv[1], like app.py; prints the template. Config.py is
+# written per installation from ConfigTemplate.py.
+SYNTH = """
+import importlib, json, sys
+try:
+    importlib.import_module('Config')
+except ImportError:
+    sys.modules['Config'] = importlib.import_module('ConfigTemplate')
+from aws_cdk import core as cdk
+from lti13_cdk.lti13_stack import Lti13Stack
+app = cdk.App(outdir=sys.argv[1] + '/cdk.out', context={'aws:cdk:bundling-stacks': []})
+Lti13Stack(app, 'Lti13Stack')
+print(json.dumps(app.synth().get_stack_by_name('Lti13Stack').template))
+"""
+
+
+def synth(directory, deployments):
+    # The stack's asset paths are relative to the project directory (the jsii kernel's cwd)
+    for name in ('lambdas', 'jwt'):
+        os.symlink(os.path.join(ROOT, name), os.path.join(directory, name))
+
+    with open(os.path.join(directory, 'lti.json'), 'w') as f:
+        json.dump({'deployments': [{
+            'deployment_id': f'deployment-{i}',
+            'client_id': f'client-{i}',
+            'issuer': 'https://platform.example.com',
+            'auth_login_url': 'https://platform.example.com/auth',
+            'auth_token_url': 'https://platform.example.com/token',
+            'key_set_url': 'https://platform.example.com/jwks.json',
+            'default': i == 0
+        } for i in range(deployments)]}, f)
+
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    result = subprocess.run([sys.executable, '-c', SYNTH, directory], cwd=directory, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout)
+
+
+def test_template_size_does_not_depend_on_deployments(tmp_path):
+    (tmp_path / 'one').mkdir()
+    (tmp_path / 'many').mkdir()
+
+    one = synth(str(tmp_path / 'one'), 1)
+    many = synth(str(tmp_path / 'many'), 1000)
+
+    assert len(many['Resources']) == len(one['Resources'])
+
+    seeds = [r for r in many['Resources'].values() if r['Type'] == 'AWS::CloudFormation::CustomResource']
+    assert len(seeds) == 1
+    assert set(seeds[0]['Properties']) >= {'ServiceToken', 'TableName', 'ConfigBucket', 'ConfigKey'}
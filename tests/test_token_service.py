@@ -0,0 +1,95 @@
+# Service access tokens from token_service against a local fake OAuth2 token endpoint: one
+# token request per scope set for a concurrent burst, within a container and across containers
+# sharing the lease in ltiCacheTable, and a new one once the token is within the refresh margin.
+from concurrent.futures import ThreadPoolExecutor
+import json
+
+import jwt
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+import pytest
+
+import aws_clients
+import local_aws
+import token_service
+from bench_token_service import CLIENT_ID, KEY_ARN, SCOPES, TokenEndpoint
+
+THREADS = 8
+
+
+@pytest.fixture(scope='module')
+def tool_key():
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048, backend=default_backend())
+    pem = private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    public_pem = private_key.public_key().public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+    return pem.decode('ascii'), jwt.jwk_from_pem(public_pem)
+
+
+@pytest.fixture
+def endpoint(tool_key, monkeypatch):
+    pem, public_key = tool_key
+    monkeypatch.setattr(token_service, 'signing_keys', {})
+    monkeypatch.setitem(aws_clients.clients, 'secretsmanager', local_aws.FakeSecretsManager({
+        KEY_ARN: json.dumps({'kid': 'tool-key-1', 'private_key': pem})
+    }))
+
+    endpoint = TokenEndpoint(public_key, latency=0.1)
+    yield endpoint
+    endpoint.close()
+
+
+def config(endpoint):
+    return {'iss': 'https://platform.example.com', 'client_id': CLIENT_ID, 'auth_token_url': endpoint.url}
+
+
+def burst(services, endpoint, scopes=SCOPES[0]):
+    calls = [service for service in services for _ in range(THREADS)]
+    with ThreadPoolExecutor(len(calls)) as pool:
+        return set(pool.map(lambda service: service.access_token(config(endpoint), scopes), calls))
+
+
+def test_burst_in_one_container_makes_one_request(dynamodb, endpoint):
+    service = token_service.TokenService('ltiCacheTable', KEY_ARN)
+
+    assert burst([service], endpoint) == {'token-1'}
+    assert endpoint.requests == 1
+
+    # Scopes are a set: the same scopes in another order share the token
+    assert service.access_token(config(endpoint), list(reversed(SCOPES[0]))) == 'token-1'
+    assert endpoint.requests == 1
+
+
+def test_containers_share_one_request(dynamodb, endpoint):
+    first = token_service.TokenService('ltiCacheTable', KEY_ARN)
+    second = token_service.TokenService('ltiCacheTable', KEY_ARN)
+
+    assert burst([first, second], endpoint) == {'token-1'}
+    assert endpoint.requests == 1
+    assert first.requests + second.requests == 1
+
+    # A third container starting later reads the shared token
+    assert token_service.TokenService('ltiCacheTable', KEY_ARN).access_token(config(endpoint), SCOPES[0]) == 'token-1'
+    assert endpoint.requests == 1
+
+
+def test_scope_sets_get_their_own_tokens(dynamodb, endpoint):
+    service = token_service.TokenService('ltiCacheTable', KEY_ARN)
+
+    assert service.access_token(config(endpoint), SCOPES[0]) == 'token-1'
+    assert service.access_token(config(endpoint), SCOPES[1]) == 'token-2'
+    assert service.access_token(config(endpoint), SCOPES[0]) == 'token-1'
+    assert endpoint.requests == 2
+
+
+def test_token_is_refreshed_within_the_margin(dynamodb, endpoint, monkeypatch):
+    service = token_service.TokenService('ltiCacheTable', KEY_ARN)
+
+    assert service.access_token(config(endpoint), SCOPES[0]) == 'token-1'
+    assert service.access_token(config(endpoint), SCOPES[0]) == 'token-1'
+
+    # The endpoint's tokens last an hour; a margin longer than that puts the cached one inside it
+    monkeypatch.setattr(token_service, 'TOKEN_REFRESH_MARGIN', 3601)
+
+    assert service.access_token(config(endpoint), SCOPES[0]) == 'token-2'
+    assert endpoint.requests == 2
@@ -0,0 +1,137 @@
+# id_token verification in lti_util.process_launch with either signature backend. Every token
+# gets the same answer from both, and bad signatures, other algorithms, unknown kids, time claims
+# at their edges and a missing nonce are refused before anything is trusted.
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import time
+
+import pytest
+
+import lti_util
+from fake_platform import CLIENT_ID, FakePlatform
+
+JWKS_URL = 'https://platform.example.com/jwks.json'
+NOW = 1700000000
+NONCE = 'nonce-1'
+
+BACKENDS = [lti_util.CryptographyVerifier, lti_util.JwtVerifier]
+
+
+def b64url(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def segment(value):
+    return b64url(json.dumps(value).encode('utf-8'))
+
+
+def claims(**changes):
+    body = {'iss': 'https://platform.example.com', 'aud': CLIENT_ID, 'sub': 'user-1', 'iat': NOW, 'exp': NOW + 300, 'nonce': NONCE}
+    body.update(changes)
+    return {name: value for name, value in body.items() if value is not None}
+
+
+@pytest.fixture(scope='module')
+def platform():
+    return FakePlatform()
+
+
+@pytest.fixture(scope='module')
+def tokens(platform):
+    other = FakePlatform(kid=platform.kid)
+
+    def sign(body, alg='RS256', kid=platform.kid, key=platform.signing_key):
+        return platform.encoder.encode(body, key, alg=alg, optional_headers={'kid': kid})
+
+    def hs256(body):
+        # Algorithm confusion: an HMAC keyed with the platform's public modulus
+        signing_input = f"{segment({'alg': 'HS256', 'typ': 'JWT', 'kid': platform.kid})}.{segment(body)}"
+        mac = hmac.new(platform.jwks['keys'][0]['n'].encode('ascii'), signing_input.encode('ascii'), hashlib.sha256).digest()
+        return f"{signing_input}.{b64url(mac)}"
+
+    def tampered(body):
+        header, payload, signature = sign(claims()).split('.')
+        return f"{header}.{segment(body)}.{signature}"
+
+    leeway = lti_util.IAT_LEEWAY
+
+    # name -> (id_token, expected status, expected body for a refusal)
+    return {
+        'valid': (sign(claims()), 200, None),
+        'list audience': (sign(claims(aud=[CLIENT_ID, 'other-client'])), 200, None),
+        'signed by another key': (sign(claims(), key=other.signing_key), 401, 'Invalid signature'),
+        'tampered claims': (tampered(claims(sub='admin')), 401, 'Invalid signature'),
+        'truncated signature': (sign(claims())[:-8], 401, 'Invalid signature'),
+        'RS512': (sign(claims(), alg='RS512'), 401, 'Unsupported signing algorithm'),
+        'HS256': (hs256(claims()), 401, 'Unsupported signing algorithm'),
+        'alg none': (f"{segment({'alg': 'none'})}.{segment(claims())}.", 401, 'Malformed id_token'),
+        'unknown kid': (sign(claims(), kid='platform-key-9'), 401, 'Invalid client_id'),
+        'no kid': (sign(claims(), kid=None), 401, 'Invalid client_id'),
+        'other client': (sign(claims(aud='other-client')), 401, 'Invalid client_id'),
+        'expires now': (sign(claims(exp=NOW)), 401, 'JWT Expired'),
+        'expires next second': (sign(claims(exp=NOW + 1)), 200, None),
+        'no exp': (sign(claims(exp=None)), 200, None),
+        'string exp': (sign(claims(exp=str(NOW + 300))), 401, 'Invalid Expired value'),
+        'valid from now': (sign(claims(nbf=NOW)), 200, None),
+        'valid from next second': (sign(claims(nbf=NOW + 1)), 401, 'JWT Not valid yet'),
+        'issued at the leeway': (sign(claims(iat=NOW + leeway)), 200, None),
+        'issued past the leeway': (sign(claims(iat=NOW + leeway + 1)), 401, 'JWT issued in the future'),
+        'no iat': (sign(claims(iat=None)), 401, 'Invalid iat'),
+        'no nonce': (sign(claims(nonce=None)), 401, 'Missing nonce'),
+        'empty nonce': (sign(claims(nonce='')), 401, 'Missing nonce'),
+        'other nonce': (sign(claims(nonce='nonce-2')), 401, 'Invalid nonce'),
+    }
+
+
+def use(backend, platform, monkeypatch):
+    # Parsed keys are backend specific, so each backend starts from an empty key cache. The key
+    # set counts as just fetched, so an unknown kid is refused without fetching it again.
+    monkeypatch.setattr(lti_util, 'verifier', backend())
+    monkeypatch.setattr(lti_util, 'verifying_keys', lti_util.OrderedDict())
+    monkeypatch.setitem(lti_util.jwks_cache, JWKS_URL, {
+        'keys': {key['kid']: key for key in platform.jwks['keys']},
+        'expires': time.monotonic() + 300,
+        'fetched': time.monotonic()
+    })
+
+
+@pytest.fixture(params=BACKENDS, ids=lambda backend: backend.name)
+def backend(request, platform, monkeypatch):
+    use(request.param, platform, monkeypatch)
+    return request.param
+
+
+def launch(id_token):
+    util = lti_util.lti_util(logging.getLogger(), CLIENT_ID, JWKS_URL)
+    return util.process_launch(id_token, nonce=NONCE, now=NOW)
+
+
+def test_tokens_are_checked(backend, tokens):
+    for name, (id_token, status, body) in tokens.items():
+        result = launch(id_token)
+
+        assert result['statusCode'] == status, name
+        if status == 200:
+            assert json.loads(result['body'])['claims']['nonce'] == NONCE
+        else:
+            assert result['body'] == body, name
+
+
+def test_backends_agree(platform, tokens, monkeypatch):
+    results = {}
+
+    for backend in BACKENDS:
+        use(backend, platform, monkeypatch)
+        results[backend.name] = {name: launch(id_token) for name, (id_token, status, body) in tokens.items()}
+
+    assert results['cryptography'] == results['jwt']
+
+
+def test_non_rsa_key_is_refused(backend, platform):
+    lti_util.jwks_cache[JWKS_URL]['keys']['oct-key'] = {'kty': 'oct', 'kid': 'oct-key', 'k': b64url(b'secret')}
+    id_token = platform.encoder.encode(claims(), platform.signing_key, alg='RS256', optional_headers={'kid': 'oct-key'})
+
+    assert launch(id_token)['body'] == 'Invalid client_id'
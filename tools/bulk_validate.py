@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# Offline re-validation of captured launch id_tokens, for troubleshooting platform incidents.
+#
+# Streams a capture (JSONL objects with an id_token field, or one bare token per line), resolves
+# each token's deployment from lti.json or ltiConfigTable, and checks it with the launch
+# function's own lti_util.process_launch. Tokens are grouped by key set, client and kid; each
+# platform key set is fetched once, by this process, and chunks of a group are verified on a
+# process pool with that group's key. Per-token results go out as JSONL as chunks finish
+# (not in input order), with a summary on stderr. Only a bounded number of chunks is buffered
+# or in flight, so memory stays flat however large the capture is.
+#
+# Captured tokens have usually expired; --time iat checks exp, nbf and iat as of each token's
+# own iat (so only signature, audience and claim problems show), or --time <epoch> as of a
+# given moment.
+#
+#   python tools/bulk_validate.py capture.jsonl [--config lti.json | --table ltiConfigTable]
+#                                 [--output results.jsonl] [--workers N] [--chunk 256]
+#                                 [--time now|iat|<epoch>] [--field id_token]
+import argparse
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import json
+import logging
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+for path in ('lambdas/shared', 'lambdas/lti_validation'):
+    sys.path.insert(0, os.path.join(ROOT, path))
+
+import deployment_index
+import lti_claims
+import lti_util
+
+logger = logging.getLogger('bulk_validate')
+
+class Deployments(deployment_index.DeploymentIndex):
+    # The login's deployment index, answering an issuer's Query from the rows read up front
+    # (lti.json or a table scan), so tokens resolve to the deployment a launch would use
+
+    def __init__(self, items):
+        super().__init__(None, None, ttl=float('inf'), min_reload=float('inf'), negative_ttl=float('inf'), report_every=0)
+
+        self.rows = {}
+        for item in items:
+            self.rows.setdefault(item['issuer'], []).append(item)
+
+    def query_issuer(self, issuer):
+        return iter(self.rows.get(issuer, ()))
+
+def load_config(path):
+    with open(path) as f:
+        return json.load(f)['deployments']
+
+def scan_table(table_name):
+    import aws_clients
+    import ddb_codec
+
+    kwargs = {'TableName': table_name}
+
+    while True:
+        results = aws_clients.client('dynamodb').scan(**kwargs)
+
+        for item in results.get('Items', []):
+            yield ddb_codec.deserialize(item)
+
+        if 'LastEvaluatedKey' not in results:
+            return
+
+        kwargs['ExclusiveStartKey'] = results['LastEvaluatedKey']
+
+def read_tokens(stream, field):
+    # (line number, token or None) for every non-blank line
+    for number, line in enumerate(stream, 1):
+        line = line.strip()
+
+        if not line:
+            continue
+
+        if line[0] in '{"':
+            try:
+                value = json.loads(line)
+            except ValueError:
+                value = None
+
+            token = value.get(field) if isinstance(value, dict) else value
+            yield number, token if isinstance(token, str) else None
+        else:
+            yield number, line
+
+def check_time(claims, time_mode):
+    if time_mode == 'now':
+        return None
+
+    if time_mode == 'iat':
+        return claims['iat'] if isinstance(claims.get('iat'), int) else None
+
+    return float(time_mode)
+
+def time_option(value):
+    if value not in ('now', 'iat'):
+        float(value)
+    return value
+
+def init_worker(log_level):
+    logger.setLevel(log_level)
+
+def validate_chunk(group, keys, tokens, time_mode):
+    # Runs in a pool process: the group's key is handed over with the chunk, so process_launch
+    # finds it cached and never fetches the key set itself
+    key_set_url, client_id, kid = group
+
+    lti_util.jwks_cache[key_set_url] = {
+        'keys': keys,
+        'expires': float('inf'),
+        'fetched': time.monotonic()
+    }
+
+    lti = lti_util.lti_util(logger, client_id, key_set_url)
+    results = []
+
+    for number, token, issuer, deployment_id in tokens:
+        parsed = lti_util.parse_jwt(token)
+        response = lti.process_launch(token, parsed, now=check_time(parsed[1], time_mode))
+        error = None if response['statusCode'] == 200 else response['body']
+        results.append((number, issuer, deployment_id, response['statusCode'], error))
+
+    return group, results
+
+class BulkValidator:
+
+    def __init__(self, deployments, output, workers, chunk, time_mode):
+        self.deployments = deployments
+        self.output = output
+        self.workers = workers
+        self.chunk = chunk
+        self.time_mode = time_mode
+
+        self.key_sets = {}
+        self.groups = {}
+        self.pending = set()
+
+        self.errors = Counter()
+        self.by_kid = Counter()
+        self.total = 0
+        self.valid = 0
+        self.jwks_fetches = 0
+
+    def key_set(self, key_set_url):
+        # Every key set is fetched once per run; a failed fetch fails its tokens
+        if key_set_url not in self.key_sets:
+            self.jwks_fetches += 1
+            try:
+                self.key_sets[key_set_url] = lti_util.lti_util(logger, None, key_set_url).fetch_jwks()['keys']
+            except Exception as e:
+                logger.error("BulkValidate->key_set: Error fetching %s - %s", key_set_url, e)
+                self.key_sets[key_set_url] = None
+
+        return self.key_sets[key_set_url]
+
+    def emit(self, number, issuer, deployment_id, kid, status, error):
+        self.total += 1
+        self.valid += status == 200
+        self.errors[error or 'valid'] += 1
+        self.by_kid[(issuer, kid, status == 200)] += 1
+
+        self.output.write(json.dumps({
+            'line': number,
+            'valid': status == 200,
+            'status': status,
+            'error': error,
+            'iss': issuer,
+            'deployment_id': deployment_id,
+            'kid': kid
+        }, separators=(',', ':')) + '\n')
+
+    def collect(self, block):
+        done, self.pending = wait(self.pending, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+
+        for future in done:
+            (key_set_url, client_id, kid), results = future.result()
+            for number, issuer, deployment_id, status, error in results:
+                self.emit(number, issuer, deployment_id, kid, status, error)
+
+    def submit(self, pool, group):
+        key_set_url, client_id, kid = group
+        tokens = self.groups.pop(group)
+        keys = self.key_sets[key_set_url]
+
+        # Keep at most two chunks per worker in flight
+        while len(self.pending) >= 2 * self.workers:
+            self.collect(True)
+
+        self.pending.add(pool.submit(validate_chunk, group, {kid: keys[kid]} if kid in keys else {}, tokens, self.time_mode))
+
+        # Write out whatever has finished meanwhile
+        self.collect(False)
+
+    def add(self, pool, number, token):
+        parsed = lti_util.parse_jwt(token) if token else None
+
+        if parsed is None:
+            self.emit(number, None, None, None, 401, 'Malformed id_token')
+            return
+
+        header, claims = parsed[0], parsed[1]
+        issuer = claims.get('iss')
+        kid = header.get('kid')
+
+        deployment_id = claims.get(lti_claims.DEPLOYMENT_ID_CLAIM)
+        deployment = self.deployments.find(issuer, lti_claims.audience(claims), deployment_id)
+
+        if deployment is None:
+            self.emit(number, issuer, deployment_id, kid, 401, 'Unknown deployment')
+            return
+
+        if self.key_set(deployment['key_set_url']) is None:
+            self.emit(number, issuer, deployment['deployment_id'], kid, 503, 'Key set unavailable')
+            return
+
+        group = (deployment['key_set_url'], deployment['client_id'], kid)
+        tokens = self.groups.setdefault(group, [])
+        tokens.append((number, token, issuer, deployment['deployment_id']))
+
+        if len(tokens) >= self.chunk:
+            self.submit(pool, group)
+
+    def run(self, stream, field, log_level):
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker, initargs=(log_level,)) as pool:
+            for number, token in read_tokens(stream, field):
+                self.add(pool, number, token)
+
+            for group in list(self.groups):
+                self.submit(pool, group)
+
+            while self.pending:
+                self.collect(True)
+
+    def summary(self, elapsed):
+        lines = [
+            f"{self.total} tokens, {self.valid} valid, {self.total - self.valid} invalid in {elapsed:.1f} s "
+            f"({self.total / max(elapsed, 1e-9):.0f} tokens/s, {self.workers} workers, {self.jwks_fetches} key set fetches)",
+            '',
+            'results'
+        ]
+        lines += [f"  {count:>9}  {error}" for error, count in self.errors.most_common()]
+        lines += ['', 'by issuer and kid (valid / invalid)']
+
+        for issuer, kid in sorted({(i, k) for i, k, _ in self.by_kid}, key=str):
+            lines.append(f"  {self.by_kid[(issuer, kid, True)]:>9} / {self.by_kid[(issuer, kid, False)]:<9} {issuer} {kid}")
+
+        return '\n'.join(lines) + '\n'
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-validate captured LTI launch id_tokens')
+    parser.add_argument('capture', help="JSONL capture, or - for stdin")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--config', default=os.path.join(ROOT, 'lti.json'), help='deployments file in the lti.json format')
+    source.add_argument('--table', help='read the deployments from this ltiConfigTable instead')
+    parser.add_argument('--output', default='-', help='per-token results (JSONL), default stdout')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk', type=int, default=256, help='tokens per task')
+    parser.add_argument('--time', type=time_option, default='now', help='check exp/nbf/iat as of now, each token\'s iat, or an epoch time')
+    parser.add_argument('--field', default='id_token', help='token field of JSON lines')
+    parser.add_argument('--log-level', default='ERROR')
+    options = parser.parse_args()
+
+    logging.basicConfig(stream=sys.stderr, format='%(levelname)s %(message)s')
+    logger.setLevel(options.log_level)
+
+    items = scan_table(options.table) if options.table else load_config(options.config)
+    deployments = Deployments(items)
+
+    stream = sys.stdin if options.capture == '-' else open(options.capture)
+    output = sys.stdout if options.output == '-' else open(options.output, 'w')
+
+    validator = BulkValidator(deployments, output, options.workers, options.chunk, options.time)
+    start = time.perf_counter()
+
+    try:
+        validator.run(stream, options.field, options.log_level)
+    finally:
+        output.flush()
+        sys.stderr.write(validator.summary(time.perf_counter() - start))
+
+if __name__ == '__main__':
+    main()